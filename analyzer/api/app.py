@@ -1,11 +1,40 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+
 import typer
 import uvicorn
 from fastapi import FastAPI
 
+from analyzer.db.catalog import listen
+from analyzer.db.core import (
+    ANALYZER_CATALOG,
+    ANALYZER_CATALOG_SNAPSHOT,
+    ANALYZER_LOOP_INTERVAL_MS,
+    ANALYZER_LOOP_STALL_MS,
+    ANALYZER_RENDER_EXECUTOR,
+    ANALYZER_SLOW_QUERY_MS,
+    ANALYZER_TRACING_ENDPOINT,
+    ANALYZER_TRACING_EXPORTER,
+    SessionLocal,
+)
+from analyzer.db.purger import Purger
+from analyzer.db.slowlog import SlowQueryLog
+from analyzer.db.snapshot import open_catalog
+from analyzer.utils.loop import LoopMonitor
+from analyzer.utils.tracing import make_exporter, start_tracing, stop_tracing
+
 from .handlers import router
-from .middleware import add_exception_handling
+from .middleware import (
+    add_compression,
+    add_exception_handling,
+    add_profiling,
+    add_timing,
+)
+from .render import Renderer
+
+log = logging.getLogger(__name__)
 
 app = FastAPI(
     description="Вступительное задание в Летнюю Школу Бэкенд Разработки Яндекса 2022",
@@ -13,9 +42,105 @@ app = FastAPI(
     version="1.0",
 )
 add_exception_handling(app)
+compression_executor = add_compression(app)
+add_timing(app)
+add_profiling(app)
 app.include_router(router)
 
 
+def log_failure(task: asyncio.Task) -> None:
+    # Фоновые задачи не должны завершаться сами: иначе их смерть заметна только по устаревшим данным
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Background task %s failed", task.get_name(), exc_info=task.exception())
+
+
+@app.on_event("startup")
+async def start_purger() -> None:
+    app.state.purger = None
+    purger = Purger()
+    if purger.enabled:
+        app.state.purger = asyncio.create_task(purger.run(), name="purger")
+        app.state.purger.add_done_callback(log_failure)
+
+
+@app.on_event("startup")
+async def load_catalog() -> None:
+    app.state.catalog = app.state.listener = None
+    if ANALYZER_CATALOG:
+        async with SessionLocal() as session:
+            app.state.catalog = await open_catalog(session, ANALYZER_CATALOG_SNAPSHOT)
+        # Записи, сделанные другими экземплярами, приходят через LISTEN/NOTIFY
+        app.state.listener = asyncio.create_task(listen(app.state.catalog).run(), name="catalog-listener")
+        app.state.listener.add_done_callback(log_failure)
+
+
+@app.on_event("startup")
+async def start_renderer() -> None:
+    app.state.renderer = Renderer() if ANALYZER_RENDER_EXECUTOR else None
+
+
+@app.on_event("startup")
+async def start_slow_query_log() -> None:
+    app.state.slow_query_log = SlowQueryLog() if ANALYZER_SLOW_QUERY_MS is not None else None
+    if app.state.slow_query_log is not None:
+        app.state.slow_query_log.install()
+
+
+@app.on_event("startup")
+async def start_exporter() -> None:
+    exporter = make_exporter(ANALYZER_TRACING_EXPORTER, ANALYZER_TRACING_ENDPOINT)
+    if exporter is not None:
+        start_tracing(exporter)
+
+
+@app.on_event("startup")
+async def start_loop_monitor() -> None:
+    app.state.loop_monitor = None
+    if ANALYZER_LOOP_STALL_MS > 0:
+        app.state.loop_monitor = LoopMonitor(ANALYZER_LOOP_INTERVAL_MS / 1000, ANALYZER_LOOP_STALL_MS / 1000)
+        app.state.loop_monitor.start()
+
+
+@app.on_event("shutdown")
+async def stop_purger() -> None:
+    if app.state.purger is not None:
+        app.state.purger.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_listener() -> None:
+    if app.state.listener is not None:
+        app.state.listener.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_compression() -> None:
+    compression_executor.shutdown()
+
+
+@app.on_event("shutdown")
+async def stop_renderer() -> None:
+    if app.state.renderer is not None:
+        app.state.renderer.close()
+
+
+@app.on_event("shutdown")
+async def stop_slow_query_log() -> None:
+    if app.state.slow_query_log is not None:
+        app.state.slow_query_log.close()
+
+
+@app.on_event("shutdown")
+async def stop_exporter() -> None:
+    stop_tracing()
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor() -> None:
+    if app.state.loop_monitor is not None:
+        await app.state.loop_monitor.stop()
+
+
 def main(host: str = "127.0.0.1", port: int = 80, debug: bool = False) -> None:
     uvicorn.run("analyzer.api.app:app", host=host, port=port, reload=debug)
 
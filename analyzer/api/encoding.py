@@ -0,0 +1,93 @@
+"""
+Согласование кодирования ответов по заголовку Accept.
+
+По умолчанию ответы кодируются в JSON. Клиенты, перечислившие в Accept application/msgpack, получают MessagePack:
+идентификаторы передаются как 16 байт, а даты — как целое число миллисекунд от начала эпохи Unix. Все такие ответы
+несут Vary: Accept, чтобы общие кеши и прокси не отдали MessagePack клиенту JSON и наоборот.
+"""
+from __future__ import annotations
+
+import json
+from enum import Enum
+from typing import Any, Dict, Optional
+
+import msgpack
+from fastapi import Header
+from fastapi.responses import JSONResponse, Response
+
+from analyzer.utils.timing import phase
+
+from .schema import BINARY_FIELD_ENCODERS, FIELD_ENCODERS
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+JSON_MEDIA_TYPE = "application/json"
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+# Заголовки ответов, содержимое которых выбирается по Accept
+VARY_HEADERS = {"Vary": "Accept"}
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPES[0]
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content)
+
+
+class Encoding(Enum):
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+    @property
+    def binary(self) -> bool:
+        return self == Encoding.MSGPACK
+
+    @property
+    def field_encoders(self) -> Dict:
+        return BINARY_FIELD_ENCODERS if self.binary else FIELD_ENCODERS
+
+    @property
+    def media_type(self) -> str:
+        return MsgPackResponse.media_type if self.binary else JSONResponse.media_type
+
+    def response(self, content: Any) -> Response:
+        with phase("serialization"):
+            response_class = MsgPackResponse if self.binary else JSONResponse
+            return response_class(content, headers=VARY_HEADERS)
+
+    def encode(self, content: Any) -> bytes:
+        # Те же байты, что отдали бы MsgPackResponse и JSONResponse
+        if self.binary:
+            return msgpack.packb(content)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def parse_accept(accept: str) -> Dict[str, float]:
+    qualities = {}
+    for media_range in accept.split(","):
+        media_type, *params = (part.strip() for part in media_range.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            qualities[media_type.lower()] = quality
+    return qualities
+
+
+def get_encoding(response: Response, accept: Optional[str] = Header(None)) -> Encoding:
+    # Ответы, которые FastAPI собирает из response_model, получают заголовки из response. Ответы, которые обработчик
+    # возвращает сам, должны передать VARY_HEADERS явно (см. Encoding.response)
+    response.headers.update(VARY_HEADERS)
+
+    # MessagePack выбирается, только если клиент явно предпочитает его JSON; */* означает JSON
+    if not accept:
+        return Encoding.JSON
+    qualities = parse_accept(accept)
+    msgpack_quality = max(qualities.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    if msgpack_quality > 0 and msgpack_quality >= qualities.get(JSON_MEDIA_TYPE, 0.0):
+        return Encoding.MSGPACK
+    return Encoding.JSON
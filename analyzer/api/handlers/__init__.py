@@ -3,7 +3,9 @@ from importlib import import_module
 
 from fastapi import APIRouter
 
-router = APIRouter()
+from analyzer.api.middleware import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
 
 
 # Функция, устраняющая необходимость в ручном импорте функций всех эндпоинтов
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterator, List, Optional, Union
+
+from fastapi import Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from analyzer.api.encoding import EVENT_STREAM_MEDIA_TYPE, VARY_HEADERS
+from analyzer.api.schema import Error, ShopUnitChange, ShopUnitChangesResponse
+from analyzer.db.core import ANALYZER_CHANGES_POLL_INTERVAL, ANALYZER_CHANGES_TIMEOUT
+from analyzer.db.dal import get_dal
+from analyzer.utils.database import get_session
+
+from . import router
+
+CHANGES_BATCH_SIZE = 1000
+# Верхняя граница timeout: дольше запрос не держит соединение с клиентом и сессию базы данных
+MAX_TIMEOUT = 300.0
+
+
+async def read_changes(session: Session, cursor: int) -> List[ShopUnitChange]:
+    async with get_dal(session) as dal:
+        rows = await dal.get_changes(cursor, CHANGES_BATCH_SIZE)
+
+    # Изменение несет текущее состояние юнита, поэтому из нескольких изменений одного юнита в порции достаточно
+    # последнего. Оно же несет наибольшую позицию, так что курсор продвигается на всю порцию
+    latest = {row.id: row for row in rows}
+    return [ShopUnitChange.from_model(row) for row in sorted(latest.values(), key=lambda row: row.cursor)]
+
+
+async def stream_changes(request: Request, session: Session, cursor: int, timeout: float) -> AsyncIterator[str]:
+    # Поток закрывается по истечении timeout, а клиент переподключается с заголовком Last-Event-ID
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    yield f"retry: {int(ANALYZER_CHANGES_POLL_INTERVAL * 1000)}\n\n"
+    while True:
+        changes = await read_changes(session, cursor)
+        for change in changes:
+            yield f"id: {change.cursor}\nevent: change\ndata: {change.json()}\n\n"
+            cursor = change.cursor
+
+        if loop.time() >= deadline or await request.is_disconnected():
+            return
+        if len(changes) < CHANGES_BATCH_SIZE:
+            await asyncio.sleep(min(ANALYZER_CHANGES_POLL_INTERVAL, max(deadline - loop.time(), 0)))
+
+
+@router.get(
+    "/changes", response_model=ShopUnitChangesResponse, responses={"400": {"model": Error}, "410": {"model": Error}}
+)
+async def get_changes(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = Query(None, ge=0),
+    timeout: float = Query(min(ANALYZER_CHANGES_TIMEOUT, MAX_TIMEOUT), ge=0, le=MAX_TIMEOUT),
+    last_event_id: Optional[int] = Header(None, ge=0),
+    session: Session = Depends(get_session),
+) -> Union[ShopUnitChangesResponse, StreamingResponse, Error]:
+    """
+    Лента изменений после позиции cursor (или Last-Event-ID). Без позиции лента начинается с текущего момента.
+    С заголовком Accept: text/event-stream отдается как поток Server-Sent Events, иначе — как long-poll: ответ
+    возвращается, как только появились изменения, но не позже чем через timeout секунд. Если изменения после позиции
+    уже вычищены из журнала, возвращается 410.
+    """
+    if cursor is None:
+        cursor = last_event_id
+    async with get_dal(session) as dal:
+        if cursor is None:
+            cursor = await dal.get_changes_watermark()
+        else:
+            await dal.check_changes_cursor(cursor)
+
+    # Поток или long-poll выбирается по Accept
+    response.headers.update(VARY_HEADERS)
+    if EVENT_STREAM_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(
+            stream_changes(request, session, cursor, timeout), media_type=EVENT_STREAM_MEDIA_TYPE, headers=VARY_HEADERS
+        )
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        changes = await read_changes(session, cursor)
+        if changes or loop.time() >= deadline or await request.is_disconnected():
+            break
+        await asyncio.sleep(min(ANALYZER_CHANGES_POLL_INTERVAL, max(deadline - loop.time(), 0)))
+
+    return ShopUnitChangesResponse(cursor=changes[-1].cursor if changes else cursor, items=changes)
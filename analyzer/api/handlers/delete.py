@@ -1,20 +1,40 @@
 from __future__ import annotations
 
-from typing import Union
+from datetime import datetime
+from typing import Optional, Union
 from uuid import UUID
 
-from fastapi import Depends
+from fastapi import Depends, Query
 from sqlalchemy.orm import Session
 
-from analyzer.api.schema import Error
+from analyzer.api.schema import DELETE_DATE_DESCRIPTION, Error, ShopUnitDeleteRequest
+from analyzer.db.catalog import Catalog, refresh_catalog
 from analyzer.db.dal import apply_updates, get_dal
-from analyzer.utils.database import get_session
+from analyzer.utils.database import get_catalog, get_session
 
 from . import router
 
 
 @router.delete("/delete/{id}", response_model=None, responses={"400": {"model": Error}, "404": {"model": Error}})
-async def delete_unit(id: UUID, session: Session = Depends(get_session)) -> Union[None, Error]:
+async def delete_unit(
+    id: UUID,
+    date: Optional[datetime] = Query(None, description=DELETE_DATE_DESCRIPTION),
+    session: Session = Depends(get_session),
+    catalog: Optional[Catalog] = Depends(get_catalog),
+) -> Union[None, Error]:
     async with get_dal(session) as dal:
-        unit_updates, hierarchy_updates = await dal.delete_unit(str(id))
+        unit_updates, hierarchy_updates = await dal.delete_unit(id, date)
     await apply_updates(session, unit_updates, hierarchy_updates)
+    await refresh_catalog(session, catalog, unit_updates)
+
+
+@router.post("/delete", response_model=None, responses={"400": {"model": Error}, "404": {"model": Error}})
+async def delete_units(
+    body: ShopUnitDeleteRequest,
+    session: Session = Depends(get_session),
+    catalog: Optional[Catalog] = Depends(get_catalog),
+) -> Union[None, Error]:
+    async with get_dal(session) as dal:
+        unit_updates, hierarchy_updates = await dal.delete_units(body.ids, body.updateDate)
+    await apply_updates(session, unit_updates, hierarchy_updates)
+    await refresh_catalog(session, catalog, unit_updates)
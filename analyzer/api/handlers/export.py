@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from typing import AsyncIterator, Callable
+
+from fastapi import Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from analyzer.db.dal import DAL, get_dal
+from analyzer.db.export import NDJSON_MEDIA_TYPE, dumps, history_record, unit_record
+from analyzer.utils.database import get_session
+
+from . import router
+
+
+async def generate_records(session: Session, stream: Callable[[DAL], AsyncIterator], make_record) -> AsyncIterator[str]:
+    async with get_dal(session) as dal:
+        async for rows in stream(dal):
+            yield "".join(dumps(make_record(row)) for row in rows)
+
+
+@router.get("/export/units", response_class=StreamingResponse)
+async def export_units(session: Session = Depends(get_session)) -> StreamingResponse:
+    return StreamingResponse(generate_records(session, DAL.stream_units, unit_record), media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.get("/export/history", response_class=StreamingResponse)
+async def export_history(session: Session = Depends(get_session)) -> StreamingResponse:
+    return StreamingResponse(
+        generate_records(session, DAL.stream_price_updates, history_record), media_type=NDJSON_MEDIA_TYPE
+    )
@@ -1,26 +1,40 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Union
+from typing import List, Optional, Union
 
 from fastapi import Depends
+from prometheus_client import Counter, Histogram
 from sqlalchemy.orm import Session
 
 from analyzer.api.schema import Error, ShopUnitImport, ShopUnitImportRequest
+from analyzer.db.catalog import Catalog, refresh_catalog
 from analyzer.db.dal import apply_updates, get_dal
-from analyzer.utils.database import get_session
+from analyzer.utils.database import get_catalog, get_session
+from analyzer.utils.metrics import COUNT_BUCKETS
 from analyzer.utils.misc import nameddict
+from analyzer.utils.tracing import set_attribute
 
 from . import router
 
+IMPORTED_UNITS = Counter("analyzer_imported_units", "Юниты, полученные в /imports")
+IMPORT_SIZE = Histogram("analyzer_import_units", "Число юнитов в одном запросе /imports", buckets=COUNT_BUCKETS)
+
 
 def make_units_table_rows(units: List[ShopUnitImport], last_update: datetime):
     return [nameddict(unit.to_database_row(last_update)) for unit in units]
 
 
 @router.post("/imports", response_model=None, status_code=200, responses={"400": {"model": Error}})
-async def import_units(body: ShopUnitImportRequest, session: Session = Depends(get_session)) -> Union[None, Error]:
+async def import_units(
+    body: ShopUnitImportRequest,
+    session: Session = Depends(get_session),
+    catalog: Optional[Catalog] = Depends(get_catalog),
+) -> Union[None, Error]:
     last_update = body.updateDate
+    IMPORTED_UNITS.inc(len(body.items))
+    IMPORT_SIZE.observe(len(body.items))
+    set_attribute("items", len(body.items))
 
     async with get_dal(session) as dal:
         unit_updates, hierarchy_updates = await dal.add_units(
@@ -29,3 +43,4 @@ async def import_units(body: ShopUnitImportRequest, session: Session = Depends(g
 
     # Апдейты должны выполняться после строго после создания всех юнитов
     await apply_updates(session, unit_updates, hierarchy_updates, last_update)
+    await refresh_catalog(session, catalog, unit_updates)
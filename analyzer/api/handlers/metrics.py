@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from . import router
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """
+    Метрики процесса в текстовом формате Prometheus.
+    """
+    # media_type с text/ Starlette дополнил бы вторым charset
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
@@ -1,23 +1,133 @@
 from __future__ import annotations
 
-from typing import Union
+from datetime import datetime
+from typing import Dict, List, Optional, Union
 from uuid import UUID
 
-from fastapi import Depends
+from fastapi import Depends, Query
+from fastapi.responses import Response
 
-from analyzer.api.schema import Error, ShopUnit
-from analyzer.db.dal import get_dal
-from analyzer.utils.database import get_session
+from analyzer.api.encoding import VARY_HEADERS, Encoding, get_encoding
+from analyzer.api.render import Renderer
+from analyzer.api.schema import (
+    FIELDS_DESCRIPTION,
+    Error,
+    NodesFormat,
+    ShopUnit,
+    ShopUnitDelta,
+    ShopUnitField,
+    ShopUnitStatisticUnit,
+    dump_tree,
+    dump_unit,
+    field_columns,
+    select_fields,
+)
+from analyzer.db.catalog import Catalog
+from analyzer.db.dal import TREE_COLUMNS, get_dal
+from analyzer.utils.database import get_catalog, get_renderer, get_session
 
 from . import router
 
 
 @router.get(
     "/nodes/{id}",
-    response_model=ShopUnit,
-    responses={"400": {"model": Error}, "404": {"model": Error}},
+    response_model=Union[ShopUnit, ShopUnitDelta, List[ShopUnitStatisticUnit]],
+    responses={"400": {"model": Error}, "404": {"model": Error}, "410": {"model": Error}},
 )
-async def get_node(id: UUID, session=Depends(get_session)) -> Union[ShopUnit, Error]:
-    async with get_dal(session) as dal:
-        unit = await dal.get_node(str(id))
+async def get_node(
+    id: UUID,
+    since: Optional[datetime] = None,
+    format: NodesFormat = NodesFormat.TREE,
+    fields: Optional[List[ShopUnitField]] = Query(None, description=FIELDS_DESCRIPTION),
+    session=Depends(get_session),
+    catalog: Optional[Catalog] = Depends(get_catalog),
+    encoding: Encoding = Depends(get_encoding),
+    renderer: Optional[Renderer] = Depends(get_renderer),
+) -> Union[ShopUnit, ShopUnitDelta, List[ShopUnitStatisticUnit], Response, Error]:
+    # С since отдаются только изменения поддерева: изменившиеся юниты и надгробия удаленных и перенесенных за его
+    # пределы. И юниты, и надгробия сравниваются с since по датам клиента: updateDate импорта или дате удаления.
+    # Если надгробия после since уже вычищены, отдается 410
+    if since is not None:
+        async with get_dal(session) as dal:
+            unit, deleted = await dal.get_node_delta(id, since)
+        return ShopUnitDelta(unit=ShopUnit.from_model(unit) if unit else None, deleted=deleted)
+
+    # С настроенным пулом поддерево читается плоским списком, а собирается и кодируется в пуле (см. analyzer.api.render)
+    if renderer is not None:
+        fields = select_fields(fields or ShopUnitField)
+        tree = format == NodesFormat.TREE
+        columns = TREE_COLUMNS.union(field_columns(fields)) if tree else field_columns(fields)
+        if catalog is not None:
+            content = await renderer.render_subtree(catalog, id, columns, fields, encoding, tree)
+        else:
+            async with get_dal(session) as dal:
+                units = await dal.get_subtree(id, columns)
+            content = await renderer.render(units, columns, fields, encoding, tree)
+        return Response(content, media_type=encoding.media_type, headers=VARY_HEADERS)
+
+    # С fields из базы читаются только нужные колонки, а в ответ попадают только нужные ключи. Бинарные ответы
+    # тоже собираются из словарей, минуя pydantic-модели
+    columns = None
+    if fields or encoding.binary:
+        fields = select_fields(fields or ShopUnitField)
+        columns = field_columns(fields)
+
+    # Плоский список юнитов поддерева в порядке обхода в ширину: родитель всегда идет раньше своих детей. Он всегда
+    # собирается из словарей: на больших поддеревьях pydantic-модели и проверка по response_model обходятся дороже
+    # самого чтения
+    if format == NodesFormat.FLAT:
+        fields = select_fields(fields or ShopUnitField)
+        if catalog is not None:
+            units = catalog.get_subtree(id)
+        else:
+            async with get_dal(session) as dal:
+                units = await dal.get_subtree(id, columns)
+        return encoding.response([dump_unit(unit, fields, encoding.field_encoders) for unit in units])
+
+    if catalog is not None:
+        unit = catalog.get_node(id)
+    else:
+        async with get_dal(session) as dal:
+            unit = await dal.get_node(id, columns)
+    if fields:
+        return encoding.response(dump_tree(unit, fields, encoding.field_encoders))
     return ShopUnit.from_model(unit)
+
+
+@router.get(
+    "/nodes",
+    response_model=Dict[UUID, Union[ShopUnit, Error]],
+    responses={"400": {"model": Error}},
+)
+async def get_nodes(
+    ids: List[UUID] = Query(...),
+    fields: Optional[List[ShopUnitField]] = Query(None, description=FIELDS_DESCRIPTION),
+    session=Depends(get_session),
+    catalog: Optional[Catalog] = Depends(get_catalog),
+    encoding: Encoding = Depends(get_encoding),
+) -> Union[Dict[UUID, Union[ShopUnit, Error]], Response]:
+    columns = None
+    if fields or encoding.binary:
+        fields = select_fields(fields or ShopUnitField)
+        columns = field_columns(fields)
+
+    if catalog is not None:
+        units = catalog.get_nodes(ids)
+    else:
+        async with get_dal(session) as dal:
+            units = await dal.get_nodes(ids, columns)
+
+    # Отсутствующие юниты не делают ошибочным весь ответ — для них возвращается маркер 404
+    if fields:
+        not_found = Error(code=404, message="Item not found").dict()
+        return encoding.response(
+            {
+                id.bytes
+                if encoding.binary
+                else str(id): (dump_tree(units[id], fields, encoding.field_encoders) if id in units else not_found)
+                for id in ids
+            }
+        )
+    return {
+        id: ShopUnit.from_model(units[id]) if id in units else Error(code=404, message="Item not found") for id in ids
+    }
@@ -1,12 +1,23 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Union
+from typing import List, Optional, Union
 
-from fastapi import Depends
+from fastapi import Depends, Query
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 
-from analyzer.api.schema import Error, ShopUnitStatisticResponse, ShopUnitStatisticUnit
+from analyzer.api.encoding import Encoding, get_encoding
+from analyzer.api.schema import (
+    FIELDS_DESCRIPTION,
+    Error,
+    ShopUnitField,
+    ShopUnitStatisticResponse,
+    ShopUnitStatisticUnit,
+    dump_unit,
+    field_columns,
+    select_fields,
+)
 from analyzer.db.dal import get_dal
 from analyzer.utils.database import get_session
 
@@ -14,7 +25,18 @@ from . import router
 
 
 @router.get("/sales", response_model=ShopUnitStatisticResponse, responses={"400": {"model": Error}})
-async def get_sales(date: datetime, session: Session = Depends(get_session)) -> Union[ShopUnitStatisticResponse, Error]:
+async def get_sales(
+    date: datetime,
+    fields: Optional[List[ShopUnitField]] = Query(None, description=FIELDS_DESCRIPTION),
+    session: Session = Depends(get_session),
+    encoding: Encoding = Depends(get_encoding),
+) -> Union[ShopUnitStatisticResponse, Response, Error]:
+    if fields or encoding.binary:
+        fields = select_fields(fields or ShopUnitField)
+        async with get_dal(session) as dal:
+            units = await dal.get_sales(date, field_columns(fields))
+        return encoding.response({"items": [dump_unit(unit, fields, encoding.field_encoders) for unit in units]})
+
     async with get_dal(session) as dal:
         units = await dal.get_sales(date)
     return ShopUnitStatisticResponse(items=[ShopUnitStatisticUnit.from_model(unit) for unit in units])
@@ -1,17 +1,24 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Optional, Union
+from typing import List, Optional, Union
 from uuid import UUID
 
 from fastapi import Depends, Query
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 
+from analyzer.api.encoding import Encoding, get_encoding
 from analyzer.api.schema import (
+    FIELDS_DESCRIPTION,
     Error,
+    ShopUnitField,
     ShopUnitStatisticRequest,
     ShopUnitStatisticResponse,
     ShopUnitStatisticUnit,
+    dump_unit,
+    field_columns,
+    select_fields,
 )
 from analyzer.db.dal import get_dal
 from analyzer.utils.database import get_session
@@ -28,9 +35,19 @@ async def get_node_statistic(
     id: UUID,
     date_start: Optional[datetime] = Query(default=datetime.min.replace(tzinfo=timezone.utc), alias="dateStart"),
     date_end: Optional[datetime] = Query(default=datetime.max.replace(tzinfo=timezone.utc), alias="dateEnd"),
+    fields: Optional[List[ShopUnitField]] = Query(None, description=FIELDS_DESCRIPTION),
     session: Session = Depends(get_session),
-) -> Union[ShopUnitStatisticResponse, Error]:
+    encoding: Encoding = Depends(get_encoding),
+) -> Union[ShopUnitStatisticResponse, Response, Error]:
     ShopUnitStatisticRequest(id=id, date_start=date_start, date_end=date_end)  # Валидация дат
+    if fields or encoding.binary:
+        fields = select_fields(fields or ShopUnitField)
+        async with get_dal(session) as dal:
+            statistic_units = await dal.get_node_statistic(id, date_start, date_end, field_columns(fields))
+        return encoding.response(
+            {"items": [dump_unit(unit, fields, encoding.field_encoders) for unit in statistic_units]}
+        )
+
     async with get_dal(session) as dal:
-        statistic_units = await dal.get_node_statistic(str(id), date_start, date_end)
+        statistic_units = await dal.get_node_statistic(id, date_start, date_end)
     return ShopUnitStatisticResponse(items=[ShopUnitStatisticUnit.from_model(unit) for unit in statistic_units])
@@ -1,16 +1,55 @@
-from typing import Union
+import asyncio
+import gzip
+import hmac
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from cProfile import Profile
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable, Optional, Union
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from prometheus_client import Histogram
 from pydantic import ValidationError
 from sqlalchemy.orm.exc import NoResultFound
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from analyzer.db.dal import ForbiddenOperation
+from analyzer.db.core import (
+    ANALYZER_COMPRESSION_LARGE_SIZE,
+    ANALYZER_COMPRESSION_LEVEL,
+    ANALYZER_COMPRESSION_MIN_SIZE,
+    ANALYZER_COMPRESSION_THREADS,
+    ANALYZER_PROFILE_DIR,
+    ANALYZER_PROFILE_TOKEN,
+)
+from analyzer.db.dal import ChangesExpired, ForbiddenOperation
+from analyzer.utils.instrumentation import instrument_engines
+from analyzer.utils.metrics import COUNT_BUCKETS
+from analyzer.utils.timing import collect_timings, get_timings, phase, set_phase
+from analyzer.utils.tracing import span
 
+from .encoding import EVENT_STREAM_MEDIA_TYPE, parse_accept
 from .schema import Error
 
+log = logging.getLogger(__name__)
+
+REQUEST_DURATION = Histogram(
+    "analyzer_http_request_duration_seconds", "Время обработки HTTP-запросов", ["method", "route", "status"]
+)
+REQUEST_STATEMENTS = Histogram(
+    "analyzer_http_request_db_statements",
+    "Число запросов к базе данных на HTTP-запрос",
+    ["method", "route"],
+    buckets=COUNT_BUCKETS,
+)
+
 
 def add_exception_handling(app: FastAPI) -> None:
     @app.exception_handler(ValidationError)
@@ -24,3 +63,235 @@ def add_exception_handling(app: FastAPI) -> None:
     @app.exception_handler(NoResultFound)
     async def not_found_exception_handler(_: Request, _1: NoResultFound):
         return JSONResponse(status_code=404, content=jsonable_encoder(Error(code=404, message="Item not found")))
+
+    @app.exception_handler(ChangesExpired)
+    async def changes_expired_exception_handler(_: Request, _1: ChangesExpired):
+        return JSONResponse(status_code=410, content=jsonable_encoder(Error(code=410, message="Changes expired")))
+
+
+class CompressionMiddleware:
+    """
+    Сжимает gzip ответы не меньше min_size байт. Сжатие выполняется в отдельном пуле из threads потоков: zlib
+    отпускает GIL, поэтому большие ответы не блокируют цикл событий, а число потоков ограничивает долю процессора,
+    которую может занять сжатие. Ответы больше large_size сжимаются с уровнем 1: на повторяющемся JSON он уступает
+    уровню level немногим, а обходится в разы дешевле. Потоковые ответы (SSE, StreamingResponse) не сжимаются.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        min_size: int = ANALYZER_COMPRESSION_MIN_SIZE,
+        large_size: int = ANALYZER_COMPRESSION_LARGE_SIZE,
+        level: int = ANALYZER_COMPRESSION_LEVEL,
+        threads: int = ANALYZER_COMPRESSION_THREADS,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.app = app
+        self.min_size = min_size
+        self.large_size = large_size
+        self.level = level
+        self.threads = threads
+        # Пул, переданный снаружи, останавливает его владелец (см. add_compression)
+        self.executor = executor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.level <= 0 or not self._accepts_gzip(Headers(scope=scope)):
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                # Заголовки отправляются вместе с первой частью тела, когда станет ясно, сжимается ли ответ
+                start = message
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or headers.get("content-type", "").startswith(EVENT_STREAM_MEDIA_TYPE):
+                    passthrough = True
+                    await send(message)
+                return
+
+            passthrough = True
+            body = message.get("body", b"")
+            if not message.get("more_body", False) and len(body) >= self.min_size:
+                body = await self.compress(body)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = "gzip"
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    async def compress(self, body: bytes) -> bytes:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix="compression")
+        level = 1 if len(body) > self.large_size else self.level
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._compress, body, level)
+
+    @staticmethod
+    def _compress(body: bytes, level: int) -> bytes:
+        return gzip.compress(body, compresslevel=level, mtime=0)
+
+    @staticmethod
+    def _accepts_gzip(headers: Headers) -> bool:
+        qualities = parse_accept(headers.get("accept-encoding", ""))
+        return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def add_compression(app: FastAPI) -> ThreadPoolExecutor:
+    """
+    Подключает сжатие ответов и возвращает его пул потоков: приложение останавливает пул при завершении работы.
+    """
+    # Потоки пула создаются при первом сжатии, поэтому пул без ответов для сжатия ничего не стоит
+    executor = ThreadPoolExecutor(ANALYZER_COMPRESSION_THREADS, thread_name_prefix="compression")
+    app.add_middleware(CompressionMiddleware, threads=ANALYZER_COMPRESSION_THREADS, executor=executor)
+    return executor
+
+
+class TimingMiddleware:
+    """
+    Учитывает время фаз и запросы к базе каждого HTTP-запроса (см. analyzer.utils.timing). Итог отдается клиенту
+    в заголовке Server-Timing и пишется в журнал одной JSON-строкой.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+        with collect_timings() as timings:
+
+            async def send_with_timing(message: Message) -> None:
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    timings.finish()
+                    MutableHeaders(raw=message["headers"]).append("Server-Timing", timings.server_timing())
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                timings.finish()
+                # Запросы, не дошедшие ни до одного маршрута, объединяются, чтобы не плодить метки по путям
+                route = timings.route or "unmatched"
+                REQUEST_DURATION.labels(scope["method"], route, status or 500).observe(timings.duration)
+                REQUEST_STATEMENTS.labels(scope["method"], route).observe(timings.statements)
+                log.info(
+                    json.dumps(
+                        {"method": scope["method"], "path": scope["path"], "status": status, **timings.as_dict()}
+                    )
+                )
+
+
+class TimedRoute(APIRoute):
+    """
+    Маршрут, размечающий фазы запроса: до вызова обработчика FastAPI разбирает и валидирует входные данные, после —
+    валидирует и сериализует ответ.
+    """
+
+    def get_route_handler(self) -> Callable:
+        if asyncio.iscoroutinefunction(self.dependant.call):
+            self.dependant.call = self._timed(self.dependant.call)
+        route_handler = super().get_route_handler()
+
+        async def timed_route_handler(request: Request) -> Response:
+            timings = get_timings()
+            if timings is not None:
+                timings.route = self.path
+            with span(f"{request.method} {self.path}"), phase("validation"):
+                return await route_handler(request)
+
+        return timed_route_handler
+
+    @staticmethod
+    def _timed(endpoint: Callable) -> Callable:
+        @wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            set_phase("handler")
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                set_phase("serialization")
+
+        return timed_endpoint
+
+
+def add_timing(app: FastAPI) -> None:
+    instrument_engines()
+    app.add_middleware(TimingMiddleware)
+
+
+class ProfilingMiddleware:
+    """
+    Выполняет под cProfile запросы с заголовком X-Profile, равным token, и сохраняет профиль в формате pstats
+    в directory; имя файла возвращается в заголовке ответа X-Profile. Профиль охватывает весь запрос: валидацию,
+    обработчик, планирование обновлений, работу драйвера базы и кодирование ответа. cProfile учитывает все, что
+    выполняется в потоке цикла событий, поэтому в профиль попадают и конкурентные запросы; одновременно
+    профилируется только один запрос.
+    """
+
+    header = "x-profile"
+
+    def __init__(self, app: ASGIApp, token: str = ANALYZER_PROFILE_TOKEN, directory: str = ANALYZER_PROFILE_DIR):
+        self.app = app
+        self.token = token.encode()
+        self.directory = directory
+        self.profiler: Optional[Profile] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        token = Headers(scope=scope).get(self.header) if scope["type"] == "http" else None
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not hmac.compare_digest(token.encode(), self.token):
+            response = JSONResponse(status_code=403, content=jsonable_encoder(Error(code=403, message="Forbidden")))
+            await response(scope, receive, send)
+            return
+        if self.profiler is not None:
+            response = JSONResponse(
+                status_code=409, content=jsonable_encoder(Error(code=409, message="Profiler is busy"))
+            )
+            await response(scope, receive, send)
+            return
+
+        path = scope["path"].strip("/").replace("/", "_")
+        name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S.%f}-{scope['method']}-{path}.prof"
+
+        async def send_with_profile(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message["headers"]).append("X-Profile", name)
+            await send(message)
+
+        self.profiler = profiler = Profile()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_profile)
+            finally:
+                profiler.disable()
+        finally:
+            self.profiler = None
+        os.makedirs(self.directory, exist_ok=True)
+        # asyncio.to_thread появился только в Python 3.9
+        await asyncio.get_running_loop().run_in_executor(None, profiler.dump_stats, os.path.join(self.directory, name))
+
+
+def add_profiling(app: FastAPI) -> None:
+    # Без токена профилирование недоступно, и промежуточный слой не добавляется вовсе
+    if ANALYZER_PROFILE_TOKEN:
+        app.add_middleware(ProfilingMiddleware)
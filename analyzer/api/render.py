@@ -0,0 +1,192 @@
+"""
+Сборка и кодирование больших поддеревьев вне цикла событий.
+
+Сборка дерева из строк и его кодирование занимают процессор на время, пропорциональное размеру поддерева, и пока они
+идут в цикле событий, стоят все остальные запросы рабочего процесса. Renderer выполняет их в пуле: в пуле потоков
+большой запрос делит GIL с циклом событий, но уже не блокирует его целиком; пул процессов выполняет работу
+параллельно. Процессам строки передаются поколоночно в компактных буферах (идентификаторы по 16 байт, числа в array),
+которые сериализуются в разы быстрее списка строк. Упаковка буферов тоже пропорциональна размеру поддерева, поэтому
+и она выполняется в потоке, а поддеревья каталога упаковываются прямо из его массивов, минуя объекты юнитов.
+Поддеревья меньше min_units обрабатываются на месте: передача в пул стоила бы дороже самой работы.
+"""
+from __future__ import annotations
+
+import asyncio
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import accumulate
+from multiprocessing import get_context
+from operator import attrgetter
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from analyzer.db.catalog import NO_PARENT, NO_PRICE, Catalog
+from analyzer.db.core import (
+    ANALYZER_RENDER_EXECUTOR,
+    ANALYZER_RENDER_MIN_UNITS,
+    ANALYZER_RENDER_WORKERS,
+)
+from analyzer.utils.misc import nameddict
+from analyzer.utils.timing import phase
+
+from .encoding import Encoding
+from .schema import ShopUnitField, dump_unit
+
+EXECUTORS = ("thread", "process")
+NIL_ID = bytes(16)
+
+
+def pack_ids(ids: Sequence[Optional[UUID]]) -> bytes:
+    return b"".join(id.bytes if id is not None else NIL_ID for id in ids)
+
+
+def unpack_ids(data: bytes, count: int) -> List[Optional[UUID]]:
+    return [UUID(bytes=data[i : i + 16]) if data[i : i + 16] != NIL_ID else None for i in range(0, count * 16, 16)]
+
+
+def pack_names(names: Sequence[str]) -> bytes:
+    # Смещения имен (count + 1 значение), затем сами имена в UTF-8
+    names = [name.encode() for name in names]
+    return array("q", accumulate(map(len, names), initial=0)).tobytes() + b"".join(names)
+
+
+def unpack_names(data: bytes, count: int) -> List[str]:
+    offsets = array("q", data[: (count + 1) * 8])
+    names = data[(count + 1) * 8 :]
+    return [names[offsets[i] : offsets[i + 1]].decode() for i in range(count)]
+
+
+# Кодеки колонок строк: имя колонки -> (упаковка значений в буфер, распаковка буфера из count значений)
+COLUMN_CODECS: Dict[str, Tuple[Callable[[Sequence], bytes], Callable[[bytes, int], List]]] = {
+    "id": (pack_ids, unpack_ids),
+    "parent_id": (pack_ids, unpack_ids),
+    "name": (pack_names, unpack_names),
+    "is_category": (lambda values: bytes(map(bool, values)), lambda data, count: [bool(value) for value in data]),
+    "price": (
+        lambda values: array("q", (NO_PRICE if value is None else value for value in values)).tobytes(),
+        lambda data, count: [None if value == NO_PRICE else value for value in array("q", data)],
+    ),
+    "date": (
+        lambda values: array("d", [value.timestamp() for value in values]).tobytes(),
+        lambda data, count: [datetime.fromtimestamp(value, timezone.utc) for value in array("d", data)],
+    ),
+}
+
+
+def pack_rows(rows: Sequence, columns: Collection[str]) -> Tuple[int, Dict[str, bytes]]:
+    return len(rows), {
+        name: COLUMN_CODECS[name][0](list(map(attrgetter(name), rows))) for name in COLUMN_CODECS if name in columns
+    }
+
+
+def pack_subtree(catalog: Catalog, id: UUID, columns: Collection[str]) -> Tuple[int, Dict[str, bytes]]:
+    # Буферы те же, что у pack_rows: цены и даты хранятся в каталоге в том же представлении, что и в буферах
+    order = catalog.get_subtree_order(id)
+    ids, parents = catalog.ids, catalog.parents
+    packers = {
+        "id": lambda: b"".join([ids[i].bytes for i in order]),
+        "parent_id": lambda: b"".join([ids[parents[i]].bytes if parents[i] != NO_PARENT else NIL_ID for i in order]),
+        "name": lambda: pack_names([catalog.names[i] for i in order]),
+        "is_category": lambda: bytes(map(catalog.categories.__getitem__, order)),
+        "price": lambda: array("q", map(catalog.prices.__getitem__, order)).tobytes(),
+        "date": lambda: array("d", map(catalog.dates.__getitem__, order)).tobytes(),
+    }
+    return len(order), {name: packers[name]() for name in COLUMN_CODECS if name in columns}
+
+
+def unpack_rows(count: int, packed: Dict[str, bytes]) -> List[nameddict]:
+    names = list(packed)
+    columns = [COLUMN_CODECS[name][1](packed[name], count) for name in names]
+    return [nameddict(zip(names, values)) for values in zip(*columns)]
+
+
+def assemble_tree(rows: Sequence, fields: List[ShopUnitField], encoders: Dict) -> Dict[str, Any]:
+    # Строки идут в порядке обхода в ширину, поэтому родитель всегда собран раньше своих детей, а первая строка — корень
+    units = {}
+    for row in rows:
+        unit = dump_unit(row, fields, encoders)
+        unit["children"] = [] if row.is_category else None
+        parent = units.get(row.parent_id)
+        if parent is not None:
+            parent["children"].append(unit)
+        units[row.id] = unit
+    return units[rows[0].id]
+
+
+def render(rows: Sequence, fields: List[ShopUnitField], encoding: Encoding, tree: bool) -> bytes:
+    if tree:
+        return encoding.encode(assemble_tree(rows, fields, encoding.field_encoders))
+    return encoding.encode([dump_unit(row, fields, encoding.field_encoders) for row in rows])
+
+
+def render_packed(
+    count: int, packed: Dict[str, bytes], fields: List[ShopUnitField], encoding: Encoding, tree: bool
+) -> bytes:
+    return render(unpack_rows(count, packed), fields, encoding, tree)
+
+
+class Renderer:
+    def __init__(
+        self,
+        executor: str = ANALYZER_RENDER_EXECUTOR,
+        workers: int = ANALYZER_RENDER_WORKERS,
+        min_units: int = ANALYZER_RENDER_MIN_UNITS,
+    ) -> Renderer:
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown render executor {executor!r}, expected one of {', '.join(EXECUTORS)}")
+        self.process = executor == "process"
+        self.min_units = min_units
+        self.executor: Executor
+        if self.process:
+            # Рабочие процессы запускаются заново, а не форком: им не нужны ни цикл событий, ни соединения родителя
+            self.executor = ProcessPoolExecutor(workers, mp_context=get_context("spawn"))
+            self.packer = ThreadPoolExecutor(workers, thread_name_prefix="render-pack")
+        else:
+            self.executor = self.packer = ThreadPoolExecutor(workers, thread_name_prefix="render")
+
+    async def render(
+        self, rows: Sequence, columns: Collection[str], fields: List[ShopUnitField], encoding: Encoding, tree: bool
+    ) -> bytes:
+        """
+        Собирает из строк rows (с колонками columns) дерево или плоский список и кодирует его в encoding.
+        """
+        with phase("serialization"):
+            if len(rows) < self.min_units:
+                return render(rows, fields, encoding, tree)
+
+            loop = asyncio.get_running_loop()
+            if self.process:
+                count, packed = await loop.run_in_executor(self.packer, pack_rows, rows, columns)
+                return await loop.run_in_executor(self.executor, render_packed, count, packed, fields, encoding, tree)
+            return await loop.run_in_executor(self.executor, render, rows, fields, encoding, tree)
+
+    async def render_subtree(
+        self,
+        catalog: Catalog,
+        id: UUID,
+        columns: Collection[str],
+        fields: List[ShopUnitField],
+        encoding: Encoding,
+        tree: bool,
+    ) -> bytes:
+        """
+        То же, что render, для поддерева id из каталога. Размер поддерева заранее неизвестен, поэтому в поток
+        упаковки оно отправляется всегда.
+        """
+        with phase("serialization"):
+            loop = asyncio.get_running_loop()
+            await catalog.columns_lock.acquire()
+            packing = loop.run_in_executor(self.packer, pack_subtree, catalog, id, columns)
+            # Каталог не должен меняться, пока поток читает его массивы. Блокировка снимается по окончании упаковки,
+            # даже если запрос отменят раньше
+            packing.add_done_callback(lambda _: catalog.columns_lock.release())
+            count, packed = await asyncio.shield(packing)
+
+            if count < self.min_units:
+                return render_packed(count, packed, fields, encoding, tree)
+            return await loop.run_in_executor(self.executor, render_packed, count, packed, fields, encoding, tree)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+        self.packer.shutdown(wait=False)
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import TYPE_CHECKING, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field, validator
@@ -14,8 +14,19 @@ if TYPE_CHECKING:
     from analyzer.db import schema
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def format_date(d: datetime) -> str:
+    return "%04d" % d.year + d.strftime("-%m-%dT%H:%M:%S.000Z")
+
+
+def timestamp_ms(d: datetime) -> int:
+    return (d - EPOCH) // timedelta(milliseconds=1)
+
+
 # Поправляем форматирование дат на форматирование, требуемое спецификацией
-ENCODERS_BY_TYPE[datetime] = lambda d: "%04d" % d.year + d.strftime("-%m-%dT%H:%M:%S.000Z")
+ENCODERS_BY_TYPE[datetime] = format_date
 
 
 class ShopUnitType(Enum):
@@ -53,16 +64,24 @@ class ShopUnit(BaseModel):
     @staticmethod
     def from_model(model: schema.ShopUnit):
         return ShopUnit(
-            id=UUID(model.id),
+            id=model.id,
             name=model.name,
             date=model.last_update,
-            parentId=UUID(model.parent_id) if model.parent_id else None,
+            parentId=model.parent_id,
             type=ShopUnitType.CATEGORY if model.is_category else ShopUnitType.OFFER,
             price=model.price,
             children=[ShopUnit.from_model(child) for child in model.children] if model.is_category else None,
         )
 
 
+class ShopUnitDelta(BaseModel):
+    unit: Optional[ShopUnit] = Field(
+        None,
+        description="Изменившаяся часть поддерева: у категорий в children перечислены только изменившиеся дети. Если поддерево не менялось — null.",
+    )
+    deleted: List[UUID] = Field(..., description="Корни поддеревьев, удаленных из поддерева элемента.")
+
+
 class ShopUnitImport(BaseModel):
     id: UUID = Field(
         ...,
@@ -80,9 +99,9 @@ class ShopUnitImport(BaseModel):
 
     def to_database_row(self, last_update: datetime) -> nameddict:
         return nameddict(
-            id=str(self.id),
+            id=self.id,
             name=self.name,
-            parent_id=str(self.parentId) if self.parentId else None,
+            parent_id=self.parentId,
             is_category=self.type == ShopUnitType.CATEGORY,
             price=self.price,
             last_update=last_update,
@@ -106,6 +125,21 @@ class ShopUnitImportRequest(BaseModel):
     )
 
 
+DELETE_DATE_DESCRIPTION = (
+    "Время удаления в тех же часах, что и updateDate импортов: с ним сравнивается since в /nodes/{id}. Если не "
+    "указано, удаление считается выполненным сразу после последнего импорта."
+)
+
+
+class ShopUnitDeleteRequest(BaseModel):
+    ids: List[UUID] = Field(..., description="Идентификаторы удаляемых элементов", min_items=1)
+    updateDate: Optional[datetime] = Field(
+        None,
+        description=DELETE_DATE_DESCRIPTION,
+        example="2022-05-28T21:12:01.516Z",
+    )
+
+
 class ShopUnitStatisticUnit(BaseModel):
     id: UUID = Field(
         ...,
@@ -127,20 +161,116 @@ class ShopUnitStatisticUnit(BaseModel):
 
     @staticmethod
     def from_model(model: schema.ShopUnit):
-        return ShopUnit(
-            id=UUID(model.id),
+        return ShopUnitStatisticUnit(
+            id=model.id,
             name=model.name,
             date=model.date,
-            parentId=UUID(model.parent_id) if model.parent_id else None,
+            parentId=model.parent_id,
             type=ShopUnitType.CATEGORY if model.is_category else ShopUnitType.OFFER,
             price=model.price,
         )
 
 
+class NodesFormat(Enum):
+    TREE = "tree"
+    FLAT = "flat"
+
+
+class ShopUnitField(Enum):
+    ID = "id"
+    NAME = "name"
+    DATE = "date"
+    PARENT_ID = "parentId"
+    TYPE = "type"
+    PRICE = "price"
+
+
+# Колонки DAL, из которых читаются поля ответа
+FIELD_COLUMNS: Dict[ShopUnitField, str] = {
+    ShopUnitField.ID: "id",
+    ShopUnitField.NAME: "name",
+    ShopUnitField.DATE: "date",
+    ShopUnitField.PARENT_ID: "parent_id",
+    ShopUnitField.TYPE: "is_category",
+    ShopUnitField.PRICE: "price",
+}
+
+# Поля сериализуются сразу в значения JSON, минуя создание и валидацию pydantic-моделей
+FIELD_ENCODERS: Dict[ShopUnitField, Callable[[Any], Any]] = {
+    ShopUnitField.ID: lambda model: str(model.id),
+    ShopUnitField.NAME: lambda model: model.name,
+    ShopUnitField.DATE: lambda model: format_date(model.date),
+    ShopUnitField.PARENT_ID: lambda model: str(model.parent_id) if model.parent_id else None,
+    ShopUnitField.TYPE: lambda model: (ShopUnitType.CATEGORY if model.is_category else ShopUnitType.OFFER).value,
+    ShopUnitField.PRICE: lambda model: model.price,
+}
+
+# Для бинарных форматов: идентификаторы — 16 байт, даты — миллисекунды от начала эпохи Unix
+BINARY_FIELD_ENCODERS: Dict[ShopUnitField, Callable[[Any], Any]] = {
+    **FIELD_ENCODERS,
+    ShopUnitField.ID: lambda model: model.id.bytes,
+    ShopUnitField.DATE: lambda model: timestamp_ms(model.date),
+    ShopUnitField.PARENT_ID: lambda model: model.parent_id.bytes if model.parent_id else None,
+}
+
+FIELDS_DESCRIPTION = "Поля элементов в ответе. Если не указаны, возвращаются все поля."
+
+
+def select_fields(fields: Iterable[ShopUnitField]) -> List[ShopUnitField]:
+    # Поля ответа идут в порядке объявления независимо от порядка и повторов в запросе
+    fields = set(fields)
+    return [field for field in ShopUnitField if field in fields]
+
+
+def field_columns(fields: Iterable[ShopUnitField]) -> List[str]:
+    return [FIELD_COLUMNS[field] for field in fields]
+
+
+def dump_unit(model, fields: List[ShopUnitField], encoders: Dict = FIELD_ENCODERS) -> Dict[str, Any]:
+    return {field.value: encoders[field](model) for field in fields}
+
+
+def dump_tree(model, fields: List[ShopUnitField], encoders: Dict = FIELD_ENCODERS) -> Dict[str, Any]:
+    unit = dump_unit(model, fields, encoders)
+    unit["children"] = [dump_tree(child, fields, encoders) for child in model.children] if model.is_category else None
+    return unit
+
+
 class ShopUnitStatisticResponse(BaseModel):
     items: Optional[List[ShopUnitStatisticUnit]] = Field(None, description="История в произвольном порядке.")
 
 
+class ShopUnitChangeType(Enum):
+    UPDATE = "UPDATE"
+    DELETE = "DELETE"
+
+
+class ShopUnitChange(BaseModel):
+    cursor: int = Field(..., description="Позиция изменения в журнале, с которой можно продолжить чтение ленты.")
+    type: ShopUnitChangeType
+    id: UUID = Field(..., description="Идентификатор измененного элемента")
+    unit: Optional[ShopUnitStatisticUnit] = Field(
+        None,
+        description="Текущее состояние элемента. Для удаленных элементов равно null, удаление категории означает удаление всего ее поддерева.",
+    )
+
+    @staticmethod
+    def from_model(model):
+        if model.name is None:
+            return ShopUnitChange(cursor=model.cursor, type=ShopUnitChangeType.DELETE, id=model.id)
+        return ShopUnitChange(
+            cursor=model.cursor,
+            type=ShopUnitChangeType.UPDATE,
+            id=model.id,
+            unit=ShopUnitStatisticUnit.from_model(model),
+        )
+
+
+class ShopUnitChangesResponse(BaseModel):
+    cursor: int = Field(..., description="Позиция последнего прочитанного изменения")
+    items: List[ShopUnitChange] = Field(..., description="Изменения в порядке их записи")
+
+
 class Error(BaseModel):
     code: int
     message: str
@@ -2,17 +2,55 @@
 Утилита для управления состоянием базы данных, обертка над alembic.
 Можно вызывать из любой директории, а также указать произвольный DSN для базы
 данных, отличный от указанного в файле alembic.ini.
+
+Помимо команд alembic доступны команды load — массовая загрузка каталога из NDJSON/CSV, export — выгрузка
+каталога в NDJSON, пригодный для load, и snapshot — бинарный снимок каталога для быстрого старта API.
 """
 import argparse
 import logging
 import os
 
-from alembic.config import CommandLine
+from alembic.config import CommandLine, Config
 
+from analyzer.db import export, loader, snapshot
 from analyzer.db.core import DEFAULT_PG_URL
 from analyzer.utils.database import make_alembic_config
 
 
+def load(config: Config, units: str, history: str = None, input_format: str = None) -> None:
+    loader.load(config.get_main_option("sqlalchemy.url"), units, history, input_format)
+
+
+def dump(config: Config, units: str, history: str = None) -> None:
+    export.export(config.get_main_option("sqlalchemy.url"), units, history)
+
+
+def write_snapshot(config: Config, path: str) -> None:
+    snapshot.snapshot(config.get_main_option("sqlalchemy.url"), path)
+
+
+def add_commands(alembic: CommandLine) -> None:
+    # alembic не сохраняет объект subparsers, поэтому находим его среди действий парсера
+    subparsers = next(action for action in alembic.parser._actions if isinstance(action, argparse._SubParsersAction))
+
+    parser = subparsers.add_parser("load", help="Bulk load units (and price history) into a fresh database")
+    parser.add_argument("units", help="NDJSON/CSV file with units")
+    parser.add_argument("--history", help="NDJSON/CSV file with price history, restored from units if omitted")
+    parser.add_argument(
+        "--format", dest="input_format", choices=loader.FORMATS, help="Input format, detected by extension if omitted"
+    )
+    parser.set_defaults(cmd=(load, ["units"], ["history", "input_format"]))
+
+    parser = subparsers.add_parser("export", help="Export units (and price history) to NDJSON readable by load")
+    parser.add_argument("units", help="Output NDJSON file for units")
+    parser.add_argument("--history", help="Output NDJSON file for price history")
+    parser.set_defaults(cmd=(dump, ["units"], ["history"]))
+
+    parser = subparsers.add_parser("snapshot", help="Write a binary catalog snapshot for ANALYZER_CATALOG_SNAPSHOT")
+    parser.add_argument("path", help="Output snapshot file")
+    parser.set_defaults(cmd=(write_snapshot, ["path"], []))
+
+
 def main():
     logging.basicConfig(level=logging.DEBUG)
 
@@ -21,6 +59,7 @@ def main():
     alembic.parser.add_argument(
         "--pg_url", default=os.getenv("ANALYZER_PG_URL", DEFAULT_PG_URL), help="Database URL [env var: ANALYZER_PG_URL]"
     )
+    add_commands(alembic)
 
     options = alembic.parser.parse_args()
     if "cmd" not in options:
@@ -0,0 +1,62 @@
+"""Store ids as native uuid
+
+Revision ID: 7aad7e41d106
+Revises: 0cba1057b86f
+Create Date: 2026-10-19 18:41:05.208113
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "7aad7e41d106"
+down_revision = "0cba1057b86f"
+branch_labels = None
+depends_on = None
+
+# Колонки с идентификаторами юнитов: (таблица, колонка, nullable)
+ID_COLUMNS = (
+    ("shop_units", "id", False),
+    ("shop_units", "parent_id", True),
+    ("price_updates", "unit_id", True),
+    ("units_hierarchy", "parent_id", False),
+    ("units_hierarchy", "id", False),
+    ("category_info", "id", False),
+)
+
+FOREIGN_KEYS = (
+    ("fk__price_updates__unit_id__shop_units", "price_updates", "unit_id"),
+    ("fk__category_info__id__shop_units", "category_info", "id"),
+)
+
+
+def drop_foreign_keys() -> None:
+    for name, table, column in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_="foreignkey")
+
+
+def create_foreign_keys() -> None:
+    for name, table, column in FOREIGN_KEYS:
+        op.create_foreign_key(name, table, "shop_units", [column], ["id"], ondelete="CASCADE")
+
+
+def alter_ids(type_, array_type, cast: str) -> None:
+    # Типы колонок внешнего ключа и первичного ключа должны совпадать в любой момент, поэтому ключи пересоздаются
+    drop_foreign_keys()
+    for table, column, nullable in ID_COLUMNS:
+        op.alter_column(table, column, type_=type_, nullable=nullable, postgresql_using=f"{column}::{cast}")
+
+    # Значение по умолчанию не приводится к новому типу автоматически
+    op.alter_column("shop_units", "path", server_default=None)
+    op.alter_column("shop_units", "path", type_=array_type, postgresql_using=f"path::{cast}[]")
+    op.alter_column("shop_units", "path", server_default="{}")
+    create_foreign_keys()
+
+
+def upgrade() -> None:
+    alter_ids(postgresql.UUID(as_uuid=True), postgresql.ARRAY(postgresql.UUID(as_uuid=True)), "uuid")
+
+
+def downgrade() -> None:
+    alter_ids(sa.String(), postgresql.ARRAY(sa.String()), "varchar")
@@ -0,0 +1,312 @@
+"""
+Каталог в памяти процесса для обслуживания чтений /nodes.
+
+Дерево хранится поколоночно: юнит — это индекс в массивах, ссылки на родителя — индексы, а не объекты, поэтому
+каталог занимает несколько сотен байт на юнит и не создает ORM-объектов. Источником истины остается Postgres:
+каталог загружается из него при старте и после каждой записи перечитывает юниты, затронутые апдейтами DAL.
+"""
+from __future__ import annotations
+
+import asyncio
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+from uuid import UUID
+
+from prometheus_client import Counter
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm.exc import NoResultFound
+
+from .core import SessionLocal
+from .dal import DAL, get_dal
+from .notify import Listener
+from .queries.unit import UnitUpdateQuery
+
+NO_PARENT = -1
+# Сколько записей журнала изменений применяется за раз при догоне базы данных
+REPLAY_BATCH_SIZE = 10000
+NO_PRICE = -(2**63)
+
+CATALOG_LOOKUPS = Counter(
+    "analyzer_catalog_lookups", "Поиски юнитов в каталоге в памяти: hit — найден, miss — нет в каталоге", ["result"]
+)
+
+
+class CatalogNode:
+    """Узел дерева, собранный из каталога. Повторяет атрибуты ShopUnit, которые читает schema.ShopUnit.from_model"""
+
+    __slots__ = ("id", "name", "parent_id", "is_category", "price", "last_update", "children")
+
+    def __init__(self, id, name, parent_id, is_category, price, last_update):
+        self.id = id
+        self.name = name
+        self.parent_id = parent_id
+        self.is_category = is_category
+        self.price = price
+        self.last_update = last_update
+        self.children = None
+
+    @property
+    def date(self) -> datetime:
+        return self.last_update
+
+
+class Catalog:
+    __slots__ = (
+        "index",
+        "ids",
+        "names",
+        "parents",
+        "categories",
+        "prices",
+        "dates",
+        "children",
+        "free",
+        "watermark",
+        "lock",
+        "columns_lock",
+    )
+
+    def __init__(self) -> Catalog:
+        self.clear()
+        # Чтение юнитов из базы и их применение к каталогу выполняются под блокировкой: иначе обновления из
+        # обработчика и из Listener могут чередоваться на await, и более старое чтение применится последним
+        self.lock = asyncio.Lock()
+        # Массивы каталога меняются только под этой блокировкой: ее держат и те, кто читает поддерево вне цикла
+        # событий (см. analyzer.api.render)
+        self.columns_lock = asyncio.Lock()
+
+    def clear(self) -> None:
+        self.index: Dict[UUID, int] = {}
+        self.ids: List[Optional[UUID]] = []
+        self.names: List[Optional[str]] = []
+        self.parents = array("q")
+        self.categories = bytearray()
+        self.prices = array("q")
+        self.dates = array("d")
+        # Списки индексов детей категорий, для товаров — None
+        self.children: List[Optional[List[int]]] = []
+        # Индексы, освободившиеся после удаления юнитов, переиспользуются новыми юнитами
+        self.free: List[int] = []
+        # Номер последней записи журнала изменений, учтенной каталогом
+        self.watermark = 0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, id: UUID) -> bool:
+        return id in self.index
+
+    @classmethod
+    async def load(cls, session: Session) -> Catalog:
+        catalog = cls()
+        async with get_dal(session) as dal:
+            await catalog._load(dal)
+        return catalog
+
+    async def replay(self, session: Session) -> None:
+        """
+        Догоняет базу данных: применяет изменения, записанные в журнал после водяного знака каталога, порциями по
+        REPLAY_BATCH_SIZE записей. Если журнал уже вычищен дальше водяного знака, каталог загружается заново.
+        """
+        async with get_dal(session) as dal:
+            async with self.lock:
+                if self.watermark < await dal.get_changes_horizon():
+                    async with self.columns_lock:
+                        self.clear()
+                    await self._load(dal)
+                    return
+
+            while True:
+                ids, watermark = await dal.get_changes_since(self.watermark, REPLAY_BATCH_SIZE)
+                if watermark == self.watermark:
+                    return
+                await self.refresh(dal, ids)
+                self.watermark = watermark
+
+    async def refresh(self, dal: DAL, ids: Iterable[UUID]) -> None:
+        """
+        Перечитывает юниты ids вместе с их предками. Юниты, которых больше нет в базе, удаляются вместе с поддеревьями.
+        Каждое обновление читает базу не раньше, чем было применено предыдущее, поэтому устаревшие цены предков не
+        перезаписывают новые.
+        """
+        ids = set(ids)
+        if not ids:
+            return
+
+        async with self.lock:
+            rows = await dal.get_units_with_ancestors(ids)
+            found = {row[0] for row in rows}
+            async with self.columns_lock:
+                self.remove(ids - found)
+                self.update(rows)
+
+    async def _load(self, dal: DAL) -> None:
+        # Водяной знак читается до юнитов: изменение, попавшее между ними, будет лишь повторно применено
+        self.watermark = await dal.get_changes_watermark()
+        async for rows in dal.stream_catalog():
+            async with self.columns_lock:
+                self.update(rows)
+
+    def update(self, rows: Iterable[Sequence]) -> None:
+        """
+        Добавляет или обновляет юниты по строкам (id, name, parent_id, is_category, price, last_update).
+        """
+        # Родитель может прийти в той же порции позже ребенка, поэтому связи проставляются вторым проходом
+        relinked = []
+        for id, name, parent_id, is_category, price, last_update in rows:
+            i = self.index.get(id)
+            if i is None:
+                i = self._allocate(id)
+                relinked.append((i, parent_id))
+            elif self._parent_id(i) != parent_id:
+                self._detach(i)
+                relinked.append((i, parent_id))
+
+            self.names[i] = name
+            self.categories[i] = is_category
+            self.prices[i] = NO_PRICE if price is None else price
+            self.dates[i] = last_update.timestamp()
+            if is_category and self.children[i] is None:
+                self.children[i] = []
+
+        for i, parent_id in relinked:
+            parent = self.index.get(parent_id, NO_PARENT) if parent_id else NO_PARENT
+            self.parents[i] = parent
+            if parent != NO_PARENT:
+                self.children[parent].append(i)
+
+    def remove(self, ids: Iterable[UUID]) -> None:
+        for id in ids:
+            i = self.index.get(id)
+            if i is None:
+                continue
+
+            self._detach(i)
+            stack = [i]
+            while stack:
+                i = stack.pop()
+                stack.extend(self.children[i] or ())
+                del self.index[self.ids[i]]
+                self.ids[i] = self.names[i] = self.children[i] = None
+                self.free.append(i)
+
+    def get_node(self, id: UUID) -> CatalogNode:
+        nodes = self.get_nodes([id])
+        if id not in nodes:
+            raise NoResultFound()
+        return nodes[id]
+
+    def get_nodes(self, ids: List[UUID]) -> Dict[UUID, CatalogNode]:
+        nodes = {id: self._build(self.index[id]) for id in ids if id in self.index}
+        CATALOG_LOOKUPS.labels("hit").inc(len(nodes))
+        CATALOG_LOOKUPS.labels("miss").inc(len(ids) - len(nodes))
+        return nodes
+
+    def get_subtree(self, id: UUID) -> List[CatalogNode]:
+        """
+        Возвращает юниты поддерева id без связей между ними в порядке обхода в ширину.
+        """
+        return [self._node(i) for i in self.get_subtree_order(id)]
+
+    def get_subtree_order(self, id: UUID) -> List[int]:
+        """
+        Возвращает индексы юнитов поддерева id в порядке обхода в ширину.
+        """
+        if id not in self.index:
+            CATALOG_LOOKUPS.labels("miss").inc()
+            raise NoResultFound()
+
+        CATALOG_LOOKUPS.labels("hit").inc()
+        order = [self.index[id]]
+        for i in order:
+            order.extend(self.children[i] or ())
+        return order
+
+    def _allocate(self, id: UUID) -> int:
+        if self.free:
+            i = self.free.pop()
+            self.ids[i] = id
+            self.parents[i] = NO_PARENT
+        else:
+            if not isinstance(self.parents, array):
+                self._unmap()
+            i = len(self.ids)
+            self.ids.append(id)
+            self.names.append(None)
+            self.parents.append(NO_PARENT)
+            self.categories.append(False)
+            self.prices.append(NO_PRICE)
+            self.dates.append(0.0)
+            self.children.append(None)
+        self.index[id] = i
+        return i
+
+    def _unmap(self) -> None:
+        # Колонки, отображенные из снимка (см. analyzer.db.snapshot), имеют фиксированную длину. Когда свободные
+        # индексы снимка закончились, колонки копируются в растущие массивы процесса
+        self.parents = array("q", self.parents.tobytes())
+        self.categories = bytearray(self.categories)
+        self.prices = array("q", self.prices.tobytes())
+        self.dates = array("d", self.dates.tobytes())
+
+    def _parent_id(self, i: int) -> Optional[UUID]:
+        parent = self.parents[i]
+        return self.ids[parent] if parent != NO_PARENT else None
+
+    def _detach(self, i: int) -> None:
+        parent = self.parents[i]
+        if parent != NO_PARENT:
+            self.children[parent].remove(i)
+            self.parents[i] = NO_PARENT
+
+    def _node(self, i: int) -> CatalogNode:
+        price = self.prices[i]
+        return CatalogNode(
+            self.ids[i],
+            self.names[i],
+            self._parent_id(i),
+            bool(self.categories[i]),
+            None if price == NO_PRICE else price,
+            datetime.fromtimestamp(self.dates[i], timezone.utc),
+        )
+
+    def _build(self, i: int) -> CatalogNode:
+        # Обходим поддерево без рекурсии: глубина дерева категорий ничем не ограничена
+        root = self._node(i)
+        stack = [(i, root)]
+        while stack:
+            i, node = stack.pop()
+            children = self.children[i]
+            if children is not None:
+                node.children = [self._node(child) for child in children]
+                stack.extend(zip(children, node.children))
+        return root
+
+
+async def refresh_catalog(session: Session, catalog: Optional[Catalog], update_query: UnitUpdateQuery) -> None:
+    """
+    Применяет к каталогу изменения, которые записал запрос: перечитывает измененные юниты и всех их предков.
+    """
+    if catalog is None:
+        return
+    async with get_dal(session) as dal:
+        await catalog.refresh(dal, update_query.get_changed_ids())
+
+
+def listen(catalog: Catalog, session_factory: sessionmaker = SessionLocal, **kwargs) -> Listener:
+    """
+    Создает Listener, применяющий к каталогу изменения, которые записали другие экземпляры API.
+    """
+
+    async def refresh(ids: Set[UUID]) -> None:
+        async with session_factory() as session:
+            async with get_dal(session) as dal:
+                await catalog.refresh(dal, ids)
+
+    async def replay() -> None:
+        # Пока соединения не было, уведомления могли потеряться: догоняем базу по журналу изменений
+        async with session_factory() as session:
+            await catalog.replay(session)
+
+    return Listener(refresh, replay, **kwargs)
@@ -2,71 +2,147 @@ from __future__ import annotations
 
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import AsyncIterator, Collection, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
 
-from sqlalchemy import and_, bindparam, delete, update
+from sqlalchemy import BigInteger, and_, bindparam, delete, func, literal, or_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql.expression import Join
 
 from analyzer.utils.database import BatchInserter
-
-from . import queries
-from .queries.hierarchy import (
-    HierarchyUpdate,
-    HierarchyUpdateQuery,
-    HierarchyUpdateType,
-)
+from analyzer.utils.instrumentation import instrumented
+from analyzer.utils.misc import nameddict
+from analyzer.utils.timing import phase
+from analyzer.utils.tracing import set_attribute
+
+from . import export, notify, queries
+from .core import ANALYZER_SOFT_DELETE
+from .queries.hierarchy import HierarchyUpdateQuery
 from .queries.unit import DateUpdate, PriceUpdateType, UnitUpdateQuery
-from .schema import CategoryInfo, PriceUpdate, ShopUnit, UnitHierarchy
+from .schema import (
+    CategoryInfo,
+    PriceUpdate,
+    ShopUnit,
+    TombstoneHorizon,
+    UnitChange,
+    UnitHierarchy,
+    UnitTombstone,
+)
+
+# Колонки, которые можно выбрать для юнитов дерева и для статистики (поля ответа, см. api.schema.ShopUnitField)
+UNIT_COLUMNS = {
+    "id": ShopUnit.id,
+    "name": ShopUnit.name,
+    "parent_id": ShopUnit.parent_id,
+    "is_category": ShopUnit.is_category,
+    "price": ShopUnit.price,
+    "date": ShopUnit.last_update.label("date"),
+}
+STATISTIC_COLUMNS = {**UNIT_COLUMNS, "price": PriceUpdate.price, "date": PriceUpdate.date}
+# Без этих колонок из строк нельзя собрать дерево
+TREE_COLUMNS = {"id", "parent_id", "is_category"}
+# Ключ транзакционной advisory-блокировки, под которой записи журнала изменений получают номера
+CHANGES_LOCK_ID = 0x616E616C797A6572
+
+
+def select_columns(columns_by_name: Dict, columns: Optional[Collection[str]]) -> List:
+    return [column for name, column in columns_by_name.items() if columns is None or name in columns]
 
 
 @asynccontextmanager
 async def get_dal(session: Session) -> DAL:
     client = DAL(session)
-    try:
-        await session.begin()
-        yield client
-    finally:
-        await session.commit()
+    with phase("dal"):
+        try:
+            await session.begin()
+            yield client
+        finally:
+            await session.commit()
 
 
+@instrumented
 async def apply_updates(
     session: Session,
     update_query: UnitUpdateQuery,
     hierarchy_query: HierarchyUpdateQuery,
     update_date: Optional[datetime] = None,
 ) -> None:
-    async with session.begin():
-        await hierarchy_query.execute(session)
+    with phase("hierarchy"):
+        async with session.begin():
+            await hierarchy_query.execute(session)
 
     # Обновление price должно происходить лишь после построения иерархии
     async with session.begin():
         if update_query:
-            parents = await DAL(session).get_parents_ids(update_query.get_updating_ids())
-            await update_query.execute(session, parents, update_date)
+            with phase("aggregates"):
+                parents = await DAL(session).get_parents_ids(update_query.get_updating_ids())
+                await update_query.execute(session, parents, update_date)
+        # Журнал изменений и уведомление других экземпляров фиксируются вместе с самими изменениями
+        with phase("dal"):
+            await DAL(session).record_changes(update_query.get_changed_ids())
+            await notify.publish(session, update_query.get_changed_ids())
 
 
 class ForbiddenOperation(RuntimeError):
     pass
 
 
+class ChangesExpired(RuntimeError):
+    """
+    Изменения после курсора или даты since уже вычищены, и продолжить синхронизацию с них нельзя.
+    """
+
+
 class DAL:
     def __init__(self, session: Session) -> DAL:
         self.session = session
-
-    async def delete_unit(self, id: str) -> None:
+        self.soft_delete = ANALYZER_SOFT_DELETE
+
+    @instrumented
+    async def delete_unit(
+        self, id: UUID, date: Optional[datetime] = None
+    ) -> Tuple[UnitUpdateQuery, HierarchyUpdateQuery]:
+        return await self.delete_units([id], date)
+
+    @instrumented
+    async def delete_units(
+        self, ids: List[UUID], date: Optional[datetime] = None
+    ) -> Tuple[UnitUpdateQuery, HierarchyUpdateQuery]:
+        """
+        Удаляет юниты ids с поддеревьями. date — дата удаления в датах клиента, с которыми сравнивается since; без нее
+        удаление считается выполненным сразу после последнего обновления каталога.
+        """
+        set_attribute("ids", len(ids))
         unit_query = UnitUpdateQuery()
         hierarchy_query = HierarchyUpdateQuery()
 
-        # one() выбрасывает исключение, если результата нет — мы обрабатываем и выбрасываем 404
-        q = await self.session.scalars(select(ShopUnit).where(ShopUnit.id == id))
-        unit = q.one()
+        # Если хотя бы одного юнита не существует, ничего не удаляем и выбрасываем исключение — мы его обрабатываем
+        # и выбрасываем 404
+        q = await self.session.scalars(select(ShopUnit).where(ShopUnit.id.in_(ids), ShopUnit.deleted.is_(False)))
+        units = q.all()
+        if len(units) != len(set(ids)):
+            raise NoResultFound()
+
+        # Юниты, лежащие внутри других удаляемых категорий, удалятся вместе с ними, поэтому отбрасываем их
+        deleted_categories = {unit.id for unit in units if unit.is_category}
+        roots = [unit for unit in units if deleted_categories.isdisjoint(unit.path)]
+        root_categories = [unit.id for unit in roots if unit.is_category]
 
-        # Обновляем price у всех категорий — родителей
-        if unit.parent_id:
+        # Обновляем price у всех категорий — родителей. UnitUpdateQuery суммирует изменения, поэтому каждый
+        # выживший предок обновится одним запросом независимо от количества удаляемых поддеревьев
+        q = await self.session.execute(
+            select(CategoryInfo.id, CategoryInfo.sum, CategoryInfo.count).where(CategoryInfo.id.in_(root_categories))
+        )
+        category_info = {id: (total_sum, childs_count) for id, total_sum, childs_count in q.all()}
+        for unit in roots:
+            unit_query.add_changed(unit.id)
+            if not unit.parent_id:
+                continue
             if unit.is_category:
-                total_sum, childs_count = await self._get_category_info(unit.id)
+                total_sum, childs_count = category_info[unit.id]
                 unit_query.add(
                     unit.parent_id,
                     queries.unit.PriceUpdate(PriceUpdateType.CHANGE, sum_diff=-total_sum, count_diff=-childs_count),
@@ -74,50 +150,91 @@ class DAL:
             else:
                 unit_query.add(unit.parent_id, queries.unit.PriceUpdate(PriceUpdateType.DELETE, unit))
 
-        # Удаляем всех детей у текущей и всех дочерних категорий, удаляем служебные данные об иерархии
-        if unit.is_category:
-            q = await self.session.scalars(select(UnitHierarchy.id).where(UnitHierarchy.parent_id == id))
-            child_categories = [unit.id] + q.all()
-            await self.session.execute(delete(ShopUnit).where(ShopUnit.parent_id.in_(child_categories)))
-
-            hierarchy_query.add(HierarchyUpdate(HierarchyUpdateType.DELETE, unit))
+        # Надгробия корней удаляемых поддеревьев нужны клиентам, синхронизирующим деревья по ?since=... Дата
+        # надгробия должна быть в тех же часах, что и last_update: since клиент берет из дат ответов. Без явной даты
+        # берется момент сразу после последнего обновления — он позже любого since, который мог получить клиент
+        if date is None:
+            q = await self.session.execute(select(func.max(ShopUnit.last_update)))
+            date = q.scalar_one() + timedelta(microseconds=1)
+        await self._add_tombstones({unit.id: unit.path for unit in roots}, date)
+
+        # Удаляем объединение поддеревьев — юниты, в путях которых есть удаляемые категории, находятся одним
+        # сканированием GIN-индекса, — а также служебные данные об иерархии всех удаляемых категорий. История цен и
+        # CategoryInfo удаляются каскадно. В режиме мягкого удаления юниты лишь помечаются удаленными, а каскад
+        # выполняет analyzer.db.purger
+        subtree_condition = or_(ShopUnit.id.in_([unit.id for unit in roots]), ShopUnit.path.overlap(root_categories))
+        if self.soft_delete:
+            statement = update(ShopUnit).where(subtree_condition, ShopUnit.deleted.is_(False)).values(deleted=True)
+        else:
+            statement = delete(ShopUnit).where(subtree_condition)
+        await self.session.execute(statement.execution_options(synchronize_session=False))
+        child_categories = select(UnitHierarchy.id).where(UnitHierarchy.parent_id.in_(root_categories))
+        await self.session.execute(
+            delete(UnitHierarchy)
+            .where(or_(UnitHierarchy.id.in_(root_categories), UnitHierarchy.id.in_(child_categories)))
+            .execution_options(synchronize_session=False)
+        )
 
-        await self.session.delete(unit)
+        # Удаленные объекты не должны оставаться в identity map сессии
+        self.session.expunge_all()
         return (unit_query, hierarchy_query)
 
-    async def get_parents_ids(self, category_ids: List[str]) -> Dict[str, List[str]]:
-        result = {category_id: [] for category_id in category_ids}
+    @instrumented
+    async def get_parents_ids(self, unit_ids: List[UUID]) -> Dict[UUID, List[UUID]]:
+        # Предки юнита хранятся в его материализованном пути, поэтому достаточно прочитать по строке на юнит
+        result = {unit_id: [] for unit_id in unit_ids}
 
-        q = await self.session.execute(
-            select(UnitHierarchy.parent_id, UnitHierarchy.id).where(UnitHierarchy.id.in_(category_ids))
-        )
-        for parent_id, ident in q.all():
-            result[ident].append(parent_id)
+        q = await self.session.execute(select(ShopUnit.id, ShopUnit.path).where(ShopUnit.id.in_(unit_ids)))
+        for ident, path in q.all():
+            result[ident] = path
 
         return result
 
+    @instrumented
     async def add_units(self, units: List, update_date: datetime) -> None:
+        set_attribute("units", len(units))
         update_query = UnitUpdateQuery()
         hierarchy_query = HierarchyUpdateQuery()
         batch_inserter = BatchInserter()
 
         unit_updates = []
         category_updates = []
+        # Старые пути перенесенных юнитов: для поддеревьев прежних предков перенос выглядит как удаление
+        moved_paths = {}
 
         q = await self.session.scalars(select(ShopUnit).where(ShopUnit.id.in_([unit.id for unit in units])))
         database_units = {unit.id: unit for unit in q.all()}
 
+        # Мягко удаленный, но еще не вычищенный юнит импортируется заново: вычищаем его немедленно
+        purged_units = [unit for unit in database_units.values() if unit.deleted]
+        if purged_units:
+            await self.session.execute(
+                delete(ShopUnit)
+                .where(ShopUnit.id.in_([unit.id for unit in purged_units]))
+                .execution_options(synchronize_session=False)
+            )
+            for unit in purged_units:
+                del database_units[unit.id]
+                self.session.expunge(unit)
+
+        # Юнит, созданный заново после удаления, больше не считается удаленным
+        new_units = [unit.id for unit in units if unit.id not in database_units]
+        if new_units:
+            await self.session.execute(delete(UnitTombstone).where(UnitTombstone.id.in_(new_units)))
+
         for unit in units:
             old_unit = database_units.get(unit.id, None)
 
+            update_query.add_changed(unit.id)
             update_query.add(unit.parent_id, DateUpdate())
             if old_unit is None:
-                # Создаем юнит, если он не существует. Если это категория — строим иерархию.
+                # Создаем юнит, если он не существует. Путь юнита с родителем, а для категории и иерархия, строятся
+                # после вставки
                 batch_inserter.add(ShopUnit, unit)
+                if unit.parent_id:
+                    hierarchy_query.add_path_update(unit.id)
                 if unit.is_category:
                     batch_inserter.add(CategoryInfo, {"id": unit.id, "sum": 0, "count": 0, "last_update": update_date})
-                    if unit.parent_id:
-                        hierarchy_query.add(HierarchyUpdate(HierarchyUpdateType.BUILD, unit))
                 else:
                     # Обновляем price у всех родительских категорий
                     update_query.add(unit.parent_id, queries.unit.PriceUpdate(PriceUpdateType.ADD, unit))
@@ -130,8 +247,11 @@ class DAL:
                 if old_unit.parent_id != unit.parent_id:
                     # Если обновился родитель, нам необходимо обновить last_update предыдущего родителя
                     update_query.add(old_unit.parent_id, DateUpdate())
+                    hierarchy_query.add_path_update(unit.id)
+                    if old_unit.path:
+                        moved_paths[unit.id] = old_unit.path
 
-                    # Пересчитываем поле price у родителей, если юнит — категория, то перестраиваем иерархию
+                    # Пересчитываем поле price у родителей. Иерархия перестраивается вместе с путями
                     if not unit.is_category:
                         update_query.add(old_unit.parent_id, queries.unit.PriceUpdate(PriceUpdateType.DELETE, old_unit))
                         update_query.add(unit.parent_id, queries.unit.PriceUpdate(PriceUpdateType.ADD, unit))
@@ -148,9 +268,6 @@ class DAL:
                             queries.unit.PriceUpdate(PriceUpdateType.CHANGE, sum_diff=totalSum, count_diff=childsCount),
                         )
 
-                        hierarchy_query.add(HierarchyUpdate(HierarchyUpdateType.DELETE, old_unit))
-                        if unit.parent_id:
-                            hierarchy_query.add(HierarchyUpdate(HierarchyUpdateType.BUILD, unit))
                 else:
                     # Если родитель не изменился, нам надо лишь пересчитать поле price у родительских категорий
                     # (в том случае, если price у unit и old_unit разный, иначе это будут лишь лишние запросы)
@@ -173,6 +290,7 @@ class DAL:
 
         # Нам не нужны пустые update запросы, поэтому мы делаем проверки
         await batch_inserter.execute(self.session)
+        await self._add_tombstones(moved_paths, update_date)
         update_stmt = update(ShopUnit).where(ShopUnit.id == bindparam("id_"))
         if unit_updates:
             await self.session.execute(update_stmt.values(self._get_update_params(is_category=False)), unit_updates)
@@ -181,26 +299,105 @@ class DAL:
 
         return (update_query, hierarchy_query)
 
-    async def get_node_statistic(self, id: str, date_start: datetime, date_end: datetime) -> List[ShopUnit]:
+    @instrumented
+    async def get_node_statistic(
+        self, id: UUID, date_start: datetime, date_end: datetime, columns: Optional[Collection[str]] = None
+    ) -> List[ShopUnit]:
         # Проверка, что элемент существует. Отсутствие статистики не значит отсутствие элемента
 
-        q = await self.session.execute(select(ShopUnit.id).where(ShopUnit.id == id))
+        q = await self.session.execute(select(ShopUnit.id).where(ShopUnit.id == id, ShopUnit.deleted.is_(False)))
         q.one()  # Исключение, если элемента не существует
 
         # Согласно спецификации, обновления должны получаться за полуинтервал [from, to)
         q = await self.session.execute(
             self._get_statistics_query(
-                and_(ShopUnit.id == id, PriceUpdate.date >= date_start, PriceUpdate.date < date_end)
+                and_(ShopUnit.id == id, PriceUpdate.date >= date_start, PriceUpdate.date < date_end), columns=columns
             )
         )
         return q.all()
 
-    async def get_node(self, id: str) -> ShopUnit:
-        q = await self.session.scalars(select(ShopUnit).where(ShopUnit.id == id))
-        unit = q.one()
-        return await self._retrieve_unit(unit)
+    @instrumented
+    async def get_node(self, id: UUID, columns: Optional[Collection[str]] = None) -> ShopUnit:
+        nodes = await self.get_nodes([id], columns)
+        if id not in nodes:
+            raise NoResultFound()
+        return nodes[id]
+
+    @instrumented
+    async def get_node_delta(self, id: UUID, since: datetime) -> Tuple[Optional[ShopUnit], List[UUID]]:
+        """
+        Возвращает часть поддерева id, изменившуюся после since, и корни поддеревьев, удаленных из него или
+        перенесенных за его пределы после since. Если надгробия после since уже вычищены, выбрасывает ChangesExpired.
+        """
+        q = await self.session.execute(select(ShopUnit.id).where(ShopUnit.id == id, ShopUnit.deleted.is_(False)))
+        q.one()  # Исключение, если элемента не существует
+
+        q = await self.session.execute(select(TombstoneHorizon.deleted_at))
+        horizon = q.scalar_one_or_none()
+        if horizon is not None and since < horizon:
+            raise ChangesExpired()
+
+        q = await self.session.execute(
+            select(UnitTombstone.id, UnitTombstone.path).where(
+                UnitTombstone.path.overlap([id]), UnitTombstone.deleted_at > since
+            )
+        )
+        tombstones = q.all()
+
+        # last_update распространяется на всех предков, поэтому у неизменившегося юнита не изменилось и поддерево:
+        # фильтр по индексу last_update отсекает такие поддеревья целиком, и изменившиеся юниты образуют дерево с
+        # корнем id. Удаление и перенос не меняют last_update, но меняют цены предков по старому пути, поэтому эти
+        # предки берутся из путей надгробий. Юнит с надгробием, который снова находится в поддереве (перенесен
+        # обратно или внутри поддерева), отдается как изменившийся, а не как удаленный
+        changed = {ancestor_id for _, path in tombstones for ancestor_id in path}
+        changed.update(tombstone_id for tombstone_id, _ in tombstones)
+        q = await self.session.scalars(
+            select(ShopUnit).where(
+                or_(ShopUnit.id == id, ShopUnit.path.overlap([id])),
+                or_(ShopUnit.last_update > since, ShopUnit.id.in_(changed)),
+                ShopUnit.deleted.is_(False),
+            )
+        )
+        units = {unit.id: unit for unit in q.all()}
+        self._assemble_children(units)
+
+        return units.get(id), [tombstone_id for tombstone_id, _ in tombstones if tombstone_id not in units]
+
+    @instrumented
+    async def get_subtree(self, id: UUID, columns: Optional[Collection[str]] = None) -> List:
+        # Сортировка по глубине дает порядок обхода в ширину, а строки не превращаются в ORM-объекты
+        q = await self.session.execute(
+            select(*select_columns(UNIT_COLUMNS, columns))
+            .where(or_(ShopUnit.id == id, ShopUnit.path.overlap([id])), ShopUnit.deleted.is_(False))
+            .order_by(ShopUnit.depth)
+        )
+        units = q.all()
+        if not units:
+            raise NoResultFound()
+        return units
+
+    @instrumented
+    async def get_nodes(self, ids: List[UUID], columns: Optional[Collection[str]] = None) -> Dict[UUID, ShopUnit]:
+        """
+        Возвращает деревья юнитов ids. Если переданы columns, читаются только эти колонки (и колонки, нужные для
+        сборки дерева), а юниты возвращаются как nameddict вместо ORM-объектов.
+        """
+        # Поддеревья всех запрошенных юнитов получаем одним запросом по GIN-индексу материализованных путей.
+        # Каждая строка читается один раз, даже если она входит в несколько пересекающихся поддеревьев
+        whereclause = (or_(ShopUnit.id.in_(ids), ShopUnit.path.overlap(ids)), ShopUnit.deleted.is_(False))
+        if columns is None:
+            q = await self.session.scalars(select(ShopUnit).where(*whereclause))
+            units = {unit.id: unit for unit in q.all()}
+        else:
+            q = await self.session.execute(
+                select(*select_columns(UNIT_COLUMNS, TREE_COLUMNS.union(columns))).where(*whereclause)
+            )
+            units = {row.id: nameddict(row._mapping) for row in q.all()}
+        self._assemble_children(units)
+        return {id: units[id] for id in ids if id in units}
 
-    async def get_sales(self, date: datetime) -> List[ShopUnit]:
+    @instrumented
+    async def get_sales(self, date: datetime, columns: Optional[Collection[str]] = None) -> List[ShopUnit]:
         # Мы пишем == False вместо is not False ввиду того, что только такое сравнение sqlalchemy может преобразовать
         # в SQL код
         # Согласно спецификации, обновления должны получаться за интервал [date - 24h, date]
@@ -211,11 +408,121 @@ class DAL:
                     ShopUnit.is_category == False,
                     PriceUpdate.date >= (date - timedelta(days=1)),
                     PriceUpdate.date <= date,
-                )
+                ),
+                columns=columns,
+            )
+        )
+        return q.all()
+
+    @instrumented
+    async def record_changes(self, unit_ids: Iterable[UUID]) -> None:
+        unit_ids = list(unit_ids)
+        if not unit_ids:
+            return
+
+        # Номера записей выдаются последовательностью при вставке, а видны читателям — после фиксации. Чтобы читатель
+        # не продвинул курсор за номер еще не зафиксированной транзакции, пишущие транзакции получают номера по очереди:
+        # блокировка держится до фиксации, поэтому номера идут в порядке фиксации. Запись журнала — последний шаг
+        # транзакции, так что блокировка держится недолго
+        await self.session.execute(select(func.pg_advisory_xact_lock(literal(CHANGES_LOCK_ID, BigInteger))))
+        batch_inserter = BatchInserter()
+        for unit_id in unit_ids:
+            batch_inserter.add(UnitChange, {"unit_id": unit_id})
+        await batch_inserter.execute(self.session)
+
+    @instrumented
+    async def get_changes_watermark(self) -> int:
+        q = await self.session.execute(select(func.coalesce(func.max(UnitChange.id), 0)))
+        return q.scalar_one()
+
+    @instrumented
+    async def get_changes_horizon(self) -> int:
+        """
+        Номер, до которого включительно журнал изменений мог быть вычищен: изменения после него сохранились все.
+        """
+        q = await self.session.execute(select(func.coalesce(func.min(UnitChange.id) - 1, 0)))
+        return q.scalar_one()
+
+    @instrumented
+    async def check_changes_cursor(self, cursor: int) -> None:
+        if cursor < await self.get_changes_horizon():
+            raise ChangesExpired()
+
+    @instrumented
+    async def get_changes_since(self, watermark: int, limit: int) -> Tuple[Set[UUID], int]:
+        """
+        Возвращает юниты из не более чем limit записей журнала после watermark и номер последней из них.
+        """
+        q = await self.session.execute(
+            select(UnitChange.id, UnitChange.unit_id)
+            .where(UnitChange.id > watermark)
+            .order_by(UnitChange.id)
+            .limit(limit)
+        )
+        changes = q.all()
+        return {unit_id for _, unit_id in changes}, max((id for id, _ in changes), default=watermark)
+
+    @instrumented
+    async def get_changes(self, cursor: int, limit: int) -> List:
+        # Изменение несет текущее состояние юнита; если юнита больше нет, поля состояния равны NULL
+        q = await self.session.execute(
+            select(
+                UnitChange.id.label("cursor"),
+                UnitChange.unit_id.label("id"),
+                ShopUnit.name,
+                ShopUnit.parent_id,
+                ShopUnit.is_category,
+                ShopUnit.price,
+                ShopUnit.last_update.label("date"),
             )
+            .outerjoin(ShopUnit, and_(ShopUnit.id == UnitChange.unit_id, ShopUnit.deleted.is_(False)))
+            .where(UnitChange.id > cursor)
+            .order_by(UnitChange.id)
+            .limit(limit)
+        )
+        return q.all()
+
+    @instrumented
+    async def get_units_with_ancestors(self, ids: Iterable[UUID]) -> List:
+        ids = list(ids)
+        ancestors = select(func.unnest(ShopUnit.path)).where(ShopUnit.id.in_(ids))
+        q = await self.session.execute(
+            export.LIVE_UNITS_QUERY.where(or_(ShopUnit.id.in_(ids), ShopUnit.id.in_(ancestors)))
         )
         return q.all()
 
+    async def stream_catalog(self) -> AsyncIterator[List]:
+        # Родители идут раньше детей, поэтому каталог связывает дерево за один проход
+        async for rows in self._stream(export.LIVE_UNITS_QUERY.order_by(ShopUnit.depth)):
+            yield rows
+
+    async def stream_units(self) -> AsyncIterator[List]:
+        async for rows in self._stream(export.UNITS_QUERY):
+            yield rows
+
+    async def stream_price_updates(self) -> AsyncIterator[List]:
+        async for rows in self._stream(export.HISTORY_QUERY):
+            yield rows
+
+    async def _stream(self, query) -> AsyncIterator[List]:
+        # stream() использует серверный курсор, поэтому в памяти одновременно находится не больше одной порции строк
+        result = await self.session.stream(query)
+        async for rows in result.partitions(export.EXPORT_BATCH_SIZE):
+            yield rows
+
+    async def _add_tombstones(self, paths: Dict[UUID, List[UUID]], deleted_at: datetime) -> None:
+        if not paths:
+            return
+        statement = pg_insert(UnitTombstone).values(
+            [{"id": id, "path": path, "deleted_at": deleted_at} for id, path in paths.items()]
+        )
+        await self.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[UnitTombstone.id],
+                set_={"path": statement.excluded.path, "deleted_at": deleted_at, "created_at": func.now()},
+            )
+        )
+
     def _get_update_values(self, unit) -> Dict:
         if unit.is_category:
             return {"name": unit.name, "parent_id": unit.parent_id, "last_update": unit.last_update}
@@ -243,33 +550,27 @@ class DAL:
                 "last_update": bindparam("last_update"),
             }
 
-    async def _get_category_info(self, category_id: str) -> Tuple[int, int]:
+    async def _get_category_info(self, category_id: UUID) -> Tuple[int, int]:
         q = await self.session.execute(
             select(CategoryInfo.sum, CategoryInfo.count).where(CategoryInfo.id == category_id)
         )
         totalSum, childsCount = q.first()
         return (totalSum, childsCount)
 
-    async def _retrieve_unit(self, unit: ShopUnit) -> ShopUnit:
-        # Рекурсивно получаем всех детей
-
-        unit.children = None
-        if unit.is_category:
-            q = await self.session.scalars(select(ShopUnit).where(ShopUnit.parent_id == unit.id))
-            unit.children = [await self._retrieve_unit(child) for child in q.all()]
-        return unit
-
-    def _get_statistics_query(self, *whereclause) -> Join:
+    def _assemble_children(self, units: Dict[UUID, ShopUnit]) -> None:
+        # Собираем деревья из плоского списка юнитов: поддерево замкнуто вниз, поэтому если родитель юнита
+        # присутствует в units, то вместе с ним присутствуют и все его дети
+        for unit in units.values():
+            unit.children = [] if unit.is_category else None
+        for unit in units.values():
+            parent = units.get(unit.parent_id)
+            if parent is not None:
+                parent.children.append(unit)
+
+    def _get_statistics_query(self, *whereclause, columns: Optional[Collection[str]] = None) -> Join:
         return (
-            select(
-                ShopUnit.id,
-                ShopUnit.name,
-                ShopUnit.parent_id,
-                PriceUpdate.price,
-                ShopUnit.is_category,
-                PriceUpdate.date,
-            )
+            select(*select_columns(STATISTIC_COLUMNS, columns))
             .select_from(ShopUnit)
-            .where(*whereclause)
+            .where(ShopUnit.deleted.is_(False), *whereclause)
             .join(PriceUpdate, ShopUnit.id == PriceUpdate.unit_id)
         )
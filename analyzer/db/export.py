@@ -0,0 +1,80 @@
+"""
+Потоковая выгрузка каталога и истории цен в NDJSON, который умеет читать команда load.
+
+Строки читаются серверным курсором в стабильном порядке (по первичному ключу), поэтому потребление памяти не
+зависит от размера каталога, а MVCC гарантирует, что выгрузка не блокирует пишущие транзакции.
+"""
+from __future__ import annotations
+
+import json
+from typing import Callable, Optional
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.future import select
+
+from analyzer.utils.database import make_raw_connection
+
+from .schema import PriceUpdate, ShopUnit
+
+EXPORT_BATCH_SIZE = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Живые (не удаленные) юниты без сортировки — общая часть выгрузки и каталога в памяти (analyzer.db.catalog)
+LIVE_UNITS_QUERY = select(
+    ShopUnit.id, ShopUnit.name, ShopUnit.parent_id, ShopUnit.is_category, ShopUnit.price, ShopUnit.last_update
+).where(ShopUnit.deleted.is_(False))
+UNITS_QUERY = LIVE_UNITS_QUERY.order_by(ShopUnit.id)
+HISTORY_QUERY = (
+    select(PriceUpdate.unit_id, PriceUpdate.price, PriceUpdate.date)
+    .join(ShopUnit, ShopUnit.id == PriceUpdate.unit_id)
+    .where(ShopUnit.deleted.is_(False))
+    .order_by(PriceUpdate.id)
+)
+
+
+def unit_record(row) -> dict:
+    id, name, parent_id, is_category, price, last_update = row
+    return {
+        "id": str(id),
+        "name": name,
+        "parentId": str(parent_id) if parent_id else None,
+        "type": "CATEGORY" if is_category else "OFFER",
+        "price": price,
+        # В отличие от API, сохраняем дату без потери точности
+        "date": last_update.isoformat(),
+    }
+
+
+def history_record(row) -> dict:
+    unit_id, price, date = row
+    return {"id": str(unit_id), "price": price, "date": date.isoformat()}
+
+
+def dumps(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def write_query(connection, query, path: str, make_record: Callable[[tuple], dict]) -> None:
+    # Именованный курсор psycopg2 — серверный, строки забираются порциями по itersize
+    with connection.cursor(name="analyzer_export") as cursor, open(path, "w", encoding="utf-8") as f:
+        cursor.itersize = EXPORT_BATCH_SIZE
+        cursor.execute(str(query.compile(dialect=postgresql.dialect())))
+        for row in cursor:
+            f.write(dumps(make_record(row)))
+
+
+def export(pg_url: str, units_path: str, history_path: Optional[str] = None) -> None:
+    """
+    Выгружает юниты в units_path (и историю цен в history_path) из одного снимка базы данных.
+    """
+    connection = make_raw_connection(pg_url)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+
+        write_query(connection, UNITS_QUERY, units_path, unit_record)
+        if history_path:
+            write_query(connection, HISTORY_QUERY, history_path, history_record)
+        connection.commit()
+    finally:
+        connection.close()
@@ -0,0 +1,201 @@
+"""
+Массовая загрузка каталога в обход REST API.
+
+Юниты (и, опционально, история цен) копируются в таблицы командой COPY, после чего служебные таблицы
+units_hierarchy, category_info и цены категорий вычисляются несколькими set-based запросами — без
+построчного планирования, которым занимаются DAL и UnitUpdateQuery.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import os
+from typing import IO, Iterable, Iterator, Optional, Sequence
+
+from analyzer.utils.database import make_raw_connection
+
+log = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv")
+
+# Материализованные пути строятся спуском от корней, после чего units_hierarchy разворачивается из путей категорий
+BUILD_PATHS = """
+    UPDATE shop_units SET path = tree.path, depth = cardinality(tree.path)
+    FROM (
+        WITH RECURSIVE tree(id, path) AS (
+            SELECT id, ARRAY[]::uuid[] FROM shop_units WHERE parent_id IS NULL
+            UNION ALL
+            SELECT child.id, tree.path || child.parent_id
+            FROM tree JOIN shop_units child ON child.parent_id = tree.id
+        )
+        SELECT id, path FROM tree
+    ) tree
+    WHERE shop_units.id = tree.id
+"""
+
+BUILD_HIERARCHY = """
+    INSERT INTO units_hierarchy (parent_id, id)
+    SELECT unnest(path), id FROM shop_units WHERE is_category
+"""
+
+# Товар учитывается в своей категории и во всех ее родителях, которые уже лежат в units_hierarchy
+BUILD_CATEGORY_INFO = """
+    INSERT INTO category_info (id, sum, count, last_update)
+    SELECT category.id, COALESCE(totals.sum, 0), COALESCE(totals.count, 0), category.last_update
+    FROM shop_units category
+    LEFT JOIN (
+        SELECT ancestors.category_id, SUM(offer.price) AS sum, COUNT(*) AS count
+        FROM shop_units offer
+        JOIN (
+            SELECT id AS leaf_id, id AS category_id FROM shop_units WHERE is_category
+            UNION ALL
+            SELECT id, parent_id FROM units_hierarchy
+        ) ancestors ON ancestors.leaf_id = offer.parent_id
+        WHERE NOT offer.is_category
+        GROUP BY ancestors.category_id
+    ) totals ON totals.category_id = category.id
+    WHERE category.is_category
+"""
+
+UPDATE_CATEGORY_PRICES = """
+    UPDATE shop_units SET price = category_info.sum / NULLIF(category_info.count, 0)
+    FROM category_info WHERE category_info.id = shop_units.id
+"""
+
+# Если история не передана, восстанавливаем ее так, как ее записал бы /imports: по записи на каждый товар
+# и на каждую категорию, у которой есть товары
+BUILD_HISTORY = """
+    INSERT INTO price_updates (unit_id, price, date)
+    SELECT id, price, last_update FROM shop_units WHERE price IS NOT NULL
+"""
+
+
+class LoadError(RuntimeError):
+    pass
+
+
+def copy_value(value) -> str:
+    # Текстовый формат COPY: NULL кодируется как \N, служебные символы экранируются обратным слэшем
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class CopyStream:
+    """Файлоподобный объект, лениво отдающий строки итератора в текстовом формате COPY ... FROM STDIN"""
+
+    def __init__(self, rows: Iterable[Sequence]):
+        self.rows = iter(rows)
+        self.pending = ""
+
+    def read(self, size: int = -1) -> str:
+        lines = [self.pending]
+        length = len(self.pending)
+        while size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = "\t".join(copy_value(value) for value in row) + "\n"
+            lines.append(line)
+            length += len(line)
+
+        data = "".join(lines)
+        if size < 0:
+            size = len(data)
+        chunk, self.pending = data[:size], data[size:]
+        return chunk
+
+
+def detect_format(path: str, input_format: Optional[str] = None) -> str:
+    if input_format:
+        return input_format
+    return "csv" if os.path.splitext(path)[1].lower() == ".csv" else "ndjson"
+
+
+def read_records(stream: IO[str], input_format: str) -> Iterator[dict]:
+    if input_format == "csv":
+        for record in csv.DictReader(stream):
+            # В CSV отсутствие значения кодируется пустой строкой
+            yield {key: value if value != "" else None for key, value in record.items()}
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+# Поля записей юнитов совпадают с полями ShopUnit из спецификации API (без children): id, name, parentId, type,
+# price, date. Записи истории цен содержат поля id, price, date
+def unit_rows(records: Iterable[dict]) -> Iterator[tuple]:
+    for record in records:
+        is_category = record["type"] == "CATEGORY"
+        yield (
+            record["id"],
+            record["name"],
+            record.get("parentId"),
+            "t" if is_category else "f",
+            None if is_category else record["price"],
+            record["date"],
+        )
+
+
+def history_rows(records: Iterable[dict]) -> Iterator[tuple]:
+    for record in records:
+        yield record["id"], record["price"], record["date"]
+
+
+def copy_file(cursor, path: str, input_format: Optional[str], table: str, columns: Sequence[str], make_rows) -> None:
+    input_format = detect_format(path, input_format)
+    with open(path, encoding="utf-8", newline="") as stream:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+            CopyStream(make_rows(read_records(stream, input_format))),
+        )
+    log.info("Copied %d rows from %s into %s", cursor.rowcount, path, table)
+
+
+def load(pg_url: str, units_path: str, history_path: Optional[str] = None, input_format: Optional[str] = None) -> None:
+    """
+    Загружает юниты из units_path (и историю цен из history_path) в пустую базу данных одной транзакцией.
+    """
+    connection = make_raw_connection(pg_url)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM shop_units)")
+            if cursor.fetchone()[0]:
+                raise LoadError("shop_units is not empty, bulk load is supported only for a fresh database")
+
+            copy_file(
+                cursor,
+                units_path,
+                input_format,
+                "shop_units",
+                ("id", "name", "parent_id", "is_category", "price", "last_update"),
+                unit_rows,
+            )
+
+            for name, statement in (
+                ("paths", BUILD_PATHS),
+                ("units_hierarchy", BUILD_HIERARCHY),
+                ("category_info", BUILD_CATEGORY_INFO),
+                ("category prices", UPDATE_CATEGORY_PRICES),
+            ):
+                cursor.execute(statement)
+                log.info("Built %s: %d rows", name, cursor.rowcount)
+
+            if history_path:
+                copy_file(
+                    cursor, history_path, input_format, "price_updates", ("unit_id", "price", "date"), history_rows
+                )
+            else:
+                cursor.execute(BUILD_HISTORY)
+                log.info("Built price_updates: %d rows", cursor.rowcount)
+
+            # После массовой вставки статистика планировщика устарела
+            cursor.execute("ANALYZE shop_units, units_hierarchy, category_info, price_updates")
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
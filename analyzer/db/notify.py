@@ -0,0 +1,116 @@
+"""
+Согласование кэшей нескольких экземпляров API через Postgres LISTEN/NOTIFY.
+
+Каждая запись публикует идентификаторы затронутых юнитов и их предков в канал CHANNEL в своей транзакции, поэтому
+уведомление доставляется ровно тогда, когда изменения зафиксированы. Listener держит отдельное соединение asyncpg,
+слушает канал и передает идентификаторы, опубликованные другими экземплярами, в обработчик (обычно — каталог
+в памяти). Уведомления, пропущенные, пока соединения не было, восстанавливаются обработчиком on_connect
+по журналу изменений. Любая ошибка приводит к переподключению, поэтому задача Listener.run не завершается сама.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional, Set
+from uuid import UUID, uuid4
+
+import asyncpg
+from sqlalchemy import func
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from .core import ANALYZER_PG_URL
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "analyzer_units"
+# Размер уведомления ограничен 8000 байт, поэтому идентификаторы публикуются порциями
+NOTIFY_BATCH_SIZE = 150
+RECONNECT_DELAY = 5.0
+
+# Идентификатор процесса: экземпляр пропускает собственные уведомления, свой кэш он обновляет сам
+INSTANCE_ID = uuid4().hex
+
+
+def payloads(unit_ids: Iterable[UUID], source: str = INSTANCE_ID) -> Iterator[str]:
+    unit_ids = [str(unit_id) for unit_id in unit_ids]
+    for start in range(0, len(unit_ids), NOTIFY_BATCH_SIZE):
+        yield json.dumps({"source": source, "ids": unit_ids[start : start + NOTIFY_BATCH_SIZE]})
+
+
+async def publish(session: Session, unit_ids: Iterable[UUID]) -> None:
+    for payload in payloads(unit_ids):
+        await session.execute(select(func.pg_notify(CHANNEL, payload)))
+
+
+class Listener:
+    def __init__(
+        self,
+        on_change: Callable[[Set[UUID]], Awaitable[None]],
+        on_connect: Optional[Callable[[], Awaitable[None]]] = None,
+        dsn: str = ANALYZER_PG_URL,
+        source: Optional[str] = INSTANCE_ID,
+    ) -> Listener:
+        self.on_change = on_change
+        self.on_connect = on_connect
+        self.dsn = dsn
+        # Уведомления от source пропускаются
+        self.source = source
+        self.connected = asyncio.Event()
+        self.queue: asyncio.Queue[Optional[List[str]]] = asyncio.Queue()
+        # Идентификаторы, которые еще не удалось передать в on_change
+        self.pending: Set[UUID] = set()
+
+    async def run(self) -> None:
+        # Любая ошибка — соединения, подписки, восстановления по журналу или обработчика — приводит к переподключению:
+        # после него on_connect догоняет базу данных, а неприменившиеся идентификаторы передаются в on_change повторно
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Failed to listen for %s, reconnecting in %s s", CHANNEL, RECONNECT_DELAY)
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _listen(self) -> None:
+        # Очередь своя у каждого соединения: сигнал о закрытии прошлого соединения не должен оборвать новое
+        queue = self.queue = asyncio.Queue()
+        connection = await asyncpg.connect(self.dsn)
+        try:
+            connection.add_termination_listener(lambda _: queue.put_nowait(None))
+            await connection.add_listener(CHANNEL, self._on_notification)
+            if self.on_connect is not None:
+                await self.on_connect()
+            self.connected.set()
+            await self._consume(queue)
+        finally:
+            self.connected.clear()
+            await connection.close()
+
+    async def _consume(self, queue: asyncio.Queue) -> None:
+        while True:
+            if not self.pending:
+                ids = await queue.get()
+                if ids is None:
+                    log.warning("Connection listening for %s is lost", CHANNEL)
+                    return
+                self.pending.update(UUID(id) for id in ids)
+
+            # Накопившиеся уведомления обрабатываются одним вызовом
+            while not queue.empty():
+                ids = queue.get_nowait()
+                if ids is None:
+                    queue.put_nowait(None)
+                    break
+                self.pending.update(UUID(id) for id in ids)
+
+            # Если обработчик упал, идентификаторы остаются в pending, а исключение приводит к переподключению
+            await self.on_change(set(self.pending))
+            self.pending.clear()
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        message = json.loads(payload)
+        if message["source"] != self.source:
+            self.queue.put_nowait(message["ids"])
@@ -0,0 +1,196 @@
+"""
+Фоновое удаление мягко удаленных юнитов и старых записей журнала изменений.
+
+Удаление большой категории каскадно удаляет миллионы строк price_updates. В режиме мягкого удаления DELETE лишь
+помечает поддерево, а эта задача вычищает историю цен и сами юниты небольшими порциями, каждую — в отдельной короткой
+транзакции, делая паузы между порциями, чтобы не мешать пишущим запросам. Так же, порциями, вычищаются записи
+unit_changes и надгробия unit_tombstones старше срока хранения.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session, sessionmaker
+
+from .core import (
+    ANALYZER_CHANGES_RETENTION_HOURS,
+    ANALYZER_PURGE_BATCH_SIZE,
+    ANALYZER_PURGE_DELAY,
+    ANALYZER_SOFT_DELETE,
+    ANALYZER_TOMBSTONES_RETENTION_HOURS,
+    SessionLocal,
+)
+from .schema import PriceUpdate, ShopUnit, TombstoneHorizon, UnitChange, UnitTombstone
+
+log = logging.getLogger(__name__)
+
+# Пауза перед следующей проверкой, если вычищать нечего
+IDLE_DELAY = 5.0
+
+
+async def purge_batch(session: Session, batch_size: int = ANALYZER_PURGE_BATCH_SIZE) -> int:
+    """
+    Удаляет одну порцию строк и возвращает количество удаленных строк (0 — если вычищать больше нечего).
+    """
+    deleted_units = select(ShopUnit.id).where(ShopUnit.deleted)
+
+    # Сначала история цен: ее может быть на порядки больше, чем самих юнитов, поэтому каскад при удалении юнитов
+    # не должен до нее доходить
+    history = select(PriceUpdate.id).where(PriceUpdate.unit_id.in_(deleted_units)).limit(batch_size)
+    result = await session.execute(
+        delete(PriceUpdate).where(PriceUpdate.id.in_(history)).execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    if result.rowcount:
+        return result.rowcount
+
+    # CategoryInfo удаляется каскадно — по одной строке на категорию
+    result = await session.execute(
+        delete(ShopUnit)
+        .where(ShopUnit.id.in_(deleted_units.limit(batch_size)))
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount
+
+
+async def purge(session: Session, batch_size: int = ANALYZER_PURGE_BATCH_SIZE, delay: float = 0) -> int:
+    total = 0
+    while True:
+        purged = await purge_batch(session, batch_size)
+        if not purged:
+            return total
+        total += purged
+        await asyncio.sleep(delay)
+
+
+async def prune_changes(
+    session: Session, retention: timedelta, batch_size: int = ANALYZER_PURGE_BATCH_SIZE, delay: float = 0
+) -> int:
+    """
+    Удаляет записи журнала изменений старше retention и возвращает их количество. Последняя запись журнала не
+    удаляется никогда: по ней читатели отличают вычищенный журнал от пустого (см. DAL.get_changes_horizon).
+    """
+    newest = select(func.max(UnitChange.id)).scalar_subquery()
+    expired = (
+        select(UnitChange.id)
+        .where(UnitChange.created_at < func.now() - retention, UnitChange.id < newest)
+        .order_by(UnitChange.id)
+        .limit(batch_size)
+    )
+    total = 0
+    while True:
+        result = await session.execute(
+            delete(UnitChange).where(UnitChange.id.in_(expired)).execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        if not result.rowcount:
+            return total
+        total += result.rowcount
+        await asyncio.sleep(delay)
+
+
+async def prune_tombstones(
+    session: Session, retention: timedelta, batch_size: int = ANALYZER_PURGE_BATCH_SIZE, delay: float = 0
+) -> int:
+    """
+    Удаляет надгробия старше retention и возвращает их количество. Вместе с каждой порцией сдвигается граница
+    вычищенных надгробий: по ней /nodes/{id}?since=... отличает вычищенные удаления от отсутствующих
+    (см. DAL.get_node_delta).
+    """
+    expired = (
+        select(UnitTombstone.id)
+        .where(UnitTombstone.created_at < func.now() - retention)
+        .order_by(UnitTombstone.created_at)
+        .limit(batch_size)
+    )
+    total = 0
+    while True:
+        result = await session.execute(
+            delete(UnitTombstone)
+            .where(UnitTombstone.id.in_(expired))
+            .returning(UnitTombstone.deleted_at)
+            .execution_options(synchronize_session=False)
+        )
+        dates = result.scalars().all()
+        if dates:
+            statement = pg_insert(TombstoneHorizon).values(deleted_at=max(dates))
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[TombstoneHorizon.id],
+                    set_={"deleted_at": func.greatest(TombstoneHorizon.deleted_at, statement.excluded.deleted_at)},
+                )
+            )
+        await session.commit()
+        if not dates:
+            return total
+        total += len(dates)
+        await asyncio.sleep(delay)
+
+
+def retention_hours(hours: float) -> Optional[timedelta]:
+    return timedelta(hours=hours) if hours > 0 else None
+
+
+class Purger:
+    def __init__(
+        self,
+        session_factory: sessionmaker = SessionLocal,
+        batch_size: int = ANALYZER_PURGE_BATCH_SIZE,
+        delay: float = ANALYZER_PURGE_DELAY,
+        soft_delete: bool = ANALYZER_SOFT_DELETE,
+        changes_retention: Optional[timedelta] = retention_hours(ANALYZER_CHANGES_RETENTION_HOURS),
+        tombstones_retention: Optional[timedelta] = retention_hours(ANALYZER_TOMBSTONES_RETENTION_HOURS),
+    ) -> Purger:
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.delay = delay
+        self.soft_delete = soft_delete
+        self.changes_retention = changes_retention
+        self.tombstones_retention = tombstones_retention
+
+    @property
+    def enabled(self) -> bool:
+        return self.soft_delete or self.changes_retention is not None or self.tombstones_retention is not None
+
+    async def run(self) -> None:
+        while True:
+            if self.soft_delete:
+                try:
+                    async with self.session_factory() as session:
+                        purged = await purge(session, self.batch_size, self.delay)
+                    if purged:
+                        log.info("Purged %d soft deleted rows", purged)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("Failed to purge soft deleted rows")
+
+            if self.changes_retention is not None:
+                try:
+                    async with self.session_factory() as session:
+                        pruned = await prune_changes(session, self.changes_retention, self.batch_size, self.delay)
+                    if pruned:
+                        log.info("Pruned %d expired unit changes", pruned)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("Failed to prune unit changes")
+
+            if self.tombstones_retention is not None:
+                try:
+                    async with self.session_factory() as session:
+                        pruned = await prune_tombstones(session, self.tombstones_retention, self.batch_size, self.delay)
+                    if pruned:
+                        log.info("Pruned %d expired unit tombstones", pruned)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("Failed to prune unit tombstones")
+            await asyncio.sleep(IDLE_DELAY)
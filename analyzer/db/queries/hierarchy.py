@@ -1,60 +1,90 @@
 from __future__ import annotations
 
-from enum import Enum, auto
+from typing import Set
+from uuid import UUID
 
-from sqlalchemy import delete
-from sqlalchemy.future import select
+from prometheus_client import Histogram
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
 
-from analyzer.db.schema import ShopUnit, UnitHierarchy
-from analyzer.utils.database import BatchInserter
-
-
-class HierarchyUpdateType(Enum):
-    BUILD = auto()
-    DELETE = auto()
-
-
-class HierarchyUpdate:
-    def __init__(self, type: HierarchyUpdateType, unit: ShopUnit) -> HierarchyUpdate:
-        self.type = type
-        self.unit_id = unit.id
-        self.parent_id = unit.parent_id
-
-    async def execute(self, session: Session) -> None:
-        if self.type == HierarchyUpdateType.BUILD:
-            await self._build(session)
-        else:
-            await self._delete(session)
-
-    async def _build(self, session: Session) -> None:
-        ident, parent_id = self.unit_id, self.parent_id
-        batch_inserter = BatchInserter()
-        batch_inserter.add(UnitHierarchy, {"parent_id": parent_id, "id": ident})
-
-        # Итеративно получаем всех родителей категории с unit_id == ident
-        while True:
-            q = await session.scalars(select(ShopUnit.parent_id).where(ShopUnit.id == parent_id))
-            parent_id = q.one_or_none()
-
-            if parent_id is None:
-                break
-
-            batch_inserter.add(UnitHierarchy, {"parent_id": parent_id, "id": ident})
-
-        await batch_inserter.execute(session)
-
-    async def _delete(self, session: Session) -> None:
-        await session.execute(delete(UnitHierarchy).where(UnitHierarchy.id == self.unit_id))
+from analyzer.utils.instrumentation import instrumented
+from analyzer.utils.tracing import set_attribute
+
+HIERARCHY_DEPTH = Histogram(
+    "analyzer_hierarchy_depth",
+    "Глубина созданных и перенесенных юнитов, чьи пути пересчитываются",
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 200, 500),
+)
+
+UUID_ARRAY = bindparam("ids", type_=postgresql.ARRAY(postgresql.UUID(as_uuid=True)))
+
+# Пересчитывает материализованные пути юнитов :ids и всех их потомков. Потомки находятся по старым путям (перенос
+# юнита не меняет состав его поддерева), а новые пути собираются подъемом по parent_id, поэтому результат не зависит
+# от порядка, в котором юниты и их родители были созданы или перенесены. Возвращает новые глубины самих юнитов :ids
+UPDATE_PATHS = text(
+    """
+    WITH RECURSIVE affected AS (
+        SELECT id FROM shop_units WHERE id = ANY(:ids) OR path && :ids
+    ), ancestors(id, ancestor_id, level) AS (
+        SELECT unit.id, unit.parent_id, 1
+        FROM shop_units unit JOIN affected ON affected.id = unit.id
+        WHERE unit.parent_id IS NOT NULL
+        UNION ALL
+        SELECT ancestors.id, parent.parent_id, ancestors.level + 1
+        FROM ancestors JOIN shop_units parent ON parent.id = ancestors.ancestor_id
+        WHERE parent.parent_id IS NOT NULL
+    ), paths AS (
+        SELECT
+            affected.id,
+            COALESCE(
+                array_agg(ancestors.ancestor_id ORDER BY ancestors.level DESC)
+                FILTER (WHERE ancestors.ancestor_id IS NOT NULL),
+                '{}'
+            ) AS path
+        FROM affected LEFT JOIN ancestors ON ancestors.id = affected.id
+        GROUP BY affected.id
+    ), updated AS (
+        UPDATE shop_units SET path = paths.path, depth = cardinality(paths.path)
+        FROM paths WHERE shop_units.id = paths.id
+        RETURNING shop_units.id, shop_units.depth
+    )
+    SELECT depth FROM updated WHERE id = ANY(:ids)
+    """
+).bindparams(UUID_ARRAY)
+
+# Строки units_hierarchy категорий, чьи пути пересчитаны, разворачиваются из новых путей одним запросом — как при
+# массовой загрузке (analyzer.db.loader). Старые строки удаляются в том же запросе: изменяющий CTE и основной запрос
+# видят один снимок, поэтому вставленные строки не удаляются
+UPDATE_HIERARCHY = text(
+    """
+    WITH affected AS (
+        SELECT id, path FROM shop_units WHERE is_category AND (id = ANY(:ids) OR path && :ids)
+    ), removed AS (
+        DELETE FROM units_hierarchy WHERE id IN (SELECT id FROM affected)
+    )
+    INSERT INTO units_hierarchy (parent_id, id) SELECT unnest(path), id FROM affected
+    """
+).bindparams(UUID_ARRAY)
 
 
 class HierarchyUpdateQuery:
     def __init__(self) -> HierarchyUpdateQuery:
-        self.updates = []
+        self.path_updates: Set[UUID] = set()
 
-    def add(self, update: HierarchyUpdate) -> None:
-        self.updates.append(update)
+    def add_path_update(self, unit_id: UUID) -> None:
+        # Юнит создан с родителем или перенесен: его путь и пути всех его потомков пересчитываются одним запросом
+        self.path_updates.add(unit_id)
 
+    @instrumented
     async def execute(self, session: Session) -> None:
-        for update in self.updates:
-            await update.execute(session)
+        set_attribute("path_updates", len(self.path_updates))
+        if not self.path_updates:
+            return
+
+        ids = list(self.path_updates)
+        depths = (await session.scalars(UPDATE_PATHS, {"ids": ids})).all()
+        for depth in depths:
+            HIERARCHY_DEPTH.observe(depth)
+        set_attribute("ancestors", sum(depths))
+        await session.execute(UPDATE_HIERARCHY, {"ids": ids})
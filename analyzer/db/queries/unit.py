@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from enum import Enum, auto
 from typing import Dict, List, Optional, Set, Union
+from uuid import UUID
 
 from sqlalchemy import bindparam, func, update
 from sqlalchemy.orm import Session
@@ -10,12 +11,14 @@ from sqlalchemy.orm import Session
 from analyzer.db import schema
 from analyzer.db.schema import CategoryInfo, ShopUnit
 from analyzer.utils.database import BatchInserter
+from analyzer.utils.instrumentation import instrumented
 from analyzer.utils.misc import flatten
+from analyzer.utils.tracing import set_attribute
 
 
 # Вспомогательный класс для накопления значений, соответствующих key, в списках
 class PriceUpdates(dict):
-    def __getitem__(self, key: str) -> List[ShopUnit]:
+    def __getitem__(self, key: UUID) -> List[ShopUnit]:
         if key not in self:
             super().__setitem__(key, list())
         return super().__getitem__(key)
@@ -66,10 +69,16 @@ class DateUpdate:
 
 class UnitUpdateQuery:
     def __init__(self) -> UnitUpdateQuery:
-        self.date_updates: Set[str] = set()
+        self.date_updates: Set[UUID] = set()
         self.price_updates: PriceUpdates = PriceUpdates()
+        # Юниты, которые запрос создает, изменяет или удаляет. При выполнении сюда добавляются и все предки,
+        # у которых изменились цена или дата обновления, — из этого набора пишется журнал изменений
+        self.changed_ids: Set[UUID] = set()
 
-    def add(self, category_id: Optional[str], update: Union[PriceUpdate, DateUpdate]):
+    def add_changed(self, unit_id: UUID) -> None:
+        self.changed_ids.add(unit_id)
+
+    def add(self, category_id: Optional[UUID], update: Union[PriceUpdate, DateUpdate]):
         # category_id может быть передано пустое, в данном случае мы его просто отбрасываем
         if category_id is None:
             return
@@ -81,12 +90,18 @@ class UnitUpdateQuery:
         else:
             self.date_updates.add(category_id)
 
-    def get_updating_ids(self) -> Set[str]:
+    def get_updating_ids(self) -> Set[UUID]:
         return set(list(self.date_updates) + list(self.price_updates.keys()))
 
+    def get_changed_ids(self) -> Set[UUID]:
+        return self.changed_ids | self.get_updating_ids()
+
+    @instrumented
     async def execute(
-        self, session: Session, parents: Dict[str, List[str]], update_date: Optional[datetime] = None
+        self, session: Session, parents: Dict[UUID, List[UUID]], update_date: Optional[datetime] = None
     ) -> None:
+        set_attribute("date_updates", len(self.date_updates))
+        set_attribute("price_updates", len(self.price_updates))
         if update_date:
             await self._execute_date_updates(session, parents, update_date)
             await self._execute_price_updates(session, parents, update_date)
@@ -94,22 +109,24 @@ class UnitUpdateQuery:
             await self._execute_price_updates(session, parents)
 
     async def _execute_date_updates(
-        self, session: Session, parents: Dict[str, List[str]], update_date: datetime
+        self, session: Session, parents: Dict[UUID, List[UUID]], update_date: datetime
     ) -> None:
         if not self.date_updates:
             return
 
         # Обновляем last_update у всех родителей
         all_parents = set(flatten([[key] + parents[key] for key in self.date_updates]))
+        self.changed_ids.update(all_parents)
         await session.execute(update(ShopUnit).where(ShopUnit.id.in_(all_parents)).values(last_update=update_date))
 
     async def _execute_price_updates(
-        self, session: Session, parents: Dict[str, List[str]], update_date: Optional[datetime] = None
+        self, session: Session, parents: Dict[UUID, List[UUID]], update_date: Optional[datetime] = None
     ) -> None:
         if not self.price_updates:
             return
 
         all_parents_ids = set(flatten([[key] + parents[key] for key in self.price_updates.keys()]))
+        self.changed_ids.update(all_parents_ids)
         total_sum_diff = {}
         total_count_diff = {}
 
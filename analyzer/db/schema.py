@@ -1,6 +1,8 @@
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import CheckConstraint, Column, ForeignKey, Index, func
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.orm import backref, relationship
-from sqlalchemy.types import TIMESTAMP, Boolean, Integer, String
+from sqlalchemy.sql import expression
+from sqlalchemy.types import TIMESTAMP, BigInteger, Boolean, Integer, String
 
 from analyzer.api import schema
 
@@ -10,21 +12,35 @@ from .core import Base
 class ShopUnit(Base):
     __tablename__ = "shop_units"
 
-    id = Column(String, primary_key=True, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, index=True)
     name = Column(String, nullable=False)
-    parent_id = Column(String, index=True)
+    parent_id = Column(UUID(as_uuid=True), index=True)
 
     price = Column(Integer)
     is_category = Column(Boolean)
 
-    last_update = Column(type_=TIMESTAMP(timezone=True))
+    last_update = Column(type_=TIMESTAMP(timezone=True), index=True)
+
+    # Материализованный путь: идентификаторы всех предков от корня к родителю и глубина юнита. Предки читаются
+    # из одной строки, а поддерево находится одним сканированием GIN-индекса (path && ARRAY[id])
+    path = Column(ARRAY(UUID(as_uuid=True)), nullable=False, server_default="{}")
+    depth = Column(Integer, nullable=False, server_default="0")
+
+    # Мягкое удаление: юнит сразу исчезает из чтений и агрегатов, а физически удаляется фоновой задачей
+    deleted = Column(Boolean, nullable=False, default=False, server_default=expression.false())
+
+    # Частичный индекс по еще не вычищенным юнитам для фоновой задачи удаления
+    __table_args__ = (
+        Index("ix__shop_units__deleted", "id", postgresql_where=deleted),
+        Index("ix__shop_units__path", path, postgresql_using="gin"),
+    )
 
     @staticmethod
     def from_model(model: schema.ShopUnit, last_update: int):
         return ShopUnit(
-            id=str(model.id),
+            id=model.id,
             name=model.name,
-            parent_id=str(model.parentId) if model.parentId else None,
+            parent_id=model.parentId,
             price=model.price,
             is_category=model.type == schema.ShopUnitType.CATEGORY,
             last_update=last_update,
@@ -36,7 +52,7 @@ class PriceUpdate(Base):
 
     id = Column(Integer, primary_key=True, index=True)
 
-    unit_id = Column(String, ForeignKey("shop_units.id", ondelete="CASCADE"), index=True)
+    unit_id = Column(UUID(as_uuid=True), ForeignKey("shop_units.id", ondelete="CASCADE"), index=True)
     unit = relationship("ShopUnit", backref=backref("price_updates", passive_deletes=True))
 
     price = Column(Integer)
@@ -48,19 +64,76 @@ class UnitHierarchy(Base):
 
     __tablename__ = "units_hierarchy"
 
-    parent_id = Column(String, primary_key=True, index=True, nullable=False)
-    id = Column(String, primary_key=True, index=True, nullable=False)
+    parent_id = Column(UUID(as_uuid=True), primary_key=True, index=True, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, index=True, nullable=False)
 
 
 class CategoryInfo(Base):
     __tablename__ = "category_info"
 
-    id = Column(String, ForeignKey("shop_units.id", ondelete="CASCADE"), primary_key=True, index=True, nullable=False)
+    id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("shop_units.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+        nullable=False,
+    )
     id_rel = relationship("ShopUnit", passive_deletes=True)
 
-    sum = Column(Integer, nullable=False)
+    # Сумма цен всех товаров поддерева: у больших каталогов она выходит за пределы int4
+    sum = Column(BigInteger, nullable=False)
     count = Column(Integer, nullable=False)
 
     # Дубликация поля date у ShopUnit. Больше информации, почему это надо — issue#37
     # Brief: позволяет оптимизировать один select запрос при удалении юнита
     last_update = Column(type_=TIMESTAMP(timezone=True))
+
+
+class UnitChange(Base):
+    """
+    Журнал изменений: по записи на каждый юнит, который запрос создал, изменил или удалил. Порядковый номер записи
+    служит водяным знаком для процессов, догоняющих базу данных (см. analyzer.db.snapshot). Номера выдаются в порядке
+    фиксации транзакций (см. DAL.record_changes), поэтому записи с меньшими номерами не появляются после больших.
+    Записи старше ANALYZER_CHANGES_RETENTION_HOURS вычищаются фоновой задачей (см. analyzer.db.purger)
+    """
+
+    __tablename__ = "unit_changes"
+
+    id = Column(BigInteger, primary_key=True)
+    unit_id = Column(UUID(as_uuid=True), nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+
+class UnitTombstone(Base):
+    """
+    Надгробия удаленных юнитов для выдачи изменений /nodes/{id}?since=... Хранятся только корни удаленных поддеревьев:
+    надгробие категории означает удаление всего ее поддерева. Перенесенный юнит тоже получает надгробие со старым путем:
+    из поддеревьев прежних предков он удален. Надгробия старше ANALYZER_TOMBSTONES_RETENTION_HOURS вычищаются фоновой
+    задачей (см. analyzer.db.purger)
+    """
+
+    __tablename__ = "unit_tombstones"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    # Предки юнита на момент удаления или переноса, как в ShopUnit.path
+    path = Column(ARRAY(UUID(as_uuid=True)), nullable=False)
+    # Дата удаления или переноса в тех же часах, что и ShopUnit.last_update, — датах клиента, с которыми сравнивается
+    # since. Время сервера хранится отдельно и нужно только для срока хранения
+    deleted_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+    __table_args__ = (Index("ix__unit_tombstones__path", path, postgresql_using="gin"),)
+
+
+class TombstoneHorizon(Base):
+    """
+    Граница вычищенных надгробий — единственная строка с наибольшей датой deleted_at среди них. Изменения после since
+    раньше этой даты восстановить уже нельзя
+    """
+
+    __tablename__ = "tombstone_horizon"
+
+    id = Column(Boolean, primary_key=True, server_default=expression.true())
+    deleted_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (CheckConstraint(id, name="single_row"),)
@@ -0,0 +1,143 @@
+"""
+Журнал медленных запросов к базе данных.
+
+SlowQueryLog подписывается на запросы, измеренные общим слушателем событий движков SQLAlchemy
+(см. analyzer.utils.instrumentation), и пишет в журнал analyzer.db.slowlog запросы,
+выполнявшиеся дольше порога: текст запроса, форму параметров (типы и длины списков, но не сами значения), метод DAL,
+из которого запрос выполнен, и маршрут HTTP-запроса. Доля записываемых запросов задается sample_rate, чтобы журнал
+можно было держать включенным под нагрузкой.
+
+С explain=True для записанных SELECT-запросов дополнительно снимается план EXPLAIN (ANALYZE, BUFFERS). Запрос
+выполняется повторно в отдельном потоке через отдельное синхронное соединение и откатывается, поэтому не задерживает
+исходный запрос и не занимает цикл событий. Одновременно снимается не больше одного плана, лишние пропускаются.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from random import random
+from threading import Lock
+from typing import Any, Dict, Optional, Sequence
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.pool import NullPool
+
+from analyzer.utils.instrumentation import add_observer, get_source, remove_observer
+from analyzer.utils.timing import get_timings
+
+from .core import (
+    ANALYZER_SLOW_QUERY_EXPLAIN,
+    ANALYZER_SLOW_QUERY_MS,
+    ANALYZER_SLOW_QUERY_SAMPLE_RATE,
+)
+
+log = logging.getLogger(__name__)
+
+# Длина текста запроса в журнале: запросы с длинными списками в IN могут занимать мегабайты
+MAX_STATEMENT_LENGTH = 4096
+
+
+def parameter_shape(value: Any) -> str:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        types = {type(item).__name__ for item in value}
+        item_type = types.pop() if len(types) == 1 else "any"
+        return f"{item_type}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameters_shape(parameters: Any, executemany: bool) -> Any:
+    if executemany:
+        parameters = list(parameters)
+        return {"rows": len(parameters), "row": parameters_shape(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {name: parameter_shape(value) for name, value in parameters.items()}
+    return [parameter_shape(value) for value in parameters or ()]
+
+
+def is_select(statement: str) -> bool:
+    # EXPLAIN ANALYZE выполняет запрос, поэтому планы снимаются только с чтений
+    return statement.lstrip()[:6].upper() == "SELECT"
+
+
+class SlowQueryLog:
+    def __init__(
+        self,
+        threshold: float = (ANALYZER_SLOW_QUERY_MS or 0) / 1000,
+        sample_rate: float = ANALYZER_SLOW_QUERY_SAMPLE_RATE,
+        explain: bool = ANALYZER_SLOW_QUERY_EXPLAIN,
+    ) -> SlowQueryLog:
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.explain = explain
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.explaining = False
+        self.lock = Lock()
+        # Синхронные движки для EXPLAIN по адресу базы
+        self.engines: Dict[URL, Engine] = {}
+
+    def install(self) -> None:
+        add_observer(self.observe)
+
+    def close(self) -> None:
+        remove_observer(self.observe)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        for engine in self.engines.values():
+            engine.dispose()
+
+    def observe(self, conn, statement: str, parameters: Any, executemany: bool, duration: float) -> None:
+        if conn.info.get("explain"):
+            return
+        if duration < self.threshold or (self.sample_rate < 1 and random() >= self.sample_rate):
+            return
+
+        timings = get_timings()
+        record = {
+            "duration_ms": round(duration * 1000, 3),
+            "source": get_source(),
+            "route": timings.route if timings is not None else None,
+            "statement": statement[:MAX_STATEMENT_LENGTH],
+            "parameters": parameters_shape(parameters, executemany),
+        }
+        log.warning(json.dumps(record, ensure_ascii=False))
+
+        if self.explain and not executemany and is_select(statement):
+            self._submit_explain(conn.engine.url, statement, parameters, record)
+
+    def _submit_explain(self, url: URL, statement: str, parameters: Sequence, record: Dict) -> None:
+        with self.lock:
+            if self.explaining:
+                return
+            self.explaining = True
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(1, thread_name_prefix="explain")
+        self.executor.submit(self._explain, url, statement, parameters, record)
+
+    def _explain(self, url: URL, statement: str, parameters: Sequence, record: Dict) -> None:
+        try:
+            # Асинхронный драйвер заменяется синхронным psycopg2 с тем же (format) стилем параметров
+            url = url.set(drivername="postgresql+psycopg2")
+            if url not in self.engines:
+                self.engines[url] = create_engine(url, poolclass=NullPool, future=True)
+            with self.engines[url].connect() as conn:
+                # Запросы самого EXPLAIN не журналируются
+                conn.info["explain"] = True
+                # Соединение закрывается без commit: изменения, если бы запрос их делал, откатываются
+                rows = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", tuple(parameters)).all()
+            log.warning(
+                json.dumps(
+                    {
+                        "source": record["source"],
+                        "statement": record["statement"],
+                        "plan": "\n".join(row[0] for row in rows),
+                    },
+                    ensure_ascii=False,
+                )
+            )
+        except Exception:
+            log.exception("Failed to explain slow query")
+        finally:
+            with self.lock:
+                self.explaining = False
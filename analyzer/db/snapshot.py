@@ -0,0 +1,173 @@
+"""
+Бинарный снимок каталога (analyzer.db.catalog) для быстрого холодного старта рабочих процессов.
+
+Снимок пишется командой `analyzer-db snapshot` из одного снимка базы данных. Рабочие процессы отображают файл в память
+с копированием при записи: числовые колонки каталога работают прямо поверх страниц файла, поэтому процессы одного хоста
+делят эти страницы, пока не изменят их. Индекс идентификаторов, имена и списки детей собираются из файла в каждом
+процессе без обращения к базе данных. Затем каталог догоняет базу по журналу изменений, начиная с водяного знака снимка.
+
+Формат: заголовок HEADER, затем колонки, каждая выровнена по 8 байт: ids (16 байт на юнит), parents (int64),
+prices (int64), dates (float64), categories (uint8), смещения имен (int64, count + 1) и сами имена в UTF-8. Колонки
+записываются в порядке байтов хоста. Индексы с нулевым идентификатором свободны, часть из них резервируется заранее,
+чтобы новые юниты не заставляли процесс копировать отображенные колонки.
+"""
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+from array import array
+from itertools import accumulate
+from typing import List, Optional
+from uuid import UUID
+
+from psycopg2.extras import register_uuid
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from analyzer.utils.database import make_raw_connection
+
+from .catalog import NO_PARENT, NO_PRICE, Catalog
+from .export import EXPORT_BATCH_SIZE, LIVE_UNITS_QUERY
+from .schema import ShopUnit
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"ANLZCAT1"
+# magic, количество индексов, водяной знак журнала изменений, размер блока имен
+HEADER = struct.Struct("<8sQQQ")
+NIL_ID = bytes(16)
+
+# Доля (и минимум) свободных индексов, резервируемых в снимке под новые юниты
+SNAPSHOT_SLACK = 0.125
+SNAPSHOT_MIN_SLACK = 1024
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+def padding(size: int) -> bytes:
+    return bytes(-size % 8)
+
+
+def write_snapshot(catalog: Catalog, path: str) -> None:
+    """
+    Записывает каталог в path. Файл подменяется атомарно: процессы, отобразившие старый снимок, работают с ним.
+    """
+    slack = max(SNAPSHOT_MIN_SLACK, int(len(catalog.ids) * SNAPSHOT_SLACK))
+    count = len(catalog.ids) + slack
+
+    names = [name.encode() if name is not None else b"" for name in catalog.names]
+    name_offsets = array("q", accumulate((len(name) for name in names), initial=0))
+    name_offsets.extend([name_offsets[-1]] * slack)
+    names = b"".join(names)
+
+    columns = [
+        b"".join(id.bytes if id is not None else NIL_ID for id in catalog.ids) + NIL_ID * slack,
+        bytes(catalog.parents) + bytes(array("q", [NO_PARENT] * slack)),
+        bytes(catalog.prices) + bytes(array("q", [NO_PRICE] * slack)),
+        bytes(catalog.dates) + bytes(array("d", [0.0] * slack)),
+        bytes(catalog.categories) + bytes(slack),
+        bytes(name_offsets),
+        names,
+    ]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, catalog.watermark, len(names)))
+        for column in columns:
+            f.write(column)
+            f.write(padding(len(column)))
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Catalog:
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    view = memoryview(mapping)
+    magic, count, watermark, names_size = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise SnapshotError(f"{path} is not a catalog snapshot")
+
+    offset = HEADER.size
+
+    def column(size: int) -> memoryview:
+        nonlocal offset
+        data = view[offset : offset + size]
+        offset += size + len(padding(size))
+        return data
+
+    ids = bytes(column(16 * count))
+    catalog = Catalog()
+    catalog.watermark = watermark
+    catalog.parents = column(8 * count).cast("q")
+    catalog.prices = column(8 * count).cast("q")
+    catalog.dates = column(8 * count).cast("d")
+    catalog.categories = column(count)
+    name_offsets = column(8 * (count + 1)).cast("q")
+    names = bytes(column(names_size))
+
+    children: List[Optional[List[int]]] = []
+    for i in range(count):
+        raw_id = ids[16 * i : 16 * (i + 1)]
+        if raw_id == NIL_ID:
+            catalog.ids.append(None)
+            catalog.names.append(None)
+            catalog.free.append(i)
+            children.append(None)
+            continue
+
+        id = UUID(bytes=raw_id)
+        catalog.index[id] = i
+        catalog.ids.append(id)
+        catalog.names.append(names[name_offsets[i] : name_offsets[i + 1]].decode())
+        children.append([] if catalog.categories[i] else None)
+
+    for i, parent in enumerate(catalog.parents):
+        if parent != NO_PARENT and catalog.ids[i] is not None:
+            children[parent].append(i)
+    catalog.children = children
+    return catalog
+
+
+async def open_catalog(session: Session, path: Optional[str] = None) -> Catalog:
+    """
+    Открывает каталог из снимка и догоняет базу данных по журналу изменений, а если снимка нет — загружает из базы.
+    """
+    if path and os.path.exists(path):
+        catalog = read_snapshot(path)
+        await catalog.replay(session)
+        log.info("Catalog is mapped from %s, %d units", path, len(catalog))
+    else:
+        catalog = await Catalog.load(session)
+        log.info("Catalog is loaded from database, %d units", len(catalog))
+    return catalog
+
+
+def snapshot(pg_url: str, path: str) -> None:
+    """
+    Строит каталог из одного снимка базы данных и записывает его в path.
+    """
+    connection = make_raw_connection(pg_url)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM unit_changes")
+            catalog = Catalog()
+            catalog.watermark = cursor.fetchone()[0]
+
+        query = LIVE_UNITS_QUERY.order_by(ShopUnit.depth)
+        with connection.cursor(name="analyzer_snapshot") as cursor:
+            cursor.itersize = EXPORT_BATCH_SIZE
+            register_uuid(conn_or_curs=cursor)
+            cursor.execute(str(query.compile(dialect=postgresql.dialect())))
+            catalog.update(cursor)
+        connection.commit()
+    finally:
+        connection.close()
+
+    write_snapshot(catalog, path)
+    log.info("Snapshot of %d units is written to %s (watermark %d)", len(catalog), path, catalog.watermark)
@@ -3,13 +3,21 @@ from __future__ import annotations
 import os
 from pathlib import Path
 from types import SimpleNamespace
-from typing import Union
+from typing import TYPE_CHECKING, Optional, Union
 
 from alembic.config import Config
-from sqlalchemy import insert
+from fastapi import Request
+from sqlalchemy import create_engine, insert
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
 
 from analyzer.db.core import SessionLocal
+from analyzer.utils.instrumentation import instrumented
+from analyzer.utils.tracing import set_attribute
+
+if TYPE_CHECKING:
+    from analyzer.api.render import Renderer
+    from analyzer.db.catalog import Catalog
 
 PROJECT_PATH = Path(__file__).parent.parent.resolve()
 
@@ -36,11 +44,28 @@ def make_alembic_config(cmd_opts: Union[SimpleNamespace], base_path: str = PROJE
     return config
 
 
+def make_raw_connection(pg_url: str):
+    """
+    Создает DBAPI-соединение psycopg2 (для COPY и именованных курсоров) по URL в формате sqlalchemy.
+    """
+    return create_engine(pg_url, poolclass=NullPool).raw_connection()
+
+
 async def get_session() -> Session:
     async with SessionLocal() as session:
         yield session
 
 
+def get_catalog(request: Request) -> Optional[Catalog]:
+    # Каталог загружается при старте приложения, если он включен; иначе чтения идут в базу данных
+    return getattr(request.app.state, "catalog", None)
+
+
+def get_renderer(request: Request) -> Optional[Renderer]:
+    # Пул для сборки больших поддеревьев создается при старте приложения, если он настроен
+    return getattr(request.app.state, "renderer", None)
+
+
 class BatchInserter:
     def __init__(self):
         self.values = dict()
@@ -51,7 +76,9 @@ class BatchInserter:
             self.values[model] = []
         self.values[model].append(values)
 
+    @instrumented
     async def execute(self, session: Session):
+        set_attribute("rows", sum(map(len, self.values.values())))
         # Для каждой модели осуществляем вставку всех новых объектов
         for model, values in self.values.items():
             await session.execute(insert(model).values(values))
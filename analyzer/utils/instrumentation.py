@@ -0,0 +1,96 @@
+"""
+Единая точка учета запросов к базе данных.
+
+Одна пара слушателей событий before/after_cursor_execute на всех движках SQLAlchemy измеряет каждый запрос и отдает
+его длительность учету времени HTTP-запроса (analyzer.utils.timing), счетчику запросов текущего спана трассировки
+(analyzer.utils.tracing) и подписчикам вроде журнала медленных запросов (analyzer.db.slowlog).
+
+Декоратор instrumented помечает корутину как источник запросов к базе: на время ее выполнения имя Класс.метод
+становится текущим источником, а при включенной трассировке корутина выполняется в спане с тем же именем.
+"""
+from __future__ import annotations
+
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from analyzer.utils import tracing
+from analyzer.utils.timing import get_timings
+
+# Метод DAL (или запроса обновления), выполняющий запросы к базе в текущем контексте
+_source: ContextVar[Optional[str]] = ContextVar("source", default=None)
+
+# Подписчики на выполненные запросы: (соединение, текст, параметры, executemany, длительность)
+StatementObserver = Callable[[Any, str, Any, bool, float], None]
+_observers: List[StatementObserver] = []
+
+
+def get_source() -> Optional[str]:
+    return _source.get()
+
+
+def instrumented(method: Callable) -> Callable:
+    """
+    Декоратор корутины: ее запросы к базе относятся к источнику Класс.метод и попадают в спан с тем же именем.
+    """
+    name = method.__qualname__
+
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = _source.set(name)
+        try:
+            if not tracing.is_enabled():
+                return await method(*args, **kwargs)
+            with tracing.span(name):
+                return await method(*args, **kwargs)
+        finally:
+            _source.reset(token)
+
+    return wrapper
+
+
+def add_observer(observer: StatementObserver) -> None:
+    instrument_engines()
+    _observers.append(observer)
+
+
+def remove_observer(observer: StatementObserver) -> None:
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("statement_start", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if not conn.info.get("statement_start"):
+        return
+    duration = perf_counter() - conn.info["statement_start"].pop()
+
+    timings = get_timings()
+    if timings is not None:
+        timings.add_statement(duration)
+    tracing.add_statement()
+    for observer in _observers:
+        observer(conn, statement, parameters, executemany, duration)
+
+
+def _handle_error(context) -> None:
+    # После ошибки after_cursor_execute не вызывается, а соединение вернется в пул
+    if context.connection is not None and context.connection.info.get("statement_start"):
+        context.connection.info["statement_start"].pop()
+
+
+def instrument_engines() -> None:
+    """
+    Подписывается на события всех движков SQLAlchemy, в том числе синхронных движков асинхронных сессий.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
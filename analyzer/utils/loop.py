@@ -0,0 +1,79 @@
+"""
+Обнаружение остановок цикла событий.
+
+Синхронная работа в обработчике (валидация большого тела запроса, сборка большого дерева) держит цикл событий, и все
+остальные запросы рабочего процесса ждут ее окончания. LoopMonitor раз в interval секунд засыпает в цикле событий
+и измеряет, насколько позже положенного проснулся: задержки попадают в гистограмму analyzer_event_loop_lag_seconds.
+Отдельный поток-сторож следит за тем же пульсом и, если цикл не отвечает дольше threshold секунд, пишет в журнал
+стек кода, который держит цикл в этот момент, — по одному разу на каждую остановку.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import traceback
+from threading import Event, Thread, get_ident
+from time import perf_counter
+from typing import Optional
+
+from prometheus_client import Counter, Histogram
+
+log = logging.getLogger(__name__)
+
+LOOP_LAG = Histogram(
+    "analyzer_event_loop_lag_seconds",
+    "Задержка пробуждения цикла событий относительно расписания",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+LOOP_STALLS = Counter("analyzer_event_loop_stalls", "Остановки цикла событий дольше порога")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.5) -> LoopMonitor:
+        self.interval = interval
+        self.threshold = threshold
+        self.heartbeat = perf_counter()
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[Thread] = None
+        self.stopped = Event()
+        self.loop_thread: Optional[int] = None
+
+    def start(self) -> None:
+        self.loop_thread = get_ident()
+        self.heartbeat = perf_counter()
+        self.task = asyncio.create_task(self._measure())
+        self.watchdog = Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self.watchdog.start()
+
+    async def stop(self) -> None:
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.watchdog is not None:
+            self.watchdog.join()
+
+    async def _measure(self) -> None:
+        while True:
+            start = perf_counter()
+            await asyncio.sleep(self.interval)
+            self.heartbeat = now = perf_counter()
+            LOOP_LAG.observe(max(now - start - self.interval, 0.0))
+
+    def _watch(self) -> None:
+        reported = None
+        while not self.stopped.wait(self.interval):
+            heartbeat = self.heartbeat
+            blocked = perf_counter() - heartbeat - self.interval
+            if blocked < self.threshold or heartbeat == reported:
+                continue
+
+            reported = heartbeat
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            log.warning("Event loop blocked for more than %.3f s, loop thread stack:\n%s", blocked, stack)
@@ -0,0 +1,9 @@
+"""
+Общие настройки метрик процесса, которые отдает эндпоинт /metrics.
+
+Сами метрики — Counter, Histogram и Gauge из prometheus_client в его реестре по умолчанию. Они хранятся в памяти
+процесса: при запуске нескольких рабочих процессов каждый отдает свои метрики, а суммирует их Prometheus.
+"""
+
+# Интервалы гистограмм, считающих штуки (юниты, запросы к базе), а не секунды
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
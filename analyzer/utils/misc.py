@@ -18,3 +18,4 @@ def remove_prefix(text, prefix):
 # Класс-обертка, устраняющий необходимость в изменении кода, опирающегося на обращение к аттрибутам
 class nameddict(dict):
     __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
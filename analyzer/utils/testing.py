@@ -133,3 +133,30 @@ def generate_shop_unit(is_category: bool, parent_id: Optional[str] = None) -> Di
         "parentId": parent_id if parent_id else None,
         "price": random.randint(100, 1000000) if not is_category else None,
     }
+
+
+def generate_catalog(depth: int, fanout: int, offers: int) -> List[Dict]:
+    """
+    Генерирует каталог: дерево категорий глубины depth, у каждой категории fanout подкатегорий (кроме нижнего уровня)
+    и offers товаров. Юниты идут в порядке обхода в ширину, поэтому родитель всегда импортируется раньше детей.
+    """
+    level = [generate_shop_unit(is_category=True)]
+    categories = list(level)
+    for _ in range(depth - 1):
+        level = [generate_shop_unit(True, category["id"]) for category in level for _ in range(fanout)]
+        categories.extend(level)
+    return categories + [generate_shop_unit(False, category["id"]) for category in categories for _ in range(offers)]
+
+
+def flatten_tree(node: Dict) -> List[Dict]:
+    # Превращает дерево из ответа /nodes в список юнитов без поля children
+    units = [{key: value for key, value in node.items() if key != "children"}]
+    for child in node.get("children") or []:
+        units.extend(flatten_tree(child))
+    return units
+
+
+def write_ndjson(path, records: List[Dict]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -0,0 +1,115 @@
+"""
+Учет времени запроса по фазам и выполненных им SQL-запросов.
+
+TimingMiddleware заводит на каждый HTTP-запрос RequestTimings в контекстной переменной. Код помечает свои фазы
+менеджером phase(); время фазы считается без вложенных фаз, поэтому сумма фаз не превышает длительности запроса.
+Запросы к базе и время их выполнения передает в add_statement() общий слушатель событий движков SQLAlchemy
+(см. analyzer.utils.instrumentation). Вне HTTP-запроса (миграции, загрузчик, фоновые задачи) учет отключен и стоит
+одну проверку контекстной переменной.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional
+
+# Фазы запроса: разбор и валидация входных данных, обработчик, чтения и записи DAL, построение иерархии, пересчет
+# агрегатов (цен и дат категорий), сериализация ответа
+PHASES = ("validation", "handler", "dal", "hierarchy", "aggregates", "serialization")
+
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar("timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self) -> RequestTimings:
+        self.start = perf_counter()
+        self.duration: Optional[float] = None
+        # Шаблон пути маршрута, обработавшего запрос
+        self.route: Optional[str] = None
+        self.statements = 0
+        self.db_time = 0.0
+        self.phases: Dict[str, float] = {}
+        self._stack: List[str] = []
+        self._mark = self.start
+
+    def push(self, name: str) -> None:
+        self._switch()
+        self._stack.append(name)
+
+    def pop(self) -> None:
+        self._switch()
+        self._stack.pop()
+
+    def replace(self, name: str) -> None:
+        # Смена фазы без выхода из вложенности: например, обработчик сменяет валидацию, а сериализация — обработчик
+        self._switch()
+        self._stack[-1] = name
+
+    def finish(self) -> None:
+        if self.duration is None:
+            self.duration = perf_counter() - self.start
+
+    def add_statement(self, duration: float) -> None:
+        self.statements += 1
+        self.db_time += duration
+
+    def server_timing(self) -> str:
+        """
+        Значение заголовка Server-Timing, длительности в миллисекундах.
+        """
+        metrics = [f"{name};dur={self.phases[name] * 1000:.3f}" for name in PHASES if name in self.phases]
+        metrics.append(f'db;dur={self.db_time * 1000:.3f};desc="{self.statements} statements"')
+        if self.duration is not None:
+            metrics.append(f"total;dur={self.duration * 1000:.3f}")
+        return ", ".join(metrics)
+
+    def as_dict(self) -> Dict:
+        return {
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "statements": self.statements,
+            "db_ms": round(self.db_time * 1000, 3),
+            "phases_ms": {name: round(self.phases[name] * 1000, 3) for name in PHASES if name in self.phases},
+        }
+
+    def _switch(self) -> None:
+        now = perf_counter()
+        if self._stack:
+            name = self._stack[-1]
+            self.phases[name] = self.phases.get(name, 0.0) + now - self._mark
+        self._mark = now
+
+
+def get_timings() -> Optional[RequestTimings]:
+    return _timings.get()
+
+
+@contextmanager
+def collect_timings() -> Iterator[RequestTimings]:
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        timings.finish()
+        _timings.reset(token)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    timings.push(name)
+    try:
+        yield
+    finally:
+        timings.pop()
+
+
+def set_phase(name: str) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings.replace(name)
@@ -0,0 +1,123 @@
+"""
+Трассировка: вложенные спаны обработчиков, методов DAL и запросов обновления.
+
+Спаны создает OpenTelemetry SDK. По умолчанию трассировка выключена: span() и методы с декоратором instrumented
+(см. analyzer.utils.instrumentation) сводятся к одной проверке и отдают неактивный спан OpenTelemetry. start_tracing()
+включает ее с экспортером: в файл (по спану на строку в формате JSON), в стандартный вывод или в коллектор по OTLP/HTTP.
+Спаны копятся в BatchSpanProcessor и отправляются фоновым потоком пачками, поэтому экспорт не задерживает запросы.
+Каждый спан несет атрибут statements — число запросов к базе, выполненных в нем и во всех вложенных спанах; запросы
+передает в add_statement() общий слушатель событий движков.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+)
+
+EXPORTERS = ("file", "console", "otlp")
+
+NOOP_SPAN = trace.INVALID_SPAN
+
+_provider: Optional[TracerProvider] = None
+_tracer: trace.Tracer = trace.NoOpTracer()
+# Счетчик запросов к базе текущего спана
+_statements: ContextVar[Optional[StatementCounter]] = ContextVar("statements", default=None)
+
+
+class StatementCounter:
+    __slots__ = ("count",)
+
+    def __init__(self) -> StatementCounter:
+        self.count = 0
+
+
+def format_span(span: ReadableSpan) -> str:
+    return span.to_json(indent=None) + "\n"
+
+
+class FileSpanExporter(ConsoleSpanExporter):
+    """
+    Дописывает спаны в файл, по одному JSON на строку.
+    """
+
+    def __init__(self, path: str) -> FileSpanExporter:
+        super().__init__(out=open(path, "a", encoding="utf-8"), formatter=format_span)
+
+    def shutdown(self) -> None:
+        self.out.close()
+
+
+def make_exporter(kind: Optional[str], endpoint: Optional[str]) -> Optional[SpanExporter]:
+    if not kind:
+        return None
+    if kind not in EXPORTERS:
+        raise ValueError(f"Unknown tracing exporter {kind!r}, expected one of {', '.join(EXPORTERS)}")
+    if kind == "console":
+        return ConsoleSpanExporter(formatter=format_span)
+    if not endpoint:
+        raise ValueError(f"Tracing exporter {kind!r} requires an endpoint")
+    return FileSpanExporter(endpoint) if kind == "file" else OTLPSpanExporter(endpoint=endpoint)
+
+
+def add_statement() -> None:
+    counter = _statements.get()
+    if counter is not None:
+        counter.count += 1
+
+
+def is_enabled() -> bool:
+    return _provider is not None
+
+
+def start_tracing(exporter: SpanExporter) -> None:
+    global _provider, _tracer
+    _provider = TracerProvider(resource=Resource.create({SERVICE_NAME: "analyzer"}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer(__name__)
+
+
+def stop_tracing() -> None:
+    """
+    Выключает трассировку и дожидается экспорта накопленных спанов.
+    """
+    global _provider, _tracer
+    provider, _provider, _tracer = _provider, None, trace.NoOpTracer()
+    if provider is not None:
+        provider.shutdown()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[trace.Span]:
+    if _provider is None:
+        yield NOOP_SPAN
+        return
+
+    parent = _statements.get()
+    counter = StatementCounter()
+    with _tracer.start_as_current_span(name, attributes=attributes) as current:
+        token = _statements.set(counter)
+        try:
+            yield current
+        finally:
+            _statements.reset(token)
+            current.set_attribute("statements", counter.count)
+            if parent is not None:
+                parent.count += counter.count
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """
+    Задает атрибут текущего спана; без трассировки ничего не делает.
+    """
+    if _provider is not None:
+        trace.get_current_span().set_attribute(key, value)
@@ -0,0 +1,152 @@
+"""
+Общие части бенчмарков: временная база данных, замеры операций вместе с числом запросов к базе, таблицы результатов
+и базовые линии для сравнения между коммитами.
+"""
+from __future__ import annotations
+
+import json
+import math
+import subprocess
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from alembic.command import upgrade
+from sqlalchemy_utils import create_database, drop_database
+from yarl import URL
+
+from analyzer.db.core import SYNC_DATABASE_URL
+from analyzer.utils.database import make_alembic_config
+from analyzer.utils.instrumentation import instrument_engines
+from analyzer.utils.timing import collect_timings
+
+# Рост времени операции относительно базовой линии, который считается регрессией
+DEFAULT_TOLERANCE = 0.2
+
+
+@contextmanager
+def temporary_database(pg_url: str = SYNC_DATABASE_URL) -> Iterator[str]:
+    """
+    Создает на сервере pg_url временную базу данных с примененными миграциями и удаляет ее после замеров.
+    """
+    url = str(URL(pg_url).with_path(f"bench_{uuid4().hex}"))
+    create_database(url)
+    try:
+        cmd_options = SimpleNamespace(config="alembic.ini", name="alembic", pg_url=url, raiseerr=False, x=None)
+        upgrade(make_alembic_config(cmd_options), "head")
+        yield url
+    finally:
+        drop_database(url)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    # Процентиль по ближайшему рангу: на малых выборках p99 равен максимуму, а не интерполяции
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+class Measurements:
+    """
+    Накапливает замеры операций: длительность, число запросов к базе и число обработанных юнитов каждого вызова.
+    """
+
+    def __init__(self) -> Measurements:
+        instrument_engines()
+        self.samples: Dict[str, List[Tuple[float, int, int]]] = {}
+
+    @contextmanager
+    def measure(self, name: str, units: int = 1) -> Iterator[None]:
+        with collect_timings() as timings:
+            yield
+        self.samples.setdefault(name, []).append((timings.duration, timings.statements, units))
+
+    def summary(self) -> Dict[str, Dict]:
+        results = {}
+        for name, samples in self.samples.items():
+            durations = [duration for duration, _, _ in samples]
+            total = sum(durations)
+            results[name] = {
+                "calls": len(samples),
+                "mean_ms": round(total / len(samples) * 1000, 3),
+                "p50_ms": round(percentile(durations, 50) * 1000, 3),
+                "p99_ms": round(percentile(durations, 99) * 1000, 3),
+                "ops_per_second": round(len(samples) / total, 1) if total else None,
+                "units_per_second": round(sum(units for _, _, units in samples) / total, 1) if total else None,
+                "statements_per_call": round(sum(statements for _, statements, _ in samples) / len(samples), 2),
+            }
+        return results
+
+
+SUMMARY_HEADERS = ("operation", "calls", "mean ms", "p50 ms", "p99 ms", "ops/s", "units/s", "stmts/call")
+SUMMARY_COLUMNS = ("calls", "mean_ms", "p50_ms", "p99_ms", "ops_per_second", "units_per_second", "statements_per_call")
+COMPARISON_HEADERS = ("operation", "base p50 ms", "p50 ms", "ratio", "base stmts", "stmts", "")
+
+
+def summary_rows(results: Dict[str, Dict]) -> List[List]:
+    return [[name] + [result[column] for column in SUMMARY_COLUMNS] for name, result in results.items()]
+
+
+def format_table(headers: Sequence[str], rows: Sequence[Sequence]) -> str:
+    cells = [[str(header) for header in headers]] + [
+        ["-" if cell is None else str(cell) for cell in row] for row in rows
+    ]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = [
+        "  ".join(cell.rjust(width) if i else cell.ljust(width) for i, (cell, width) in enumerate(zip(row, widths)))
+        for row in cells
+    ]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_baseline(path: str, params: Dict, results: Dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"commit": git_commit(), "params": params, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE) -> Tuple[List[List], List[str]]:
+    """
+    Сравнивает результаты с базовой линией: возвращает строки таблицы сравнения и операции с регрессиями — те, чье
+    медианное время выросло больше чем на tolerance или которые выполняют больше запросов к базе. Медиана, а не среднее,
+    не реагирует на единичные выбросы вроде первого вызова с холодным кэшем.
+    """
+    rows, regressions = [], []
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            rows.append([name, None, result["p50_ms"], None, None, result["statements_per_call"], ""])
+            continue
+
+        ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else None
+        regressed = (ratio is not None and ratio > 1 + tolerance) or (
+            result["statements_per_call"] > before["statements_per_call"]
+        )
+        if regressed:
+            regressions.append(name)
+        rows.append(
+            [
+                name,
+                before["p50_ms"],
+                result["p50_ms"],
+                f"{ratio:.2f}x" if ratio is not None else None,
+                before["statements_per_call"],
+                result["statements_per_call"],
+                "REGRESSION" if regressed else "",
+            ]
+        )
+    return rows, regressions
@@ -0,0 +1,155 @@
+"""
+Бенчмарк DAL на локальном Postgres.
+
+Строит во временной базе синтетический каталог (analyzer.utils.testing.generate_catalog) так же, как это делает
+/imports, затем замеряет чтения, обновления цен и удаления. Для каждой операции выводятся среднее и медианное время,
+пропускная способность в вызовах и юнитах в секунду и число запросов к базе на вызов. Результаты можно сохранить
+как базовую линию (--save) и сравнить с ней прогон на другом коммите (--compare): при регрессии команда завершается
+с кодом 1.
+
+    python -m benchmarks.dal --depth 4 --fanout 4 --offers 10 --save baseline.json
+    python -m benchmarks.dal --depth 4 --fanout 4 --offers 10 --compare baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from analyzer.api.handlers.imports import make_units_table_rows
+from analyzer.api.schema import ShopUnitImportRequest
+from analyzer.db.core import DEFAULT_PG_URL
+from analyzer.db.dal import apply_updates, get_dal
+from analyzer.utils.testing import generate_catalog
+
+from .common import (
+    COMPARISON_HEADERS,
+    DEFAULT_TOLERANCE,
+    SUMMARY_HEADERS,
+    Measurements,
+    compare,
+    format_table,
+    load_baseline,
+    save_baseline,
+    summary_rows,
+    temporary_database,
+)
+
+START_DATE = datetime(2022, 2, 1, tzinfo=timezone.utc)
+
+
+def chunks(items: List, size: int) -> List[List]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+async def import_units(session: AsyncSession, measurements: Measurements, units: List[Dict], date: datetime, op: str):
+    rows = make_units_table_rows(ShopUnitImportRequest(items=units, updateDate=date).items, date)
+    with measurements.measure(f"add_units{op}", len(units)):
+        async with get_dal(session) as dal:
+            unit_updates, hierarchy_updates = await dal.add_units(rows, date)
+    with measurements.measure(f"apply_updates{op}", len(units)):
+        await apply_updates(session, unit_updates, hierarchy_updates, date)
+
+
+async def run(pg_url: str, depth: int, fanout: int, offers: int, batch_size: int, repeat: int) -> Measurements:
+    catalog = generate_catalog(depth, fanout, offers)
+    categories = [unit for unit in catalog if unit["type"] == "CATEGORY"]
+    offer_units = [unit for unit in catalog if unit["type"] == "OFFER"]
+    measurements = Measurements()
+
+    engine = create_async_engine(pg_url.replace("psycopg2", "asyncpg"), future=True)
+    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+    try:
+        async with SessionLocal() as session:
+            date = START_DATE
+            for batch in chunks(catalog, batch_size):
+                date += timedelta(minutes=1)
+                await import_units(session, measurements, batch, date, "")
+
+            # Обновления цен случайных товаров растят историю цен и пересчитывают агрегаты предков
+            for _ in range(repeat):
+                date += timedelta(minutes=1)
+                batch = [
+                    {**unit, "price": random.randint(100, 1000000)}
+                    for unit in random.sample(offer_units, min(batch_size, len(offer_units)))
+                ]
+                await import_units(session, measurements, batch, date, ":update")
+
+            root_id = UUID(categories[0]["id"])
+            for _ in range(repeat):
+                with measurements.measure("get_node", len(catalog)):
+                    async with get_dal(session) as dal:
+                        await dal.get_node(root_id)
+
+            for _ in range(repeat):
+                with measurements.measure("get_sales"):
+                    async with get_dal(session) as dal:
+                        await dal.get_sales(date)
+
+            for unit in random.sample(catalog, min(repeat, len(catalog))):
+                with measurements.measure("get_node_statistic"):
+                    async with get_dal(session) as dal:
+                        await dal.get_node_statistic(UUID(unit["id"]), START_DATE, date + timedelta(minutes=1))
+
+            # Удаляются категории нижнего уровня вместе с их товарами
+            leaves = categories[len(categories) - fanout ** (depth - 1) :]
+            for unit in random.sample(leaves, min(repeat, len(leaves))):
+                with measurements.measure("delete_unit", offers + 1):
+                    async with get_dal(session) as dal:
+                        unit_updates, hierarchy_updates = await dal.delete_unit(UUID(unit["id"]))
+                with measurements.measure("apply_updates:delete", offers + 1):
+                    await apply_updates(session, unit_updates, hierarchy_updates)
+    finally:
+        await engine.dispose()
+    return measurements
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--pg-url",
+        default=os.getenv("ANALYZER_PG_URL", DEFAULT_PG_URL),
+        help="Postgres server for a temporary database",
+    )
+    parser.add_argument("--depth", type=int, default=4, help="Category tree depth")
+    parser.add_argument("--fanout", type=int, default=4, help="Subcategories per category")
+    parser.add_argument("--offers", type=int, default=10, help="Offers per category")
+    parser.add_argument("--batch-size", type=int, default=100, help="Units per import")
+    parser.add_argument("--repeat", type=int, default=20, help="Calls of each read, update and delete operation")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for catalog generation")
+    parser.add_argument("--save", help="Save results as a baseline JSON file")
+    parser.add_argument("--compare", help="Compare results with a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown vs the baseline")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    params = {name: getattr(args, name) for name in ("depth", "fanout", "offers", "batch_size", "repeat", "seed")}
+    with temporary_database(args.pg_url.replace("postgresql://", "postgresql+psycopg2://", 1)) as pg_url:
+        measurements = asyncio.run(run(pg_url, args.depth, args.fanout, args.offers, args.batch_size, args.repeat))
+
+    results = measurements.summary()
+    print(format_table(SUMMARY_HEADERS, summary_rows(results)))
+
+    if args.save:
+        save_baseline(args.save, params, results)
+    if args.compare:
+        baseline = load_baseline(args.compare)
+        if baseline["params"] != params:
+            print(f"\nWarning: baseline was recorded with {baseline['params']}", file=sys.stderr)
+        comparison, regressions = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with {baseline.get('commit') or args.compare}:")
+        print(format_table(COMPARISON_HEADERS, comparison))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
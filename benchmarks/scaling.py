@@ -0,0 +1,268 @@
+"""
+Масштабирование задержек по размеру каталога.
+
+Для каждого размера каталога (--sizes, в юнитах) создается временная база данных, в которую массово загружаются
+(analyzer.db.loader) синтетический каталог и история цен в --history-ratio раз больше каталога. Затем через
+приложение в том же процессе (ASGI, без сети) по очереди выполняется фиксированный набор запросов, по --requests
+запросов каждого вида. Результат — таблица p50/p99 в миллисекундах по эндпоинтам и размерам и показатель степени
+роста медианы с размером каталога: значения заметно больше 1 означают сверхлинейный рост.
+
+    python -m benchmarks.scaling --sizes 1000,10000,100000,1000000 --save scaling.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence
+
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from analyzer.api.app import app
+from analyzer.api.schema import format_date
+from analyzer.db import loader
+from analyzer.db.core import DEFAULT_PG_URL
+from analyzer.utils.database import get_session
+from analyzer.utils.testing import assert_response, generate_shop_unit
+
+from .common import format_table, git_commit, percentile, temporary_database
+
+START_DATE = datetime(2022, 2, 1, tzinfo=timezone.utc)
+# История цен равномерно распределена по HISTORY_DAYS дням, /sales попадает в сутки из середины этого интервала
+HISTORY_DAYS = 365
+# Сколько идентификаторов категорий и товаров запоминается для запросов
+SAMPLE_SIZE = 1000
+# Показатель степени роста медианы, начиная с которого эндпоинт считается растущим сверхлинейно
+SUPERLINEAR_EXPONENT = 1.1
+# Сколько верхних уровней дерева категорий (корень — уровень 0) попадает в выборку верхних категорий
+UPPER_LEVELS = 2
+# Цены товаров в рублях. Сумма цен поддерева корня большого каталога не помещается в int4, поэтому category_info.sum —
+# bigint
+MAX_PRICE = 1000000
+
+
+class CatalogSample:
+    def __init__(self) -> CatalogSample:
+        self.units = 0
+        self.history = 0
+        # Категории нижнего уровня с небольшими поддеревьями и корень с верхними уровнями дерева
+        self.categories: List[str] = []
+        self.upper_categories: List[str] = []
+        self.offers: List[str] = []
+        self.parents: Dict[str, str] = {}
+
+
+def random_history_date() -> str:
+    return format_date(START_DATE + timedelta(seconds=random.randrange(HISTORY_DAYS * 24 * 60 * 60)))
+
+
+def write_catalog(
+    units_path: str, history_path: str, units: int, fanout: int, offers: int, history: int
+) -> CatalogSample:
+    """
+    Пишет в NDJSON для analyzer.db.loader каталог из units юнитов: дерево категорий, в котором у каждой категории
+    fanout подкатегорий, и по offers товаров на категорию; и history записей истории цен товаров. Каталог пишется
+    потоково, в памяти остаются только идентификаторы категорий.
+    """
+    sample = CatalogSample()
+    categories_count = max(units // (offers + 1), 1)
+    offers_count = max(units - categories_count, 0)
+    category_ids: List[str] = []
+    date = format_date(START_DATE + timedelta(days=HISTORY_DAYS))
+
+    with open(units_path, "w", encoding="utf-8") as units_file, open(
+        history_path, "w", encoding="utf-8"
+    ) as history_file:
+        for i in range(categories_count):
+            # Категории нумеруются в порядке обхода в ширину, как в куче: родитель категории i — (i - 1) // fanout
+            unit = generate_shop_unit(True, category_ids[(i - 1) // fanout] if i else None)
+            category_ids.append(unit["id"])
+            units_file.write(json.dumps({**unit, "date": date}) + "\n")
+
+        for i in range(offers_count):
+            unit = {
+                **generate_shop_unit(False, category_ids[i % categories_count]),
+                "price": random.randint(1, MAX_PRICE),
+            }
+            units_file.write(json.dumps({**unit, "date": date}) + "\n")
+            records = history // offers_count + (i < history % offers_count)
+            for _ in range(records):
+                record = {"id": unit["id"], "price": random.randint(1, MAX_PRICE), "date": random_history_date()}
+                history_file.write(json.dumps(record) + "\n")
+            if len(sample.offers) < SAMPLE_SIZE:
+                sample.offers.append(unit["id"])
+                sample.parents[unit["id"]] = unit["parentId"]
+
+    sample.units = categories_count + offers_count
+    sample.history = history if offers_count else 0
+    # Последние категории — нижний уровень дерева, первые — корень и верхние уровни: в куче уровни 0..UPPER_LEVELS
+    # занимают первые 1 + fanout + ... + fanout^UPPER_LEVELS индексов
+    sample.categories = category_ids[-SAMPLE_SIZE:]
+    upper_count = sum(fanout**level for level in range(UPPER_LEVELS + 1))
+    sample.upper_categories = category_ids[: min(upper_count, SAMPLE_SIZE)]
+    return sample
+
+
+def import_body(sample: CatalogSample, index: int) -> Dict:
+    date = START_DATE + timedelta(days=HISTORY_DAYS, minutes=index + 1)
+    # Товары остаются в своих категориях и меняют цену: пересчитываются агрегаты всех предков
+    return {
+        "items": [
+            {
+                **generate_shop_unit(False, sample.parents[offer_id]),
+                "id": offer_id,
+                "price": random.randint(1, MAX_PRICE),
+            }
+            for offer_id in random.sample(sample.offers, min(10, len(sample.offers)))
+        ],
+        "updateDate": format_date(date),
+    }
+
+
+# Набор запросов: эндпоинт -> функция, выполняющая один запрос (клиент, выборка каталога, номер запроса)
+REQUEST_MIX: Dict[str, Callable] = {
+    "GET /nodes/{category}": lambda client, sample, i: client.get(f"/nodes/{random.choice(sample.categories)}"),
+    # Корень и верхние категории: поддеревья растут вместе с каталогом
+    "GET /nodes/{upper category}": lambda client, sample, i: client.get(
+        f"/nodes/{random.choice(sample.upper_categories)}"
+    ),
+    "GET /nodes/{offer}": lambda client, sample, i: client.get(f"/nodes/{random.choice(sample.offers)}"),
+    "GET /sales": lambda client, sample, i: client.get(
+        "/sales", params={"date": format_date(START_DATE + timedelta(days=HISTORY_DAYS // 2, hours=i))}
+    ),
+    "GET /node/{offer}/statistic": lambda client, sample, i: client.get(
+        f"/node/{random.choice(sample.offers)}/statistic"
+    ),
+    "GET /node/{category}/statistic": lambda client, sample, i: client.get(
+        f"/node/{random.choice(sample.categories)}/statistic"
+    ),
+    "GET /node/{upper category}/statistic": lambda client, sample, i: client.get(
+        f"/node/{random.choice(sample.upper_categories)}/statistic"
+    ),
+    "POST /imports": lambda client, sample, i: client.post("/imports", json=import_body(sample, i)),
+}
+
+
+async def replay(pg_url: str, sample: CatalogSample, requests: int) -> Dict[str, List[float]]:
+    engine = create_async_engine(pg_url.replace("psycopg2", "asyncpg"), future=True)
+    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+
+    async def get_session_override():
+        async with SessionLocal() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    durations: Dict[str, List[float]] = {}
+    try:
+        async with AsyncClient(app=app, base_url="http://bench") as client:
+            for endpoint, make_request in REQUEST_MIX.items():
+                # Первый запрос прогревает соединения и кэши планов и не учитывается
+                assert_response(await make_request(client, sample, 0), 200)
+                durations[endpoint] = []
+                for i in range(1, requests + 1):
+                    start = perf_counter()
+                    response = await make_request(client, sample, i)
+                    durations[endpoint].append(perf_counter() - start)
+                    assert_response(response, 200)
+    finally:
+        app.dependency_overrides.pop(get_session, None)
+        await engine.dispose()
+    return durations
+
+
+def growth_exponent(sizes: Sequence[int], latencies: Sequence[float]) -> Optional[float]:
+    """
+    Показатель степени k в latency ~ size^k: наклон прямой, приближающей точки в логарифмических координатах.
+    """
+    points = [(math.log(size), math.log(latency)) for size, latency in zip(sizes, latencies) if latency > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def run_level(pg_url: str, units: int, fanout: int, offers: int, history_ratio: float, requests: int) -> Dict:
+    with temporary_database(pg_url) as url, tempfile.TemporaryDirectory() as directory:
+        units_path, history_path = os.path.join(directory, "units.ndjson"), os.path.join(directory, "history.ndjson")
+        sample = write_catalog(units_path, history_path, units, fanout, offers, int(units * history_ratio))
+        start = perf_counter()
+        loader.load(url, units_path, history_path)
+        load_seconds = perf_counter() - start
+
+        durations = asyncio.run(replay(url, sample, requests))
+
+    return {
+        "units": sample.units,
+        "history": sample.history,
+        "load_seconds": round(load_seconds, 3),
+        "endpoints": {
+            endpoint: {
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+            }
+            for endpoint, values in durations.items()
+        },
+    }
+
+
+def report(levels: List[Dict]) -> str:
+    headers = ["endpoint"] + [f"{level['units']} units p50/p99 ms" for level in levels] + ["growth"]
+    rows = []
+    for endpoint in REQUEST_MIX:
+        p50 = [level["endpoints"][endpoint]["p50_ms"] for level in levels]
+        exponent = growth_exponent([level["units"] for level in levels], p50)
+        growth = None
+        if exponent is not None:
+            growth = f"{exponent:.2f}" + (" SUPERLINEAR" if exponent > SUPERLINEAR_EXPONENT else "")
+        cells = [
+            f"{level['endpoints'][endpoint]['p50_ms']}/{level['endpoints'][endpoint]['p99_ms']}" for level in levels
+        ]
+        rows.append([endpoint] + cells + [growth])
+    return format_table(headers, rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--pg-url", default=os.getenv("ANALYZER_PG_URL", DEFAULT_PG_URL), help="Postgres server for temporary databases"
+    )
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated catalog sizes, in units")
+    parser.add_argument("--history-ratio", type=float, default=10, help="Price history rows per catalog unit")
+    parser.add_argument("--fanout", type=int, default=10, help="Subcategories per category")
+    parser.add_argument("--offers", type=int, default=10, help="Offers per category")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and size")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--save", help="Save the results as JSON")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    pg_url = args.pg_url.replace("postgresql://", "postgresql+psycopg2://", 1)
+    levels = []
+    for size in sorted(int(size) for size in args.sizes.split(",")):
+        levels.append(run_level(pg_url, size, args.fanout, args.offers, args.history_ratio, args.requests))
+        print(
+            f"{levels[-1]['units']} units, {levels[-1]['history']} history rows: "
+            f"loaded in {levels[-1]['load_seconds']} s"
+        )
+
+    print(report(levels))
+    if args.save:
+        params = {name: getattr(args, name) for name in ("history_ratio", "fanout", "offers", "requests", "seed")}
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), "params": params, "levels": levels}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from analyzer.api.app import app
+from analyzer.db.catalog import Catalog
+from analyzer.db.core import InstrumentedPool
 from analyzer.utils.database import get_session
 
 
@@ -17,7 +19,9 @@ def migrated_postgres(alembic_config, postgres):
 
 @pytest_asyncio.fixture
 async def session(migrated_postgres):
-    engine = create_async_engine(migrated_postgres.replace("psycopg2", "asyncpg"), future=True)
+    engine = create_async_engine(
+        migrated_postgres.replace("psycopg2", "asyncpg"), future=True, poolclass=InstrumentedPool
+    )
     SessionLocal = sessionmaker(
         bind=engine, autocommit=False, autoflush=False, expire_on_commit=False, class_=AsyncSession
     )
@@ -37,3 +41,12 @@ async def client(session):
     finally:
         await client.aclose()
     app.dependency_overrides.clear()
+
+
+@pytest_asyncio.fixture
+async def catalog(client, session):
+    app.state.catalog = await Catalog.load(session)
+    try:
+        yield app.state.catalog
+    finally:
+        app.state.catalog = None
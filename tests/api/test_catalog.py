@@ -0,0 +1,268 @@
+import asyncio
+from array import array
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from analyzer.api.app import app
+from analyzer.db import catalog as catalog_module
+from analyzer.db import notify
+from analyzer.db import snapshot as snapshot_module
+from analyzer.db.catalog import Catalog, listen
+from analyzer.db.notify import Listener
+from analyzer.db.purger import prune_changes
+from analyzer.db.snapshot import open_catalog, read_snapshot, snapshot
+from analyzer.utils.testing import (
+    assert_nodes,
+    assert_response,
+    compare_nodes,
+    flatten_tree,
+    import_batches,
+)
+from tests.api.test_imports import EXPECTED_TREE, IMPORT_BATCHES, ROOT_ID
+from tests.api.test_nodes import assert_breadth_first, select_fields
+
+SMARTPHONES_ID = "d515e43f-f3f6-4471-bb77-6b455017a2d2"
+TVS_ID = "1cc0129a-2bfe-474c-9ee6-d435bf5fc8f2"
+OFFER_ID = "863e1a7a-1304-42ae-943b-179184c077e3"
+
+
+async def assert_catalog_matches_database(client, catalog, node_id):
+    response = await client.get(f"/nodes/{node_id}")
+    assert_response(response, 200)
+
+    app.state.catalog = None
+    try:
+        expected = await client.get(f"/nodes/{node_id}")
+    finally:
+        app.state.catalog = catalog
+    compare_nodes(response.json(), expected.json())
+
+
+@pytest.mark.asyncio
+async def test_catalog_load(client, session):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    catalog = await Catalog.load(session)
+    assert len(catalog) == 8
+    app.state.catalog = catalog
+    try:
+        await assert_nodes(client, ROOT_ID, 200, EXPECTED_TREE)
+    finally:
+        app.state.catalog = None
+
+
+@pytest.mark.asyncio
+async def test_catalog_imports(client, catalog):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    assert UUID(ROOT_ID) in catalog
+
+    await assert_nodes(client, ROOT_ID, 200, EXPECTED_TREE)
+
+
+@pytest.mark.asyncio
+async def test_catalog_flat(client, catalog):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"format": "flat"})
+    assert_response(response, 200)
+    units = response.json()
+    assert_breadth_first(units, ROOT_ID)
+    assert sorted(units, key=lambda x: x["id"]) == sorted(flatten_tree(EXPECTED_TREE), key=lambda x: x["id"])
+
+
+@pytest.mark.asyncio
+async def test_catalog_fields(client, catalog):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"fields": ["id", "type", "price"]})
+    assert_response(response, 200)
+    compare_nodes(response.json(), select_fields(EXPECTED_TREE, ["id", "type", "price"]))
+
+
+@pytest.mark.asyncio
+async def test_catalog_change_parent(client, catalog):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    moves = [
+        {
+            "items": [{"type": "CATEGORY", "name": "Смартфоны", "id": SMARTPHONES_ID, "parentId": TVS_ID}],
+            "updateDate": "2022-02-04T12:00:00.000Z",
+        },
+        {
+            "items": [
+                {"type": "OFFER", "name": "jPhone 13", "id": OFFER_ID, "parentId": ROOT_ID, "price": 1000},
+            ],
+            "updateDate": "2022-02-05T12:00:00.000Z",
+        },
+    ]
+    for batch in moves:
+        await import_batches(client, [batch], 200)
+        await assert_catalog_matches_database(client, catalog, ROOT_ID)
+
+
+@pytest.mark.asyncio
+async def test_catalog_delete(client, catalog):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    assert_response(await client.delete(f"/delete/{SMARTPHONES_ID}"), 200)
+    await assert_catalog_matches_database(client, catalog, ROOT_ID)
+    assert UUID(OFFER_ID) not in catalog
+    assert_response(await client.get(f"/nodes/{SMARTPHONES_ID}"), 404)
+
+    assert_response(await client.delete(f"/delete/{ROOT_ID}"), 200)
+    assert len(catalog) == 0
+
+    # Повторный импорт занимает освободившиеся индексы
+    await import_batches(client, IMPORT_BATCHES, 200)
+    await assert_nodes(client, ROOT_ID, 200, EXPECTED_TREE)
+
+
+@pytest.mark.asyncio
+async def test_catalog_snapshot(client, migrated_postgres, tmp_path):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    path = str(tmp_path / "catalog.snapshot")
+    snapshot(migrated_postgres, path)
+
+    catalog = read_snapshot(path)
+    assert len(catalog) == 8
+    assert isinstance(catalog.prices, memoryview)
+    app.state.catalog = catalog
+    try:
+        await assert_nodes(client, ROOT_ID, 200, EXPECTED_TREE)
+    finally:
+        app.state.catalog = None
+
+
+@pytest.mark.asyncio
+async def test_catalog_snapshot_replay(client, session, migrated_postgres, tmp_path, monkeypatch):
+    await import_batches(client, IMPORT_BATCHES[:2], 200)
+    path = str(tmp_path / "catalog.snapshot")
+    # Без резерва свободных индексов первый же новый юнит заставит каталог скопировать отображенные колонки
+    monkeypatch.setattr(snapshot_module, "SNAPSHOT_MIN_SLACK", 0)
+    snapshot(migrated_postgres, path)
+
+    # Изменения, сделанные после снимка, каталог получает из журнала изменений порциями
+    await import_batches(client, IMPORT_BATCHES[2:], 200)
+    assert_response(await client.delete(f"/delete/{OFFER_ID}"), 200)
+    monkeypatch.setattr(catalog_module, "REPLAY_BATCH_SIZE", 2)
+
+    catalog = await open_catalog(session, path)
+    assert isinstance(catalog.prices, array)
+    app.state.catalog = catalog
+    try:
+        await assert_catalog_matches_database(client, catalog, ROOT_ID)
+    finally:
+        app.state.catalog = None
+
+
+@pytest.mark.asyncio
+async def test_catalog_replay_pruned(client, session):
+    await import_batches(client, IMPORT_BATCHES[:2], 200)
+    catalog = await Catalog.load(session)
+
+    # Журнал вычищен дальше водяного знака каталога: каталог загружается заново
+    await import_batches(client, IMPORT_BATCHES[2:], 200)
+    assert_response(await client.delete(f"/delete/{OFFER_ID}"), 200)
+    assert await prune_changes(session, timedelta(0)) > 0
+    await catalog.replay(session)
+
+    app.state.catalog = catalog
+    try:
+        await assert_catalog_matches_database(client, catalog, ROOT_ID)
+    finally:
+        app.state.catalog = None
+
+
+@pytest.mark.asyncio
+async def test_catalog_listen(client, session, migrated_postgres):
+    catalog = Catalog()
+    engine = create_async_engine(migrated_postgres.replace("psycopg2", "asyncpg"), future=True)
+    session_factory = sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+    # Записи этого же процесса изображают записи другого экземпляра API, поэтому свои уведомления не пропускаем
+    listener = listen(catalog, session_factory, dsn=migrated_postgres.replace("+psycopg2", ""), source=None)
+    task = asyncio.create_task(listener.run())
+    try:
+        await asyncio.wait_for(listener.connected.wait(), 5)
+
+        # Обработчики не видят каталога, поэтому он обновляется только по уведомлениям
+        await import_batches(client, IMPORT_BATCHES, 200)
+        assert_response(await client.delete(f"/delete/{OFFER_ID}"), 200)
+        for _ in range(50):
+            if UUID(ROOT_ID) in catalog and UUID(OFFER_ID) not in catalog:
+                break
+            await asyncio.sleep(0.1)
+
+        app.state.catalog = catalog
+        await assert_catalog_matches_database(client, catalog, ROOT_ID)
+    finally:
+        app.state.catalog = None
+        task.cancel()
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_listener_recovers(session, migrated_postgres, monkeypatch):
+    monkeypatch.setattr(notify, "RECONNECT_DELAY", 0.01)
+    unit_id = uuid4()
+    connects, applied = [], []
+
+    async def on_connect():
+        connects.append(None)
+        if len(connects) == 1:
+            raise RuntimeError("replay failed")
+
+    async def on_change(ids):
+        applied.append(ids)
+        if len(applied) == 1:
+            raise RuntimeError("refresh failed")
+
+    # Ни упавшее восстановление по журналу, ни упавший обработчик не останавливают Listener, а неприменившиеся
+    # идентификаторы передаются обработчику повторно после переподключения
+    listener = Listener(on_change, on_connect, dsn=migrated_postgres.replace("+psycopg2", ""), source=None)
+    task = asyncio.create_task(listener.run())
+    try:
+        await asyncio.wait_for(listener.connected.wait(), 5)
+        async with session.begin():
+            await notify.publish(session, [unit_id])
+        for _ in range(50):
+            if len(applied) == 2:
+                break
+            await asyncio.sleep(0.1)
+
+        assert applied == [{unit_id}, {unit_id}]
+        assert len(connects) == 3
+        assert not task.done()
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_catalog_refresh_ordered():
+    unit_id = uuid4()
+    date = datetime(2022, 2, 1, tzinfo=timezone.utc)
+    released = asyncio.Event()
+
+    class DAL:
+        def __init__(self, price, wait):
+            self.price, self.wait = price, wait
+
+        async def get_units_with_ancestors(self, ids):
+            if self.wait:
+                await released.wait()
+            return [(unit_id, "Товар", None, False, self.price, date)]
+
+    # Первое обновление прочитало старую цену и ждет, второе читает новую: под блокировкой второе чтение выполняется
+    # только после применения первого, и устаревшая цена не перезаписывает новую
+    catalog = Catalog()
+    stale = asyncio.create_task(catalog.refresh(DAL(100, wait=True), [unit_id]))
+    await asyncio.sleep(0)
+    fresh = asyncio.create_task(catalog.refresh(DAL(200, wait=False), [unit_id]))
+    await asyncio.sleep(0.01)
+    released.set()
+    await asyncio.gather(stale, fresh)
+
+    assert catalog.get_node(unit_id).price == 200
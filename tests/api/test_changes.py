@@ -0,0 +1,137 @@
+import asyncio
+import json
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from analyzer.db.dal import DAL
+from analyzer.db.purger import prune_changes
+from analyzer.utils.testing import assert_response, import_batches
+from tests.api.test_imports import IMPORT_BATCHES, ROOT_ID
+
+SMARTPHONES_ID = "d515e43f-f3f6-4471-bb77-6b455017a2d2"
+OFFER_ID = "863e1a7a-1304-42ae-943b-179184c077e3"
+
+
+async def get_changes(client, **params):
+    response = await client.get("/changes", params={"timeout": 0, **params})
+    assert_response(response, 200)
+    return response.json()
+
+
+def parse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        if "data" in fields:
+            events.append((int(fields["id"]), json.loads(fields["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_changes(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    changes = await get_changes(client, cursor=0)
+    assert len(changes["items"]) == 8
+    assert changes["cursor"] == changes["items"][-1]["cursor"]
+    assert all(change["type"] == "UPDATE" for change in changes["items"])
+
+    # Юнит, измененный несколькими импортами, попадает в порцию один раз — с последним состоянием
+    root = next(change for change in changes["items"] if change["id"] == ROOT_ID)
+    assert root["unit"] == {
+        "type": "CATEGORY",
+        "name": "Товары",
+        "id": ROOT_ID,
+        "parentId": None,
+        "price": 58599,
+        "date": "2022-02-03T15:00:00.000Z",
+    }
+
+    assert_response(await client.delete(f"/delete/{OFFER_ID}"), 200)
+    changes = await get_changes(client, cursor=changes["cursor"])
+    assert {change["id"]: change["type"] for change in changes["items"]} == {
+        OFFER_ID: "DELETE",
+        SMARTPHONES_ID: "UPDATE",
+        ROOT_ID: "UPDATE",
+    }
+    assert next(change for change in changes["items"] if change["id"] == OFFER_ID)["unit"] is None
+
+    assert await get_changes(client, cursor=changes["cursor"]) == {"cursor": changes["cursor"], "items": []}
+
+
+@pytest.mark.asyncio
+async def test_changes_from_now(client):
+    await import_batches(client, IMPORT_BATCHES[:1], 200)
+    changes = await get_changes(client)
+    assert changes["items"] == []
+
+    await import_batches(client, IMPORT_BATCHES[1:2], 200)
+    changes = await get_changes(client, cursor=changes["cursor"])
+    assert len(changes["items"]) == 4
+
+
+@pytest.mark.asyncio
+async def test_changes_event_stream(client):
+    await import_batches(client, IMPORT_BATCHES[:2], 200)
+
+    response = await client.get("/changes", params={"cursor": 0, "timeout": 0}, headers={"Accept": "text/event-stream"})
+    assert_response(response, 200)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert len(events) == 4
+    assert [id for id, _ in events] == sorted(id for id, _ in events)
+
+    # Переподключение продолжает ленту с последнего полученного события
+    await import_batches(client, IMPORT_BATCHES[2:3], 200)
+    response = await client.get(
+        "/changes", params={"timeout": 0}, headers={"Accept": "text/event-stream", "Last-Event-ID": str(events[-1][0])}
+    )
+    events = parse_events(response.text)
+    assert {data["id"] for _, data in events} >= {item["id"] for item in IMPORT_BATCHES[2]["items"]}
+
+
+@pytest.mark.asyncio
+async def test_changes_invalid(client):
+    assert_response(await client.get("/changes", params={"cursor": -1}), 400)
+    assert_response(await client.get("/changes", params={"timeout": "soon"}), 400)
+    assert_response(await client.get("/changes", params={"timeout": 301}), 400)
+
+
+@pytest.mark.asyncio
+async def test_changes_commit_order(client, session, migrated_postgres):
+    first, second = uuid4(), uuid4()
+    engine = create_async_engine(migrated_postgres.replace("psycopg2", "asyncpg"), future=True)
+
+    async def record_second() -> None:
+        async with AsyncSession(engine) as other, other.begin():
+            await DAL(other).record_changes([second])
+
+    try:
+        await session.begin()
+        await DAL(session).record_changes([first])
+        # Пока первая транзакция не зафиксирована, вторая не получает номер, больший ее номера
+        task = asyncio.create_task(record_second())
+        await asyncio.sleep(0.5)
+        assert not task.done()
+        await session.commit()
+        await asyncio.wait_for(task, 5)
+    finally:
+        await engine.dispose()
+
+    changes = await get_changes(client, cursor=0)
+    assert [change["id"] for change in changes["items"]] == [str(first), str(second)]
+
+
+@pytest.mark.asyncio
+async def test_changes_expired(client, session):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    cursor = (await get_changes(client, cursor=0))["cursor"]
+
+    # Последняя запись журнала не вычищается, поэтому курсор на ней остается действительным
+    assert await prune_changes(session, timedelta(0)) > 0
+    response = await client.get("/changes", params={"cursor": 0, "timeout": 0})
+    assert_response(response, 410)
+    assert await get_changes(client, cursor=cursor) == {"cursor": cursor, "items": []}
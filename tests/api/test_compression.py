@@ -0,0 +1,94 @@
+import gzip
+from uuid import uuid4
+
+import pytest
+from httpx import AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from analyzer.api.middleware import CompressionMiddleware, add_compression
+from analyzer.utils.testing import assert_response
+
+BODY = "Товары " * 1000
+
+
+async def text(request):
+    return PlainTextResponse(BODY[: int(request.query_params.get("size", len(BODY)))])
+
+
+async def stream(request):
+    async def chunks():
+        yield BODY
+        yield BODY
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+def make_client(**kwargs) -> AsyncClient:
+    app = Starlette(routes=[Route("/text", text), Route("/stream", stream)])
+    return AsyncClient(app=CompressionMiddleware(app, **kwargs), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_compression():
+    async with make_client(min_size=100) as client:
+        response = await client.get("/text", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(BODY)
+        assert response.text == BODY
+
+        # Маленькие, потоковые ответы и клиенты без gzip получают ответ как есть
+        response = await client.get("/text", params={"size": 50}, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        response = await client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert response.text == BODY * 2
+        for accept_encoding in ("identity", "gzip;q=0"):
+            response = await client.get("/text", headers={"Accept-Encoding": accept_encoding})
+            assert "content-encoding" not in response.headers
+            assert response.text == BODY
+
+
+@pytest.mark.asyncio
+async def test_compression_level():
+    async with make_client(min_size=100, large_size=len(BODY.encode()) - 1, level=9) as client:
+        response = await client.get("/text", headers={"Accept-Encoding": "gzip"})
+        # Ответы больше large_size сжимаются с уровнем 1
+        assert response.headers["content-length"] == str(len(gzip.compress(BODY.encode(), compresslevel=1, mtime=0)))
+
+    async with make_client(min_size=100, level=0) as client:
+        response = await client.get("/text", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_compression_executor():
+    app = Starlette(routes=[Route("/text", text)])
+    executor = add_compression(app)
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            response = await client.get("/text", headers={"Accept-Encoding": "gzip"})
+            assert response.headers["content-encoding"] == "gzip"
+        # Сжатие выполняется в пуле, который возвращает add_compression: его останавливает приложение
+        assert executor._threads
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_nodes_compression(client):
+    category_id = str(uuid4())
+    items = [{"id": category_id, "name": "Товары", "type": "CATEGORY"}]
+    items += [
+        {"id": str(uuid4()), "name": f"Товар {i}", "parentId": category_id, "type": "OFFER", "price": i}
+        for i in range(100)
+    ]
+    response = await client.post("/imports", json={"items": items, "updateDate": "2022-02-01T12:00:00.000Z"})
+    assert_response(response, 200)
+
+    response = await client.get(f"/nodes/{category_id}", headers={"Accept-Encoding": "gzip"})
+    assert_response(response, 200)
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["children"]) == 100
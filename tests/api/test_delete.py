@@ -1,12 +1,19 @@
+from uuid import uuid4
+
 import pytest
+from sqlalchemy import func
+from sqlalchemy.future import select
 
+from analyzer.db import dal
+from analyzer.db.purger import purge
+from analyzer.db.schema import PriceUpdate, ShopUnit
 from analyzer.utils.testing import (
     assert_nodes,
     assert_response,
     assert_sales,
     import_batches,
 )
-from tests.api.test_imports import IMPORT_BATCHES, ROOT_ID
+from tests.api.test_imports import EXPECTED_TREE, IMPORT_BATCHES, ROOT_ID
 
 
 @pytest.mark.asyncio
@@ -119,3 +126,89 @@ async def test_delete_history(client):
 
     assert_response(await client.delete(f"/delete/{ROOT_ID}"), 200)
     await assert_sales(client, 200, {"items": []}, params={"date": "2022-02-03T15:00:00.000Z"})
+
+
+@pytest.mark.asyncio
+async def test_delete_batch(client):
+    tv_id = "1cc0129a-2bfe-474c-9ee6-d435bf5fc8f2"
+    smartphones_id = "d515e43f-f3f6-4471-bb77-6b455017a2d2"
+    expected_tree = {
+        "type": "CATEGORY",
+        "name": "Товары",
+        "id": ROOT_ID,
+        "price": 59999,
+        "parentId": None,
+        "date": "2022-02-03T15:00:00.000Z",
+        "children": [
+            {
+                "type": "CATEGORY",
+                "name": "Смартфоны",
+                "id": smartphones_id,
+                "parentId": ROOT_ID,
+                "price": 59999,
+                "date": "2022-02-02T12:00:00.000Z",
+                "children": [
+                    {
+                        "type": "OFFER",
+                        "name": "Xomiа Readme 10",
+                        "id": "b1d8fd7d-2ae3-47d5-b2f9-0f094af800d4",
+                        "parentId": smartphones_id,
+                        "price": 59999,
+                        "date": "2022-02-02T12:00:00.000Z",
+                        "children": None,
+                    },
+                ],
+            },
+        ],
+    }
+
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    # Товар 98883e8f... лежит в удаляемой категории телевизоров
+    ids = [tv_id, "863e1a7a-1304-42ae-943b-179184c077e3", "98883e8f-0507-482f-bce2-2fb306cf6483"]
+    assert_response(await client.post("/delete", json={"ids": ids}), 200)
+    await assert_nodes(client, ROOT_ID, 200, expected_tree)
+
+    for item_id in ids:
+        assert_response(await client.get(f"/nodes/{item_id}"), 404)
+
+
+@pytest.mark.asyncio
+async def test_delete_batch_not_found(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    assert_response(await client.post("/delete", json={"ids": [ROOT_ID, str(uuid4())]}), 404)
+    await assert_nodes(client, ROOT_ID, 200, EXPECTED_TREE)
+
+
+@pytest.mark.asyncio
+async def test_delete_batch_invalid(client):
+    assert_response(await client.post("/delete", json={"ids": []}), 400)
+    assert_response(await client.post("/delete", json={"ids": ["12345"]}), 400)
+
+
+@pytest.mark.asyncio
+async def test_soft_delete(client, session, monkeypatch):
+    monkeypatch.setattr(dal, "ANALYZER_SOFT_DELETE", True)
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    assert_response(await client.delete(f"/delete/{ROOT_ID}"), 200)
+    assert_response(await client.get(f"/nodes/{ROOT_ID}"), 404)
+    assert_response(await client.delete(f"/delete/{ROOT_ID}"), 404)
+    await assert_sales(client, 200, {"items": []}, params={"date": "2022-02-03T15:00:00.000Z"})
+
+    # Строки остаются в базе до фоновой очистки
+    assert (await session.execute(select(func.count()).select_from(ShopUnit))).scalar() == 8
+    assert await purge(session, batch_size=4) == 8 + 11
+    assert (await session.execute(select(func.count()).select_from(ShopUnit))).scalar() == 0
+    assert (await session.execute(select(func.count()).select_from(PriceUpdate))).scalar() == 0
+
+
+@pytest.mark.asyncio
+async def test_soft_delete_reimport(client, monkeypatch):
+    monkeypatch.setattr(dal, "ANALYZER_SOFT_DELETE", True)
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    assert_response(await client.delete(f"/delete/{ROOT_ID}"), 200)
+    await import_batches(client, IMPORT_BATCHES, 200)
+    await assert_nodes(client, ROOT_ID, 200, EXPECTED_TREE)
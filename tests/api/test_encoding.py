@@ -0,0 +1,123 @@
+from datetime import timedelta
+from uuid import UUID, uuid4
+
+import msgpack
+import pytest
+from fastapi.responses import Response
+
+from analyzer.api.encoding import Encoding, get_encoding
+from analyzer.api.schema import EPOCH, format_date
+from analyzer.utils.testing import (
+    assert_response,
+    compare_nodes,
+    compare_statistics,
+    flatten_tree,
+    import_batches,
+)
+from tests.api.test_imports import EXPECTED_TREE, IMPORT_BATCHES, ROOT_ID
+
+MSGPACK_HEADERS = {"Accept": "application/msgpack"}
+
+
+def unpackb(data):
+    # Ответ /nodes — словарь с ключами-идентификаторами в 16 байт
+    return msgpack.unpackb(data, strict_map_key=False)
+
+
+def from_binary(unit):
+    # Возвращает юниту представление JSON: идентификаторы — строки, даты — строки спецификации
+    unit = dict(unit)
+    for key in ("id", "parentId"):
+        if unit.get(key) is not None:
+            unit[key] = str(UUID(bytes=unit[key]))
+    if "date" in unit:
+        unit["date"] = format_date(EPOCH + timedelta(milliseconds=unit["date"]))
+    if unit.get("children") is not None:
+        unit["children"] = [from_binary(child) for child in unit["children"]]
+    return unit
+
+
+@pytest.mark.parametrize(
+    "accept, encoding",
+    [
+        (None, Encoding.JSON),
+        ("*/*", Encoding.JSON),
+        ("application/json", Encoding.JSON),
+        ("application/msgpack", Encoding.MSGPACK),
+        ("application/x-msgpack", Encoding.MSGPACK),
+        ("application/json, application/msgpack", Encoding.MSGPACK),
+        ("application/json, application/msgpack;q=0.5", Encoding.JSON),
+        ("application/msgpack;q=0", Encoding.JSON),
+    ],
+)
+def test_get_encoding(accept, encoding):
+    response = Response()
+    assert get_encoding(response, accept) == encoding
+    assert response.headers["vary"] == "Accept"
+
+
+@pytest.mark.asyncio
+async def test_nodes_msgpack(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    response = await client.get(f"/nodes/{ROOT_ID}", headers=MSGPACK_HEADERS)
+    assert_response(response, 200)
+    assert response.headers["content-type"] == "application/msgpack"
+    tree = unpackb(response.content)
+    assert tree["id"] == UUID(ROOT_ID).bytes
+    compare_nodes(from_binary(tree), EXPECTED_TREE)
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"format": "flat"}, headers=MSGPACK_HEADERS)
+    assert_response(response, 200)
+    units = [from_binary(unit) for unit in unpackb(response.content)]
+    assert sorted(units, key=lambda x: x["id"]) == sorted(flatten_tree(EXPECTED_TREE), key=lambda x: x["id"])
+
+    missing_id = uuid4()
+    response = await client.get("/nodes", params={"ids": [ROOT_ID, str(missing_id)]}, headers=MSGPACK_HEADERS)
+    assert_response(response, 200)
+    nodes = unpackb(response.content)
+    compare_nodes(from_binary(nodes[UUID(ROOT_ID).bytes]), EXPECTED_TREE)
+    assert nodes[missing_id.bytes] == {"code": 404, "message": "Item not found"}
+
+    # Ошибки и ответы без явного запроса MessagePack остаются в JSON
+    assert_response(await client.get(f"/nodes/{uuid4()}", headers=MSGPACK_HEADERS), 404)
+    compare_nodes((await client.get(f"/nodes/{ROOT_ID}", headers={"Accept": "*/*"})).json(), EXPECTED_TREE)
+
+
+@pytest.mark.asyncio
+async def test_sales_msgpack(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    params = {"date": "2022-02-03T15:00:00.000Z"}
+    expected = (await client.get("/sales", params=params)).json()
+    response = await client.get("/sales", params=params, headers=MSGPACK_HEADERS)
+    assert_response(response, 200)
+    sales = unpackb(response.content)
+    compare_statistics({"items": [from_binary(unit) for unit in sales["items"]]}, expected)
+
+    response = await client.get("/sales", params={**params, "fields": ["id", "date"]}, headers=MSGPACK_HEADERS)
+    assert all(set(unit) == {"id", "date"} for unit in unpackb(response.content)["items"])
+
+
+@pytest.mark.asyncio
+async def test_vary_accept(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    # Содержимое ответа зависит от Accept, поэтому его получает и ответ в JSON по умолчанию, собранный из модели
+    date = {"date": "2022-02-03T15:00:00.000Z"}
+    statistic = {"dateStart": "2022-02-01T00:00:00.000Z", "dateEnd": "2022-02-04T00:00:00.000Z"}
+    requests = [
+        (f"/nodes/{ROOT_ID}", {}),
+        (f"/nodes/{ROOT_ID}", {"format": "flat"}),
+        (f"/nodes/{ROOT_ID}", {"fields": ["id"]}),
+        (f"/nodes/{ROOT_ID}", {"since": "2022-02-03T13:00:00.000Z"}),
+        ("/nodes", {"ids": [ROOT_ID]}),
+        ("/sales", date),
+        (f"/node/{ROOT_ID}/statistic", statistic),
+        ("/changes", {"cursor": 0, "timeout": 0}),
+    ]
+    for path, params in requests:
+        for headers in ({}, MSGPACK_HEADERS):
+            response = await client.get(path, params=params, headers=headers)
+            assert_response(response, 200)
+            assert response.headers["vary"] == "Accept", path
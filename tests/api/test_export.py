@@ -0,0 +1,66 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from analyzer.db.export import export
+from analyzer.db.loader import load
+from analyzer.utils.testing import (
+    assert_nodes,
+    assert_response,
+    flatten_tree,
+    import_batches,
+)
+from tests.api.test_imports import EXPECTED_TREE, IMPORT_BATCHES, ROOT_ID
+
+
+def normalize_dates(records):
+    for record in records:
+        record["date"] = datetime.fromisoformat(record["date"].replace("Z", "+00:00"))
+    return records
+
+
+@pytest.mark.asyncio
+async def test_export_units(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    response = await client.get("/export/units")
+    assert_response(response, 200)
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["id"] for record in records] == sorted(record["id"] for record in records)
+    assert sorted(normalize_dates(records), key=lambda x: x["id"]) == sorted(
+        normalize_dates(flatten_tree(EXPECTED_TREE)), key=lambda x: x["id"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_export_history(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    response = await client.get("/export/history")
+    assert_response(response, 200)
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    # По записи на каждый импорт товара и на каждый пересчет цены категории
+    assert len(records) == 5 + 6
+    assert {"id": "73bc3b36-02d1-4245-ab35-3106c9ee1c65", "price": 69999} in [
+        {"id": record["id"], "price": record["price"]} for record in records
+    ]
+
+
+@pytest.mark.asyncio
+async def test_export_load_roundtrip(client, migrated_postgres, tmp_path):
+    units_path, history_path = str(tmp_path / "units.ndjson"), str(tmp_path / "history.ndjson")
+    statistic_url = f"/node/{ROOT_ID}/statistic"
+
+    await import_batches(client, IMPORT_BATCHES, 200)
+    statistic = (await client.get(statistic_url)).json()
+
+    export(migrated_postgres, units_path, history_path)
+    assert_response(await client.delete(f"/delete/{ROOT_ID}"), 200)
+    load(migrated_postgres, units_path, history_path)
+
+    await assert_nodes(client, ROOT_ID, 200, EXPECTED_TREE)
+    assert (await client.get(statistic_url)).json() == statistic
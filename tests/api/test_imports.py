@@ -1,7 +1,9 @@
 from uuid import uuid4
 
 import pytest
+from sqlalchemy.future import select
 
+from analyzer.db.schema import UnitHierarchy
 from analyzer.utils.testing import assert_nodes, import_batches
 
 ROOT_ID = "069cb8d7-bbdd-47d3-ad8f-82ef4c269df1"
@@ -413,6 +415,20 @@ async def test_import_category_price(client):
     await import_batches(client, batches, 400)
 
 
+@pytest.mark.asyncio
+async def test_import_category_sum_overflow(client):
+    # Сумма цен товаров категории больше 2^31: она хранится в bigint, а средняя цена помещается в int4
+    category_id = str(uuid4())
+    items = [{"type": "CATEGORY", "name": "Товары", "id": category_id, "parentId": None}] + [
+        {"type": "OFFER", "name": f"Товар {i}", "id": str(uuid4()), "parentId": category_id, "price": 2000000000}
+        for i in range(2)
+    ]
+    await import_batches(client, [{"items": items, "updateDate": "2022-02-01T12:00:00.000Z"}], 200)
+
+    response = await client.get(f"/nodes/{category_id}")
+    assert response.status_code == 200 and response.json()["price"] == 2000000000
+
+
 @pytest.mark.asyncio
 async def test_import_empty(client):
     await import_batches(client, [{"items": [], "updateDate": "2022-02-01T12:00:00.000Z"}], 200)
@@ -606,6 +622,96 @@ async def test_import_change_parent_category(client):
     await assert_nodes(client, goods_root_id, 200, expected_goods_tree)
 
 
+@pytest.mark.asyncio
+async def test_import_change_parent_nested_category(client, session):
+    old_root_id, new_root_id = str(uuid4()), str(uuid4())
+    category_id, subcategory_id, offer_id = str(uuid4()), str(uuid4()), str(uuid4())
+
+    batches = [
+        {
+            "items": [
+                {"type": "CATEGORY", "name": "Старый корень", "id": old_root_id, "parentId": None},
+                {"type": "CATEGORY", "name": "Новый корень", "id": new_root_id, "parentId": None},
+                {"type": "CATEGORY", "name": "Категория", "id": category_id, "parentId": old_root_id},
+                {"type": "CATEGORY", "name": "Подкатегория", "id": subcategory_id, "parentId": category_id},
+                {"type": "OFFER", "name": "Товар", "id": offer_id, "parentId": subcategory_id, "price": 100},
+            ],
+            "updateDate": "2022-02-01T12:00:00.000Z",
+        },
+        {
+            "items": [{"type": "CATEGORY", "name": "Категория", "id": category_id, "parentId": new_root_id}],
+            "updateDate": "2022-02-02T12:00:00.000Z",
+        },
+        # После переноса предками подкатегории должны считаться новый корень и категория
+        {
+            "items": [{"type": "OFFER", "name": "Товар", "id": offer_id, "parentId": subcategory_id, "price": 300}],
+            "updateDate": "2022-02-03T12:00:00.000Z",
+        },
+    ]
+
+    expected_old_root_tree = {
+        "type": "CATEGORY",
+        "name": "Старый корень",
+        "id": old_root_id,
+        "price": None,
+        "parentId": None,
+        "date": "2022-02-02T12:00:00.000Z",
+        "children": [],
+    }
+    expected_new_root_tree = {
+        "type": "CATEGORY",
+        "name": "Новый корень",
+        "id": new_root_id,
+        "price": 300,
+        "parentId": None,
+        "date": "2022-02-03T12:00:00.000Z",
+        "children": [
+            {
+                "type": "CATEGORY",
+                "name": "Категория",
+                "id": category_id,
+                "price": 300,
+                "parentId": new_root_id,
+                "date": "2022-02-03T12:00:00.000Z",
+                "children": [
+                    {
+                        "type": "CATEGORY",
+                        "name": "Подкатегория",
+                        "id": subcategory_id,
+                        "price": 300,
+                        "parentId": category_id,
+                        "date": "2022-02-03T12:00:00.000Z",
+                        "children": [
+                            {
+                                "type": "OFFER",
+                                "name": "Товар",
+                                "id": offer_id,
+                                "price": 300,
+                                "parentId": subcategory_id,
+                                "date": "2022-02-03T12:00:00.000Z",
+                                "children": None,
+                            }
+                        ],
+                    }
+                ],
+            }
+        ],
+    }
+
+    await import_batches(client, batches, 200)
+
+    await assert_nodes(client, old_root_id, 200, expected_old_root_tree)
+    await assert_nodes(client, new_root_id, 200, expected_new_root_tree)
+
+    # units_hierarchy перестраивается из путей для перенесенной категории и всех ее подкатегорий
+    q = await session.execute(select(UnitHierarchy.id, UnitHierarchy.parent_id))
+    assert {(str(id), str(parent_id)) for id, parent_id in q.all()} == {
+        (category_id, new_root_id),
+        (subcategory_id, new_root_id),
+        (subcategory_id, category_id),
+    }
+
+
 @pytest.mark.asyncio
 async def test_import_direct_order(client):
     batches = [
@@ -0,0 +1,50 @@
+import pytest
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from sqlalchemy import text
+
+from analyzer.db.core import engine
+from analyzer.utils.instrumentation import (
+    add_observer,
+    get_source,
+    instrument_engines,
+    instrumented,
+    remove_observer,
+)
+from analyzer.utils.timing import collect_timings
+from analyzer.utils.tracing import start_tracing, stop_tracing
+
+
+class Source:
+    @instrumented
+    async def query(self, statements):
+        async with engine.connect() as conn:
+            for _ in range(statements):
+                await conn.execute(text("SELECT 1"))
+        return get_source()
+
+
+@pytest.mark.asyncio
+async def test_instrumented():
+    instrument_engines()
+    observed = []
+
+    def observe(conn, statement, parameters, executemany, duration):
+        observed.append((get_source(), statement, duration))
+
+    exporter = InMemorySpanExporter()
+    add_observer(observe)
+    start_tracing(exporter)
+    try:
+        with collect_timings() as timings:
+            assert await Source().query(2) == "Source.query"
+    finally:
+        stop_tracing()
+        remove_observer(observe)
+
+    # Один и тот же замер каждого запроса попадает в учет времени, спан и журнал медленных запросов
+    queries = [item for item in observed if item[1] == "SELECT 1"]
+    assert len(queries) == 2 and all(source == "Source.query" for source, _, _ in queries)
+    assert timings.statements == len(observed) and timings.db_time == pytest.approx(sum(d for _, _, d in observed))
+    [span] = exporter.get_finished_spans()
+    assert span.name == "Source.query" and span.attributes["statements"] == len(observed)
+    assert get_source() is None
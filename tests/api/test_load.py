@@ -0,0 +1,65 @@
+import csv
+
+import pytest
+
+from analyzer.db.loader import LoadError, load
+from analyzer.utils.testing import (
+    assert_nodes,
+    assert_statistics,
+    expected_statistics,
+    flatten_tree,
+    import_batches,
+    write_ndjson,
+)
+from tests.api.test_imports import EXPECTED_TREE, ROOT_ID
+
+TV_ID = "1cc0129a-2bfe-474c-9ee6-d435bf5fc8f2"
+
+
+@pytest.mark.asyncio
+async def test_load_ndjson(client, migrated_postgres, tmp_path):
+    units_path = tmp_path / "units.ndjson"
+    write_ndjson(units_path, flatten_tree(EXPECTED_TREE))
+
+    load(migrated_postgres, str(units_path))
+
+    await assert_nodes(client, ROOT_ID, 200, EXPECTED_TREE)
+    await assert_statistics(
+        client,
+        TV_ID,
+        200,
+        expected_statistics([("CATEGORY", "Телевизоры", TV_ID, ROOT_ID, "2022-02-03T15:00:00.000Z", 50999)]),
+    )
+
+
+@pytest.mark.asyncio
+async def test_load_csv_then_import(client, migrated_postgres, tmp_path):
+    units_path = tmp_path / "units.csv"
+    with open(units_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "name", "parentId", "type", "price", "date"])
+        writer.writeheader()
+        writer.writerows(flatten_tree(EXPECTED_TREE))
+
+    load(migrated_postgres, str(units_path))
+
+    # Служебные таблицы, построенные загрузчиком, должны корректно обновляться обычным импортом
+    batch = {
+        "items": [
+            {"type": "OFFER", "name": "Новый телевизор", "id": ROOT_ID[:-4] + "0000", "parentId": TV_ID, "price": 1}
+        ],
+        "updateDate": "2022-02-04T12:00:00.000Z",
+    }
+    await import_batches(client, [batch], 200)
+
+    response = await client.get(f"/nodes/{ROOT_ID}")
+    assert response.json()["price"] == (79999 + 59999 + 32999 + 49999 + 69999 + 1) // 6
+    assert response.json()["date"] == "2022-02-04T12:00:00.000Z"
+
+
+def test_load_not_empty(migrated_postgres, tmp_path):
+    units_path = tmp_path / "units.ndjson"
+    write_ndjson(units_path, flatten_tree(EXPECTED_TREE))
+
+    load(migrated_postgres, str(units_path))
+    with pytest.raises(LoadError):
+        load(migrated_postgres, str(units_path))
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from analyzer.utils.loop import LoopMonitor
+
+
+def loop_metrics():
+    return (
+        REGISTRY.get_sample_value("analyzer_event_loop_lag_seconds_count") or 0,
+        REGISTRY.get_sample_value("analyzer_event_loop_stalls_total") or 0,
+    )
+
+
+def block_loop(seconds):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor(caplog, monkeypatch):
+    # fileConfig в alembic/env.py отключает логгеры, созданные до миграций
+    monkeypatch.setattr(logging.getLogger("analyzer.utils.loop"), "disabled", False)
+    lags, stalls = loop_metrics()
+
+    monitor = LoopMonitor(interval=0.01, threshold=0.1)
+    with caplog.at_level(logging.WARNING, logger="analyzer.utils.loop"):
+        monitor.start()
+        await asyncio.sleep(0.05)
+        block_loop(0.3)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    assert loop_metrics()[0] > lags
+    assert loop_metrics()[1] - stalls == 1
+    # В журнале стек кода, который держал цикл
+    [record] = [record for record in caplog.records if record.name == "analyzer.utils.loop"]
+    assert "block_loop" in record.getMessage() and "test_loop_monitor" in record.getMessage()
@@ -0,0 +1,54 @@
+from uuid import uuid4
+
+import pytest
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+
+from analyzer.utils.testing import assert_response, import_batches
+from tests.api.test_imports import IMPORT_BATCHES, ROOT_ID
+
+
+def parse_metrics(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def catalog_lookups(result):
+    return REGISTRY.get_sample_value("analyzer_catalog_lookups_total", {"result": result}) or 0
+
+
+@pytest.mark.asyncio
+async def test_metrics(client):
+    samples = parse_metrics((await client.get("/metrics")).text)
+    units = samples.get("analyzer_imported_units_total", 0)
+
+    await import_batches(client, IMPORT_BATCHES, 200)
+    assert_response(await client.get(f"/nodes/{ROOT_ID}"), 200)
+
+    response = await client.get("/metrics")
+    assert_response(response, 200)
+    assert response.headers["content-type"] == CONTENT_TYPE_LATEST
+    samples = parse_metrics(response.text)
+
+    imported = sum(len(batch["items"]) for batch in IMPORT_BATCHES)
+    assert samples["analyzer_imported_units_total"] - units == imported
+    # Маршрут в метке — шаблон пути, а не сам путь
+    labels = 'method="GET",route="/nodes/{id}",status="200"'
+    assert samples[f"analyzer_http_request_duration_seconds_count{{{labels}}}"] >= 1
+    assert samples['analyzer_http_request_db_statements_count{method="POST",route="/imports"}'] >= len(IMPORT_BATCHES)
+    assert samples["analyzer_hierarchy_depth_count"] > 0
+    assert samples["analyzer_db_pool_checkout_seconds_count"] > 0
+    assert "analyzer_db_pool_checked_out" in samples
+
+
+@pytest.mark.asyncio
+async def test_catalog_lookups(client, catalog):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    hits, misses = catalog_lookups("hit"), catalog_lookups("miss")
+
+    assert_response(await client.get(f"/nodes/{ROOT_ID}"), 200)
+    assert_response(await client.get(f"/nodes/{uuid4()}"), 404)
+    assert (catalog_lookups("hit") - hits, catalog_lookups("miss") - misses) == (1, 1)
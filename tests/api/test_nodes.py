@@ -1,9 +1,19 @@
+from datetime import timedelta
 from uuid import uuid4
 
 import pytest
 
-from analyzer.utils.testing import assert_nodes, assert_response, import_batches
-from tests.api.test_imports import IMPORT_BATCHES, ROOT_ID
+from analyzer.db.purger import prune_tombstones
+from analyzer.utils.testing import (
+    assert_nodes,
+    assert_response,
+    compare_nodes,
+    flatten_tree,
+    import_batches,
+)
+from tests.api.test_imports import EXPECTED_TREE, IMPORT_BATCHES, ROOT_ID
+
+SMARTPHONES_ID = "d515e43f-f3f6-4471-bb77-6b455017a2d2"
 
 
 @pytest.mark.asyncio
@@ -66,3 +76,218 @@ async def test_nodes_not_found(client):
 async def test_delete_invalid(client):
     assert_response(await client.get("/nodes/invalid_uuid"), 400)
     assert_response(await client.get("/nodes/12345"), 400)
+
+
+@pytest.mark.asyncio
+async def test_nodes_batch(client):
+    tv_tree = EXPECTED_TREE["children"][0]
+    random_uuid = str(uuid4())
+
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    # Поддеревья пересекаются: категория телевизоров входит в дерево корня
+    response = await client.get("/nodes", params={"ids": [ROOT_ID, tv_tree["id"], random_uuid]})
+    assert_response(response, 200)
+
+    nodes = response.json()
+    assert nodes.keys() == {ROOT_ID, tv_tree["id"], random_uuid}
+    compare_nodes(nodes[ROOT_ID], EXPECTED_TREE)
+    compare_nodes(nodes[tv_tree["id"]], tv_tree)
+    assert nodes[random_uuid] == {"code": 404, "message": "Item not found"}
+
+
+@pytest.mark.asyncio
+async def test_nodes_batch_invalid(client):
+    assert_response(await client.get("/nodes"), 400)
+    assert_response(await client.get("/nodes", params={"ids": [ROOT_ID, "12345"]}), 400)
+
+
+def prune_tree(node, since):
+    # Даты в ответах сервиса имеют одинаковый формат, поэтому их можно сравнивать как строки
+    if node["date"] <= since:
+        return None
+    node = dict(node)
+    if node["children"] is not None:
+        node["children"] = [child for child in (prune_tree(child, since) for child in node["children"]) if child]
+    return node
+
+
+@pytest.mark.asyncio
+async def test_nodes_since(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    since = "2022-02-03T13:00:00.000Z"
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": since})
+    assert_response(response, 200)
+    delta = response.json()
+    assert delta["deleted"] == []
+    compare_nodes(delta["unit"], prune_tree(EXPECTED_TREE, since))
+    assert len(delta["unit"]["children"]) == 1
+
+    # Удаление не меняет дату родителя, но меняет цены предков: они попадают в ответ вместе с надгробием, даже если
+    # их даты не новее since
+    latest = "2022-02-03T15:00:00.000Z"
+    assert (await client.get(f"/nodes/{ROOT_ID}", params={"since": latest})).json() == {"unit": None, "deleted": []}
+    assert_response(await client.delete("/delete/863e1a7a-1304-42ae-943b-179184c077e3"), 200)
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": since})
+    assert response.json()["deleted"] == ["863e1a7a-1304-42ae-943b-179184c077e3"]
+
+    delta = (await client.get(f"/nodes/{ROOT_ID}", params={"since": latest})).json()
+    assert delta["deleted"] == ["863e1a7a-1304-42ae-943b-179184c077e3"]
+    expected = (await client.get(f"/nodes/{ROOT_ID}")).json()
+    smartphones = next(child for child in expected["children"] if child["id"] == SMARTPHONES_ID)
+    assert delta["unit"]["price"] == expected["price"] != EXPECTED_TREE["price"]
+    assert delta["unit"]["children"] == [{**smartphones, "children": []}]
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": "2100-01-01T00:00:00.000Z"})
+    assert response.json() == {"unit": None, "deleted": []}
+
+    # Юнит, созданный заново, больше не считается удаленным
+    batch = {"items": IMPORT_BATCHES[1]["items"][1:2], "updateDate": "2022-02-04T12:00:00.000Z"}
+    await import_batches(client, [batch], 200)
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": since})
+    assert response.json()["deleted"] == []
+
+
+@pytest.mark.asyncio
+async def test_nodes_since_moved(client):
+    root_id, category_id, other_root_id, offer_id = (str(uuid4()) for _ in range(4))
+    batches = [
+        {
+            "items": [
+                {"type": "CATEGORY", "name": "Корень", "id": root_id, "parentId": None},
+                {"type": "CATEGORY", "name": "Категория", "id": category_id, "parentId": root_id},
+                {"type": "CATEGORY", "name": "Другой корень", "id": other_root_id, "parentId": None},
+                {"type": "OFFER", "name": "Товар", "id": offer_id, "parentId": category_id, "price": 100},
+            ],
+            "updateDate": "2022-02-01T12:00:00.000Z",
+        },
+        {
+            "items": [{"type": "OFFER", "name": "Товар", "id": offer_id, "parentId": other_root_id, "price": 100}],
+            "updateDate": "2022-02-02T12:00:00.000Z",
+        },
+    ]
+    await import_batches(client, batches, 200)
+    since = "2022-02-01T13:00:00.000Z"
+
+    # Для поддерева прежних предков перенесенный товар удален, а их цены изменились
+    response = await client.get(f"/nodes/{root_id}", params={"since": since})
+    assert_response(response, 200)
+    delta = response.json()
+    assert delta["deleted"] == [offer_id]
+    assert delta["unit"]["children"][0]["id"] == category_id
+    assert delta["unit"]["children"][0]["children"] == []
+    assert delta["unit"]["children"][0]["price"] is None
+
+    response = await client.get(f"/nodes/{other_root_id}", params={"since": since})
+    delta = response.json()
+    assert delta["deleted"] == []
+    assert [child["id"] for child in delta["unit"]["children"]] == [offer_id]
+
+    # Товар, вернувшийся в поддерево, снова отдается как изменившийся, а не как удаленный
+    batch = {
+        "items": [{"type": "OFFER", "name": "Товар", "id": offer_id, "parentId": category_id, "price": 100}],
+        "updateDate": "2022-02-03T12:00:00.000Z",
+    }
+    await import_batches(client, [batch], 200)
+    delta = (await client.get(f"/nodes/{root_id}", params={"since": since})).json()
+    assert delta["deleted"] == []
+    assert delta["unit"]["children"][0]["children"][0]["id"] == offer_id
+    assert (await client.get(f"/nodes/{other_root_id}", params={"since": since})).json()["deleted"] == [offer_id]
+
+
+@pytest.mark.asyncio
+async def test_nodes_since_delete_date(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    latest = "2022-02-03T15:00:00.000Z"
+
+    # Надгробие получает дату удаления в датах клиента, а не время сервера: since позже нее его не видит
+    params = {"date": "2022-02-04T12:00:00.000Z"}
+    assert_response(await client.delete("/delete/863e1a7a-1304-42ae-943b-179184c077e3", params=params), 200)
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": latest})
+    assert response.json()["deleted"] == ["863e1a7a-1304-42ae-943b-179184c077e3"]
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": "2022-02-04T12:00:00.000Z"})
+    assert response.json() == {"unit": None, "deleted": []}
+
+    body = {"ids": [SMARTPHONES_ID], "updateDate": "2022-02-05T12:00:00.000Z"}
+    assert_response(await client.post("/delete", json=body), 200)
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": "2022-02-04T12:00:00.000Z"})
+    assert response.json()["deleted"] == [SMARTPHONES_ID]
+
+
+@pytest.mark.asyncio
+async def test_nodes_since_pruned(client, session):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    params = {"date": "2022-02-04T12:00:00.000Z"}
+    assert_response(await client.delete("/delete/863e1a7a-1304-42ae-943b-179184c077e3", params=params), 200)
+
+    # После вычистки надгробий since раньше последнего вычищенного получает 410, а since не раньше него — изменения
+    assert await prune_tombstones(session, timedelta(0)) == 1
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": "2022-02-03T15:00:00.000Z"})
+    assert_response(response, 410)
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"since": "2022-02-04T12:00:00.000Z"})
+    assert_response(response, 200)
+    assert response.json() == {"unit": None, "deleted": []}
+
+
+@pytest.mark.asyncio
+async def test_nodes_since_invalid(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    assert_response(await client.get(f"/nodes/{ROOT_ID}", params={"since": "yesterday"}), 400)
+    assert_response(await client.get(f"/nodes/{uuid4()}", params={"since": "2022-02-03T13:00:00.000Z"}), 404)
+
+
+def assert_breadth_first(units, root_id):
+    assert units[0]["id"] == root_id
+    positions = {unit["id"]: position for position, unit in enumerate(units)}
+    depths = {root_id: 0}
+    for unit in units[1:]:
+        assert positions[unit["parentId"]] < positions[unit["id"]]
+        depths[unit["id"]] = depths[unit["parentId"]] + 1
+    assert [depths[unit["id"]] for unit in units] == sorted(depths.values())
+
+
+@pytest.mark.asyncio
+async def test_nodes_flat(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"format": "flat"})
+    assert_response(response, 200)
+    units = response.json()
+    assert_breadth_first(units, ROOT_ID)
+    assert sorted(units, key=lambda x: x["id"]) == sorted(flatten_tree(EXPECTED_TREE), key=lambda x: x["id"])
+
+    assert_response(await client.get(f"/nodes/{uuid4()}", params={"format": "flat"}), 404)
+    assert_response(await client.get(f"/nodes/{ROOT_ID}", params={"format": "xml"}), 400)
+
+
+def select_fields(node, fields):
+    unit = {field: node[field] for field in fields}
+    children = node.get("children")
+    unit["children"] = [select_fields(child, fields) for child in children] if children is not None else None
+    return unit
+
+
+@pytest.mark.asyncio
+async def test_nodes_fields(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    fields = ["id", "name", "price"]
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"fields": ["price", "name", "id", "name"]})
+    assert_response(response, 200)
+    compare_nodes(response.json(), select_fields(EXPECTED_TREE, fields))
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"format": "flat", "fields": fields})
+    assert_response(response, 200)
+    expected = [{field: unit[field] for field in fields} for unit in flatten_tree(EXPECTED_TREE)]
+    assert sorted(response.json(), key=lambda x: x["id"]) == sorted(expected, key=lambda x: x["id"])
+
+    missing_id = str(uuid4())
+    response = await client.get("/nodes", params={"ids": [ROOT_ID, missing_id], "fields": fields})
+    assert_response(response, 200)
+    nodes = response.json()
+    compare_nodes(nodes[ROOT_ID], select_fields(EXPECTED_TREE, fields))
+    assert nodes[missing_id] == {"code": 404, "message": "Item not found"}
+
+    assert_response(await client.get(f"/nodes/{uuid4()}", params={"fields": fields}), 404)
+    assert_response(await client.get(f"/nodes/{ROOT_ID}", params={"fields": "color"}), 400)
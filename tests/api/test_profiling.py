@@ -0,0 +1,35 @@
+import pstats
+
+import pytest
+from httpx import AsyncClient
+
+from analyzer.api.app import app
+from analyzer.api.middleware import ProfilingMiddleware
+from analyzer.utils.testing import assert_response, import_batches
+from tests.api.test_imports import IMPORT_BATCHES
+
+PROFILE_HEADERS = {"X-Profile": "secret"}
+
+
+@pytest.mark.asyncio
+async def test_profiling(client, tmp_path):
+    await import_batches(client, IMPORT_BATCHES[:1], 200)
+    async with AsyncClient(app=ProfilingMiddleware(app, "secret", str(tmp_path)), base_url="http://test") as profiled:
+        response = await profiled.post("/imports", json=IMPORT_BATCHES[1], headers=PROFILE_HEADERS)
+        assert_response(response, 200)
+
+        stats = pstats.Stats(str(tmp_path / response.headers["x-profile"]))
+        functions = {(filename.replace("\\", "/"), name) for filename, _, name in stats.stats}
+        # Профиль охватывает обработчик, планирование и выполнение обновлений
+        assert any(filename.endswith("analyzer/db/dal.py") and name == "add_units" for filename, name in functions)
+        assert any(
+            filename.endswith("analyzer/db/queries/unit.py") and name == "execute" for filename, name in functions
+        )
+
+        response = await profiled.post("/imports", json=IMPORT_BATCHES[2])
+        assert_response(response, 200)
+        assert "x-profile" not in response.headers
+
+        response = await profiled.post("/imports", json=IMPORT_BATCHES[3], headers={"X-Profile": "wrong"})
+        assert_response(response, 403)
+        assert len(list(tmp_path.iterdir())) == 1
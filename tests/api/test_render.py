@@ -0,0 +1,148 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from time import perf_counter
+from uuid import uuid4
+
+import pytest
+
+from analyzer.api.app import app
+from analyzer.api.encoding import Encoding
+from analyzer.api.render import COLUMN_CODECS, Renderer, pack_rows, pack_subtree, unpack_rows
+from analyzer.api.schema import ShopUnitField, field_columns
+from analyzer.db.catalog import Catalog
+from analyzer.utils.misc import nameddict
+from analyzer.utils.testing import (
+    assert_response,
+    compare_nodes,
+    flatten_tree,
+    import_batches,
+)
+from tests.api.test_encoding import MSGPACK_HEADERS, from_binary, unpackb
+from tests.api.test_imports import EXPECTED_TREE, IMPORT_BATCHES, ROOT_ID
+from tests.api.test_nodes import assert_breadth_first
+
+
+@pytest.fixture(params=["thread", "process"])
+def renderer(request):
+    # min_units=0 отправляет в пул даже маленькие поддеревья тестов
+    app.state.renderer = Renderer(request.param, workers=1, min_units=0)
+    try:
+        yield app.state.renderer
+    finally:
+        app.state.renderer.close()
+        app.state.renderer = None
+
+
+def test_pack_rows():
+    rows = [
+        nameddict(
+            id=uuid4(),
+            parent_id=None,
+            name="Товары",
+            is_category=True,
+            price=None,
+            date=datetime(2022, 2, 1, 12, tzinfo=timezone.utc),
+        ),
+        nameddict(
+            id=uuid4(),
+            parent_id=uuid4(),
+            name="",
+            is_category=False,
+            price=-(2**40),
+            date=datetime(1969, 12, 31, 23, 59, 59, 999000, tzinfo=timezone.utc),
+        ),
+    ]
+    assert unpack_rows(*pack_rows(rows, rows[0].keys())) == rows
+    assert unpack_rows(*pack_rows(rows, ["id", "price"])) == [{"id": row.id, "price": row.price} for row in rows]
+
+
+def test_pack_subtree():
+    root_id, category_id = uuid4(), uuid4()
+    date = datetime(2022, 2, 1, 12, tzinfo=timezone.utc)
+    catalog = Catalog()
+    catalog.update(
+        [
+            (root_id, "Товары", None, True, None, date),
+            (category_id, "Смартфоны", root_id, True, 150, date),
+            (uuid4(), "Телефон", category_id, False, 150, date),
+            (uuid4(), "", root_id, False, 0, date),
+        ]
+    )
+
+    # Колонки, упакованные из массивов каталога, совпадают с упакованными из юнитов
+    columns = COLUMN_CODECS.keys()
+    assert pack_subtree(catalog, root_id, columns) == pack_rows(catalog.get_subtree(root_id), columns)
+    assert pack_subtree(catalog, category_id, ["id"]) == pack_rows(catalog.get_subtree(category_id), ["id"])
+
+
+@pytest.mark.asyncio
+async def test_nodes_render(client, renderer):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    response = await client.get(f"/nodes/{ROOT_ID}")
+    assert_response(response, 200)
+    compare_nodes(response.json(), EXPECTED_TREE)
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"format": "flat"})
+    assert_response(response, 200)
+    units = response.json()
+    assert_breadth_first(units, ROOT_ID)
+    assert sorted(units, key=lambda x: x["id"]) == sorted(flatten_tree(EXPECTED_TREE), key=lambda x: x["id"])
+
+    response = await client.get(f"/nodes/{ROOT_ID}", headers=MSGPACK_HEADERS)
+    assert_response(response, 200)
+    assert response.headers["vary"] == "Accept"
+    compare_nodes(from_binary(unpackb(response.content)), EXPECTED_TREE)
+
+    response = await client.get(f"/nodes/{ROOT_ID}", params={"format": "flat", "fields": ["id", "price"]})
+    expected = [{"id": unit["id"], "price": unit["price"]} for unit in flatten_tree(EXPECTED_TREE)]
+    assert sorted(response.json(), key=lambda x: x["id"]) == sorted(expected, key=lambda x: x["id"])
+
+    assert_response(await client.get(f"/nodes/{uuid4()}"), 404)
+
+
+@pytest.mark.asyncio
+async def test_catalog_render(client, catalog, renderer):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    response = await client.get(f"/nodes/{ROOT_ID}")
+    assert_response(response, 200)
+    compare_nodes(response.json(), EXPECTED_TREE)
+
+
+@pytest.mark.asyncio
+async def test_render_loop_lag():
+    root_id = uuid4()
+    date = datetime(2022, 2, 1, 12, tzinfo=timezone.utc)
+    catalog = Catalog()
+    catalog.update([(root_id, "Товары", None, True, None, date)])
+    catalog.update((uuid4(), "Товар", root_id, False, 100, date) for _ in range(100000))
+
+    # Кодирование одного поля дешево, поэтому задержки цикла дала бы только работа с поддеревом в нем: сборка
+    # объектов юнитов и упаковка колонок на таком поддереве занимают в цикле событий сотни миллисекунд
+    fields = [ShopUnitField.ID]
+    columns = field_columns(fields)
+    renderer = Renderer("process", workers=1, min_units=0)
+    lags = []
+
+    async def measure():
+        while True:
+            start = perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(perf_counter() - start - 0.001)
+
+    try:
+        # Рабочий процесс запускается при первой задаче
+        await renderer.render_subtree(catalog, root_id, columns, fields, Encoding.JSON, False)
+
+        task = asyncio.create_task(measure())
+        await asyncio.sleep(0.01)
+        try:
+            content = await renderer.render_subtree(catalog, root_id, columns, fields, Encoding.JSON, False)
+        finally:
+            task.cancel()
+        assert len(json.loads(content)) == 100001
+        assert max(lags) < 0.1
+    finally:
+        renderer.close()
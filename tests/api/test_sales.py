@@ -11,6 +11,20 @@ async def test_sales(client):
     assert_response(await client.get("/sales", params={"date": "2022-02-04T00:00:00.000Z"}), 200)
 
 
+@pytest.mark.asyncio
+async def test_sales_fields(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    params = {"date": "2022-02-03T15:00:00.000Z"}
+    full = (await client.get("/sales", params=params)).json()
+    response = await client.get("/sales", params={**params, "fields": ["price", "id"]})
+    assert_response(response, 200)
+    expected = [{"id": unit["id"], "price": unit["price"]} for unit in full["items"]]
+    assert sorted(response.json()["items"], key=lambda x: x["id"]) == sorted(expected, key=lambda x: x["id"])
+
+    assert_response(await client.get("/sales", params={**params, "fields": "color"}), 400)
+
+
 @pytest.mark.asyncio
 async def test_sales_corner_dates(client):
     expected_tree_end_corner = {
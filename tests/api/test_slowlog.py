@@ -0,0 +1,66 @@
+import json
+import logging
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+
+from analyzer.db.slowlog import SlowQueryLog, parameters_shape
+from analyzer.utils.testing import assert_response, import_batches
+from tests.api.test_imports import IMPORT_BATCHES
+
+LOGGER = "analyzer.db.slowlog"
+
+
+@pytest.fixture
+def slow_query_log(monkeypatch):
+    # fileConfig в alembic/env.py отключает логгеры, созданные до миграций
+    monkeypatch.setattr(logging.getLogger(LOGGER), "disabled", False)
+
+    logs = []
+
+    def install(**kwargs):
+        logs.append(SlowQueryLog(**kwargs))
+        logs[-1].install()
+        return logs[-1]
+
+    try:
+        yield install
+    finally:
+        for log in logs:
+            log.close()
+
+
+def test_parameters_shape():
+    assert parameters_shape((uuid4(), [uuid4(), uuid4()], None, []), False) == ["UUID", "UUID[2]", "NoneType", "any[0]"]
+    assert parameters_shape({"date": datetime.now(timezone.utc)}, False) == {"date": "datetime"}
+    assert parameters_shape([(1, "a"), (2, "b")], True) == {"rows": 2, "row": ["int", "str"]}
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log(client, caplog, slow_query_log):
+    await import_batches(client, IMPORT_BATCHES, 200)
+    log = slow_query_log(threshold=0, explain=True)
+
+    with caplog.at_level(logging.INFO, logger=LOGGER):
+        response = await client.get("/sales", params={"date": "2022-02-03T00:00:00.000Z"})
+        assert_response(response, 200)
+        # Дожидается плана, снимаемого в отдельном потоке
+        log.close()
+
+    records = [json.loads(record.getMessage()) for record in caplog.records if record.name == LOGGER]
+    queries = [record for record in records if "duration_ms" in record]
+    assert queries and all(record["route"] == "/sales" for record in queries)
+    sales = next(record for record in queries if record["source"] == "DAL.get_sales")
+    assert sales["statement"].lstrip().startswith("SELECT") and sales["parameters"]
+
+    plans = [record for record in records if "plan" in record]
+    assert len(plans) == 1 and "actual time" in plans[0]["plan"] and "Buffers" in plans[0]["plan"]
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log_sampling(client, caplog, slow_query_log):
+    slow_query_log(threshold=0, sample_rate=0)
+    with caplog.at_level(logging.INFO, logger=LOGGER):
+        assert_response(await client.get(f"/nodes/{uuid4()}"), 404)
+    assert not [record for record in caplog.records if record.name == LOGGER]
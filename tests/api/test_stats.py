@@ -27,6 +27,18 @@ async def test_stats(client):
     )
 
 
+@pytest.mark.asyncio
+async def test_stats_fields(client):
+    await import_batches(client, IMPORT_BATCHES, 200)
+
+    params = {"dateStart": "2022-02-01T00:00:00.000Z", "dateEnd": "2022-02-04T00:00:00.000Z"}
+    full = (await client.get(f"/node/{ROOT_ID}/statistic", params=params)).json()
+    response = await client.get(f"/node/{ROOT_ID}/statistic", params={**params, "fields": ["date", "price"]})
+    assert_response(response, 200)
+    expected = [{"date": unit["date"], "price": unit["price"]} for unit in full["items"]]
+    assert full["items"] and sorted(response.json()["items"], key=str) == sorted(expected, key=str)
+
+
 @pytest.mark.asyncio
 async def test_stats_corner_dates(client):
     node_id = "73bc3b36-02d1-4245-ab35-3106c9ee1c65"
@@ -0,0 +1,65 @@
+import json
+import logging
+import re
+import time
+
+import pytest
+
+from analyzer.utils.testing import assert_response, import_batches
+from analyzer.utils.timing import collect_timings, phase, set_phase
+from tests.api.test_imports import IMPORT_BATCHES, ROOT_ID
+
+
+def parse_server_timing(header):
+    metrics = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def test_phases_exclude_nested():
+    with collect_timings() as timings:
+        with phase("handler"):
+            time.sleep(0.01)
+            with phase("dal"):
+                time.sleep(0.02)
+            set_phase("serialization")
+            time.sleep(0.01)
+
+    # time.sleep гарантирует только нижнюю границу. Время обработчика не включает вложенную фазу dal: фазы не
+    # пересекаются и в сумме не превышают длительности
+    assert timings.phases["dal"] >= 0.02
+    assert timings.phases["handler"] >= 0.01
+    assert timings.phases["serialization"] >= 0.01
+    assert timings.phases["handler"] <= timings.duration - timings.phases["dal"] - timings.phases["serialization"]
+
+    # Вне запроса фазы не учитываются
+    with phase("dal"):
+        set_phase("handler")
+
+
+@pytest.mark.asyncio
+async def test_server_timing(client, caplog, monkeypatch):
+    # fileConfig в alembic/env.py отключает логгеры, созданные до миграций
+    monkeypatch.setattr(logging.getLogger("analyzer.api.middleware"), "disabled", False)
+    await import_batches(client, IMPORT_BATCHES[:1], 200)
+    response = await client.post("/imports", json=IMPORT_BATCHES[1])
+    assert_response(response, 200)
+    metrics = parse_server_timing(response.headers["server-timing"])
+    assert {"validation", "handler", "dal", "hierarchy", "aggregates", "db", "total"} <= set(metrics)
+    statements = int(re.match(r'"(\d+) statements"', metrics["db"]["desc"]).group(1))
+    assert statements > 0
+    assert sum(float(metrics[name]["dur"]) for name in metrics if name not in ("db", "total")) <= float(
+        metrics["total"]["dur"]
+    )
+
+    await import_batches(client, IMPORT_BATCHES[2:], 200)
+    with caplog.at_level(logging.INFO, logger="analyzer.api.middleware"):
+        response = await client.get(f"/nodes/{ROOT_ID}")
+    assert_response(response, 200)
+    assert "serialization" in parse_server_timing(response.headers["server-timing"])
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["method"] == "GET" and record["path"] == f"/nodes/{ROOT_ID}" and record["status"] == 200
+    assert record["statements"] > 0 and "dal" in record["phases_ms"]
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from analyzer.utils.testing import assert_response, import_batches
+from analyzer.utils.tracing import (
+    NOOP_SPAN,
+    FileSpanExporter,
+    make_exporter,
+    span,
+    start_tracing,
+    stop_tracing,
+)
+from tests.api.test_imports import IMPORT_BATCHES, ROOT_ID
+
+
+@pytest.mark.asyncio
+async def test_import_spans(client, tmp_path):
+    path = tmp_path / "spans.jsonl"
+    start_tracing(FileSpanExporter(str(path)))
+    try:
+        await import_batches(client, IMPORT_BATCHES[:1], 200)
+        response = await client.post("/imports", json=IMPORT_BATCHES[1])
+        assert_response(response, 200)
+    finally:
+        stop_tracing()
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    root = [span for span in spans if span["name"] == "POST /imports"][-1]
+    trace = {
+        span["context"]["span_id"]: span for span in spans if span["context"]["trace_id"] == root["context"]["trace_id"]
+    }
+    names = {span["name"] for span in trace.values()}
+    assert {
+        "DAL.add_units",
+        "apply_updates",
+        "HierarchyUpdateQuery.execute",
+        "UnitUpdateQuery.execute",
+        "BatchInserter.execute",
+    } <= names
+
+    assert root["parent_id"] is None and root["attributes"]["items"] == len(IMPORT_BATCHES[1]["items"])
+    add_units = next(span for span in trace.values() if span["name"] == "DAL.add_units")
+    assert (
+        add_units["parent_id"] == root["context"]["span_id"]
+        and add_units["attributes"]["units"] == root["attributes"]["items"]
+    )
+    assert any("ancestors" in span["attributes"] for span in trace.values())
+
+    # Запросы к базе спана включают запросы вложенных спанов
+    for item in trace.values():
+        assert item["start_time"] <= item["end_time"]
+        children = [child for child in trace.values() if child["parent_id"] == item["context"]["span_id"]]
+        assert item["attributes"]["statements"] >= sum(child["attributes"]["statements"] for child in children)
+    assert root["attributes"]["statements"] > add_units["attributes"]["statements"] > 0
+
+    response = await client.get(f"/nodes/{ROOT_ID}")
+    assert_response(response, 200)
+    # После остановки трассировки спаны не пишутся
+    assert len(path.read_text().splitlines()) == len(spans)
+
+
+def test_noop_span():
+    with span("noop", items=1) as current:
+        assert current is NOOP_SPAN
+        current.set_attribute("items", 2)
+
+
+def test_nested_spans():
+    exporter = InMemorySpanExporter()
+    start_tracing(exporter)
+    try:
+        with span("parent", items=3):
+            with span("child"):
+                pass
+    finally:
+        stop_tracing()
+
+    child, parent = exporter.get_finished_spans()
+    assert child.parent.span_id == parent.context.span_id and parent.parent is None
+    assert child.context.trace_id == parent.context.trace_id
+    assert parent.attributes["items"] == 3 and parent.resource.attributes["service.name"] == "analyzer"
+
+
+def test_make_exporter(tmp_path):
+    assert make_exporter(None, None) is None
+    assert isinstance(make_exporter("otlp", "http://collector:4318/v1/traces"), OTLPSpanExporter)
+    exporter = make_exporter("file", str(tmp_path / "spans.jsonl"))
+    assert isinstance(exporter, FileSpanExporter)
+    exporter.shutdown()
+    with pytest.raises(ValueError):
+        make_exporter("jaeger", None)
+    with pytest.raises(ValueError):
+        make_exporter("otlp", None)
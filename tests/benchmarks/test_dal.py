@@ -0,0 +1,35 @@
+import json
+
+import pytest
+from alembic.command import upgrade
+
+from benchmarks.common import compare, load_baseline, save_baseline
+from benchmarks.dal import run
+
+
+@pytest.mark.asyncio
+async def test_dal_benchmark(alembic_config, postgres, tmp_path):
+    upgrade(alembic_config, "head")
+    measurements = await run(postgres, depth=2, fanout=2, offers=2, batch_size=4, repeat=2)
+
+    results = measurements.summary()
+    assert {
+        "add_units",
+        "apply_updates",
+        "apply_updates:update",
+        "get_node",
+        "get_sales",
+        "get_node_statistic",
+        "delete_unit",
+    } <= set(results)
+    assert results["add_units"]["calls"] == 3 and results["get_node"]["statements_per_call"] >= 1
+
+    path = tmp_path / "baseline.json"
+    save_baseline(str(path), {"depth": 2}, results)
+    assert json.loads(path.read_text())["results"] == results
+
+    # Операция, выполняющая больше запросов к базе, — регрессия независимо от времени
+    baseline = load_baseline(str(path))
+    baseline["results"]["get_node"]["statements_per_call"] -= 1
+    _, regressions = compare(results, baseline, tolerance=100)
+    assert regressions == ["get_node"]
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from analyzer.db.core import SYNC_DATABASE_URL
+from benchmarks.scaling import (
+    REQUEST_MIX,
+    growth_exponent,
+    report,
+    run_level,
+    write_catalog,
+)
+
+
+def test_growth_exponent():
+    assert growth_exponent([10, 100, 1000], [1, 10, 100]) == pytest.approx(1)
+    assert growth_exponent([10, 100, 1000], [1, 100, 10000]) == pytest.approx(2)
+    assert growth_exponent([10], [1]) is None
+
+
+def test_upper_categories(tmp_path):
+    units_path, history_path = tmp_path / "units.ndjson", tmp_path / "history.ndjson"
+    sample = write_catalog(str(units_path), str(history_path), units=1000, fanout=3, offers=4, history=0)
+    units = {unit["id"]: unit for unit in map(json.loads, units_path.read_text().splitlines())}
+
+    def depth(id):
+        return 0 if units[id]["parentId"] is None else depth(units[id]["parentId"]) + 1
+
+    # Корень и два уровня под ним, а не только нижний уровень дерева
+    assert sorted(map(depth, sample.upper_categories)) == [0] + [1] * 3 + [2] * 9
+    assert depth(sample.categories[-1]) > 2
+
+
+def test_scaling_level():
+    level = run_level(SYNC_DATABASE_URL, units=100, fanout=3, offers=4, history_ratio=2, requests=2)
+    assert level["units"] == 100 and level["history"] == 200
+    assert set(level["endpoints"]) == set(REQUEST_MIX)
+    assert all(timings["p50_ms"] <= timings["p99_ms"] for timings in level["endpoints"].values())
+    assert "GET /sales" in report([level])